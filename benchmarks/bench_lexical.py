@@ -0,0 +1,106 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_pipeline import PREPROCESS_FIELDS  # noqa: E402
+from benchmarks.synthetic_logs import SyntheticLogGenerator  # noqa: E402
+from src.embedding_generator import (EmbeddingGenerator, DEFAULT_EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE,  # noqa: E402
+                                     LEXICAL_BATCH_SIZE, LEXICAL_FIT_ROWS)
+from src.lexical_embedding import LexicalEmbedder  # noqa: E402
+from src.preprocessor import preprocess_text  # noqa: E402
+
+DEFAULT_SIZES = [10000, 100000]
+DEFAULT_MINILM_ROWS = 2000
+
+
+def synthetic_texts(count, seed):
+    generator = SyntheticLogGenerator(random_state=seed)
+    return [preprocess_text(log, PREPROCESS_FIELDS) for log in generator.logs(count)]
+
+
+def batches(texts, batch_size):
+    for start in range(0, len(texts), batch_size):
+        yield texts[start:start + batch_size]
+
+
+def bench_lexical(texts):
+    # The same steps as the embed stage: fit on a strided sample of at most LEXICAL_FIT_ROWS rows, then embed
+    # every row, both in LEXICAL_BATCH_SIZE batches
+    start = time.perf_counter()
+    embedder = LexicalEmbedder()
+    construct_seconds = time.perf_counter() - start
+
+    stride = max(1, -(-len(texts) // LEXICAL_FIT_ROWS))
+    start = time.perf_counter()
+    for batch in batches(texts, LEXICAL_BATCH_SIZE):
+        embedder.partial_fit(batch[::stride])
+    embedder.finalize()
+    fit_seconds = time.perf_counter() - start
+    fit_rows = len(texts[::stride])
+
+    start = time.perf_counter()
+    for batch in batches(texts, LEXICAL_BATCH_SIZE):
+        embedder.transform(batch)
+    transform_seconds = time.perf_counter() - start
+
+    total_seconds = construct_seconds + fit_seconds + transform_seconds
+    return {
+        'construct_seconds': round(construct_seconds, 3),
+        'fit_rows': fit_rows,
+        'fit_seconds': round(fit_seconds, 3),
+        'fit_rows_per_s': round(fit_rows / fit_seconds),
+        'transform_seconds': round(transform_seconds, 3),
+        'transform_rows_per_s': round(len(texts) / transform_seconds),
+        'seconds': round(total_seconds, 3),
+        'rows_per_s': round(len(texts) / total_seconds),
+    }
+
+
+def bench_minilm(texts):
+    # Model loading is excluded, only embed_batch (sentence embedding plus sentiment) is timed
+    try:
+        generator = EmbeddingGenerator(DEFAULT_EMBEDDING_MODEL)
+    except ImportError as e:
+        return {'skipped': f"neural model unavailable: {e}"}
+    generator.embed_batch(texts[:EMBEDDING_BATCH_SIZE])  # Warm-up
+    start = time.perf_counter()
+    for batch in batches(texts, EMBEDDING_BATCH_SIZE):
+        generator.embed_batch(batch)
+    seconds = time.perf_counter() - start
+    return {'rows': len(texts), 'seconds': round(seconds, 3), 'rows_per_s': round(len(texts) / seconds)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the lexical embedding mode in rows/s against the "
+                                                 "default neural model.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--minilm-rows', type=int, default=DEFAULT_MINILM_ROWS,
+                        help="Rows embedded with the neural model, which takes minutes for large sizes")
+    parser.add_argument('--no-minilm', action='store_true', help="Skip the neural model")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    texts = synthetic_texts(max(args.sizes + [args.minilm_rows]), args.seed)
+    minilm = {'skipped': "--no-minilm"} if args.no_minilm else bench_minilm(texts[:args.minilm_rows])
+    print(json.dumps({'model': DEFAULT_EMBEDDING_MODEL, **minilm}), flush=True)
+
+    results = []
+    for n_logs in args.sizes:
+        result = {'n_logs': n_logs, **bench_lexical(texts[:n_logs])}
+        if 'rows_per_s' in minilm:
+            result['speedup_over_minilm'] = round(result['rows_per_s'] / minilm['rows_per_s'], 1)
+        results.append(result)
+        print(json.dumps(result), flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({'benchmark': 'lexical', 'minilm': minilm, 'results': results}, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_logs import (write_log_files, DEFAULT_TEMPLATES, DEFAULT_TEMPLATE_RATIO,  # noqa: E402
+                                       DEFAULT_DUPLICATE_RATIO)
+from src.db_manager import DatabaseManager  # noqa: E402
+from src.pipeline import run_stage  # noqa: E402
+from src.embedding_generator import EmbeddingGenerator, EMBEDDING_BATCH_SIZE  # noqa: E402
+from src.lexical_embedding import LEXICAL_MODEL_NAME  # noqa: E402
+from src.render_data import prepare_render_data  # noqa: E402
+from src.startup import read_tree_rows  # noqa: E402
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+PREPROCESS_FIELDS = ['method', 'full_path', 'headers', 'form_data']
+STUB_MODEL_NAME = 'benchmark/hashed-bag-of-words'
+# Output width of all-MiniLM-L6-v2
+STUB_DIM = 384
+# LOG_PAGE_SIZE of LogTreeModel, which cannot be imported without Qt
+TREE_PAGE_SIZE = 200
+
+
+class StubEmbeddingGenerator(EmbeddingGenerator):
+    # Stands in for the sentence-transformer without torch or a model download: the same batch size and vector
+    # width (plus the sentiment column), filled with hashed token counts. Everything around the model, batching,
+    # checkpoints and the database reads and writes, is the real code.
+    def __init__(self, **kwargs):
+        # The lexical name keeps the base class from loading a neural model
+        super().__init__(LEXICAL_MODEL_NAME, **kwargs)
+        self.model_name = STUB_MODEL_NAME
+        self.lexical = False
+        self.batch_size = EMBEDDING_BATCH_SIZE
+
+    def embed_batch(self, texts):
+        embeddings = np.zeros((len(texts), STUB_DIM + 1), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in text.split():
+                embeddings[row, zlib.crc32(token.encode('utf-8')) % STUB_DIM] += 1
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return embeddings / norms, [0] * len(texts)
+
+
+def build_tree(db_manager):
+    # The reads of LogTreeModel.refresh plus the first page of every cluster, as when all are expanded
+    clusters = read_tree_rows(db_manager)['clusters']
+    for cluster_id, _, _, _ in clusters:
+        db_manager.get_log_page(cluster_id, 0, TREE_PAGE_SIZE)
+    return len(clusters)
+
+
+def measure(stage, rows, function, trace_memory):
+    if trace_memory:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    result = {
+        'stage': stage,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed, 1) if elapsed > 0 else None,
+        # ru_maxrss only grows, so this is the peak up to and including the stage
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if trace_memory:
+        result['peak_traced_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+    print(json.dumps(result), file=sys.stderr, flush=True)
+    return result
+
+
+def run_case(n_logs, options, queue):
+    workdir = tempfile.mkdtemp(prefix='crystalize-bench-')
+    try:
+        started = time.perf_counter()
+        file_paths = write_log_files(os.path.join(workdir, 'logs'), n_logs, templates=options['templates'],
+                                     template_ratio=options['template_ratio'],
+                                     duplicate_ratio=options['duplicate_ratio'], random_state=options['seed'])
+        generate_seconds = time.perf_counter() - started
+
+        trace_memory = options['trace_memory']
+        if trace_memory:
+            tracemalloc.start()
+        db_manager = DatabaseManager(os.path.join(workdir, 'bench.db'))
+        db_manager.create_tables()
+
+        def embed():
+            if options['model'] == 'stub':
+                StubEmbeddingGenerator().generate(db_manager)
+            else:
+                run_stage(db_manager, 'embed', {'model_name': LEXICAL_MODEL_NAME, 'resume': False})
+
+        reduce_options = {'params': {'mode': options['reduce_mode'], 'max_iter': options['max_iter'],
+                                     'landmarks': options['landmarks']},
+                          'force': True}
+        cluster_options = {'algorithm': options['algorithm'], 'epsilon': options['eps'], 'min_samples': 5,
+                           'metric': 'euclidean', 'neighbor_backend': 'auto', 'n_clusters': options['n_clusters']}
+        stages = [
+            ('import', lambda: run_stage(db_manager, 'import', {'file_paths': file_paths})),
+            ('preprocess', lambda: run_stage(db_manager, 'preprocess', {'fields': PREPROCESS_FIELDS})),
+            ('embed', embed),
+            ('reduce', lambda: run_stage(db_manager, 'reduce', reduce_options)),
+            ('cluster', lambda: run_stage(db_manager, 'cluster', cluster_options)),
+            ('tree', lambda: build_tree(db_manager)),
+            ('render', lambda: prepare_render_data(db_manager)),
+        ]
+        results = [measure(stage, n_logs, function, trace_memory) for stage, function in stages]
+        db_manager.close()
+        if trace_memory:
+            tracemalloc.stop()
+
+        db_size = sum(os.path.getsize(os.path.join(workdir, name)) for name in os.listdir(workdir)
+                      if name.startswith('bench.db'))
+        queue.put({
+            'n_logs': n_logs,
+            'generate_seconds': round(generate_seconds, 3),
+            'db_size_mb': round(db_size / 2 ** 20, 1),
+            'stages': results,
+        })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(results, baseline):
+    # Adds the baseline time and relative change to every stage found in both runs
+    baseline_seconds = {(case['n_logs'], stage['stage']): stage['seconds']
+                        for case in baseline['results'] if 'stages' in case for stage in case['stages']}
+    for case in results:
+        for stage in case.get('stages', []):
+            previous = baseline_seconds.get((case['n_logs'], stage['stage']))
+            if previous:
+                stage['baseline_seconds'] = previous
+                stage['change'] = round(stage['seconds'] / previous - 1, 3)
+                print(f"{case['n_logs']:>9} {stage['stage']:<10} {stage['seconds']:>9.3f}s "
+                      f"vs {previous:>9.3f}s ({stage['change']:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic logs for time and "
+                                                 "memory.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--model', choices=['stub', 'lexical'], default='stub',
+                        help="stub: hashed bag of words shaped like MiniLM output; lexical: " + LEXICAL_MODEL_NAME)
+    parser.add_argument('--templates', type=int, default=DEFAULT_TEMPLATES)
+    parser.add_argument('--template-ratio', type=float, default=DEFAULT_TEMPLATE_RATIO)
+    parser.add_argument('--duplicate-ratio', type=float, default=DEFAULT_DUPLICATE_RATIO)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--reduce-mode', choices=['auto', 'pca', 'landmark'], default='auto')
+    parser.add_argument('--landmarks', type=int, default=20000)
+    parser.add_argument('--max-iter', type=int, default=1000)
+    parser.add_argument('--algorithm', choices=['dbscan', 'minibatch_kmeans'], default='minibatch_kmeans')
+    parser.add_argument('--eps', type=float, default=0.5)
+    parser.add_argument('--n-clusters', type=int, default=50)
+    parser.add_argument('--no-trace-memory', action='store_true',
+                        help="Skip tracemalloc, which slows Python-heavy stages; max RSS is still reported")
+    parser.add_argument('--baseline', help="Earlier --output file to compare the stage times against")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    options = {
+        'model': args.model,
+        'templates': args.templates,
+        'template_ratio': args.template_ratio,
+        'duplicate_ratio': args.duplicate_ratio,
+        'seed': args.seed,
+        'reduce_mode': args.reduce_mode,
+        'landmarks': args.landmarks,
+        'max_iter': args.max_iter,
+        'algorithm': args.algorithm,
+        'eps': args.eps,
+        'n_clusters': args.n_clusters,
+        'trace_memory': not args.no_trace_memory,
+    }
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for n_logs in args.sizes:
+        # Each size runs in a fresh process so peak RSS is not polluted by earlier cases
+        queue = context.Queue()
+        process = context.Process(target=run_case, args=(n_logs, options, queue))
+        process.start()
+        process.join()
+        result = queue.get() if process.exitcode == 0 else {'n_logs': n_logs,
+                                                            'error': f"exit code {process.exitcode}"}
+        results.append(result)
+        print(json.dumps(result), flush=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            compare(results, json.load(baseline_file))
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({'benchmark': 'pipeline', 'options': options, 'results': results}, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.projection import project, resolve_mode  # noqa: E402
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+DEFAULT_MODES = ['exact', 'pca', 'landmark']
+# Full t-SNE beyond these sizes takes hours or exhausts memory, those cases are recorded as skipped
+FULL_TSNE_LIMITS = {'exact': 20000, 'pca': 100000}
+
+
+def synthetic_embeddings(n_samples, dim, n_centers=40, random_state=0):
+    # Gaussian blobs roughly shaped like normalized sentence embeddings
+    rng = np.random.default_rng(random_state)
+    centers = rng.normal(size=(n_centers, dim)).astype(np.float32)
+    labels = rng.integers(0, n_centers, n_samples)
+    embeddings = np.empty((n_samples, dim), dtype=np.float32)
+    for start in range(0, n_samples, 65536):
+        stop = min(start + 65536, n_samples)
+        embeddings[start:stop] = centers[labels[start:stop]] + rng.normal(scale=0.6, size=(stop - start, dim))
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings
+
+
+def run_case(mode, n_samples, dim, params, queue):
+    embeddings = synthetic_embeddings(n_samples, dim)
+    case_params = dict(params, mode=mode)
+    tracemalloc.start()
+    start = time.perf_counter()
+    coordinates = project(embeddings, case_params)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    queue.put({
+        'mode': mode,
+        'n_samples': n_samples,
+        'seconds': round(elapsed, 3),
+        'peak_traced_mb': round(peak / 2 ** 20, 1),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'finite': bool(np.isfinite(coordinates).all()),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the projection modes for time and peak memory.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--modes', nargs='+', default=DEFAULT_MODES, choices=DEFAULT_MODES)
+    parser.add_argument('--dim', type=int, default=385)
+    parser.add_argument('--landmarks', type=int, default=20000)
+    parser.add_argument('--max-iter', type=int, default=1000)
+    parser.add_argument('--no-limits', action='store_true', help="Also run full t-SNE on very large inputs")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    params = {
+        'pca_components': 50,
+        'landmarks': args.landmarks,
+        'interpolation_neighbors': 10,
+        'perplexity': 30.0,
+        'max_iter': args.max_iter,
+        'init': 'pca',
+        'metric': 'euclidean',
+    }
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for n_samples in args.sizes:
+        for mode in args.modes:
+            limit = FULL_TSNE_LIMITS.get(resolve_mode(mode, n_samples, params['landmarks']))
+            if limit is not None and n_samples > limit and not args.no_limits:
+                result = {'mode': mode, 'n_samples': n_samples, 'skipped': f"full t-SNE above {limit} points"}
+            else:
+                # Each case runs in a fresh process so peak RSS is not polluted by earlier cases
+                queue = context.Queue()
+                process = context.Process(target=run_case, args=(mode, n_samples, args.dim, params, queue))
+                process.start()
+                process.join()
+                result = queue.get() if process.exitcode == 0 else {
+                    'mode': mode, 'n_samples': n_samples, 'error': f"exit code {process.exitcode}"}
+            results.append(result)
+            print(json.dumps(result), flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({'benchmark': 'projection', 'dim': args.dim, 'params': params, 'results': results},
+                      output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_pipeline import StubEmbeddingGenerator, PREPROCESS_FIELDS  # noqa: E402
+from benchmarks.synthetic_logs import write_log_files  # noqa: E402
+from src.db_manager import DatabaseManager  # noqa: E402
+from src.pipeline import run_stage  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# What main.py imports before the window can be shown; the Qt modules are only timed when PyQt6 is installed
+STARTUP_MODULES = ['src.db_manager', 'src.import_logic', 'src.embedding_generator', 'src.lexical_embedding',
+                   'src.clustering', 'src.reduction', 'src.projection', 'src.render_data', 'src.startup',
+                   'src.pipeline', 'src.instrumentation']
+QT_MODULES = ['src.workers', 'src.visualization', 'src.log_tree_model', 'main']
+# Packages that should only be loaded once a stage needs them
+HEAVY_MODULES = ['torch', 'transformers', 'sentence_transformers', 'sklearn', 'scipy']
+
+IMPORT_SCRIPT = '''
+import importlib, json, sys, time
+modules = json.loads(sys.argv[1])
+try:
+    import PyQt6.QtWidgets
+    modules += json.loads(sys.argv[2])
+except ImportError:
+    pass
+started = time.perf_counter()
+for module in modules:
+    importlib.import_module(module)
+seconds = time.perf_counter() - started
+print(json.dumps({'seconds': seconds, 'modules': modules,
+                  'heavy_loaded': [name for name in json.loads(sys.argv[3]) if name in sys.modules]}))
+'''
+
+SECTIONS_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+from src.db_manager import DatabaseManager
+from src.startup import iter_startup_sections
+db_manager = DatabaseManager(sys.argv[1])
+sections = []
+for section, value in iter_startup_sections(db_manager):
+    sections.append({'section': section, 'seconds': round(time.perf_counter() - started, 4)})
+print(json.dumps(sections))
+'''
+
+
+def run_script(script, *args):
+    # A fresh interpreter per measurement, so nothing is imported or cached from an earlier one
+    output = subprocess.run([sys.executable, '-c', script, *args], cwd=ROOT, check=True, capture_output=True,
+                            text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def build_database(path, n_logs, workdir):
+    # Every stage up to clustering, so startup has a tree and a projection to load
+    file_paths = write_log_files(os.path.join(workdir, 'logs'), n_logs)
+    db_manager = DatabaseManager(path)
+    db_manager.create_tables()
+    run_stage(db_manager, 'import', {'file_paths': file_paths})
+    run_stage(db_manager, 'preprocess', {'fields': PREPROCESS_FIELDS})
+    StubEmbeddingGenerator().generate(db_manager)
+    run_stage(db_manager, 'reduce', {'params': {'mode': 'landmark', 'landmarks': 2000, 'max_iter': 250},
+                                     'force': True})
+    run_stage(db_manager, 'cluster', {'algorithm': 'minibatch_kmeans', 'epsilon': 0.5, 'min_samples': 5,
+                                      'metric': 'euclidean', 'neighbor_backend': 'auto', 'n_clusters': 50})
+    db_manager.close()
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the startup of the GUI: the imports before the window "
+                                                 "is shown and the background load of the database summary.")
+    parser.add_argument('--db', help="Existing database to load; by default one is built from synthetic logs")
+    parser.add_argument('--logs', type=int, default=100000, help="Size of the synthetic database")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='crystalize-bench-')
+    try:
+        db_path = args.db
+        if db_path is None:
+            db_path = os.path.join(workdir, 'bench.db')
+            started = time.perf_counter()
+            build_database(db_path, args.logs, workdir)
+            print(json.dumps({'n_logs': args.logs, 'build_seconds': round(time.perf_counter() - started, 3)}),
+                  file=sys.stderr, flush=True)
+
+        imports = [run_script(IMPORT_SCRIPT, json.dumps(STARTUP_MODULES), json.dumps(QT_MODULES),
+                              json.dumps(HEAVY_MODULES)) for _ in range(args.repeat)]
+        loads = [run_script(SECTIONS_SCRIPT, db_path) for _ in range(args.repeat)]
+        result = {
+            'db': args.db,
+            'n_logs': None if args.db else args.logs,
+            'import_seconds': round(median([run['seconds'] for run in imports]), 4),
+            'imported_modules': imports[0]['modules'],
+            'heavy_loaded': imports[0]['heavy_loaded'],
+            # Seconds since the loader process started until each section was ready to show
+            'sections': [{'section': runs[0]['section'],
+                          'seconds': median([run['seconds'] for run in runs])} for runs in zip(*loads)],
+        }
+        print(json.dumps(result), flush=True)
+        if args.output:
+            with open(args.output, 'w') as output_file:
+                json.dump({'benchmark': 'startup', 'repeat': args.repeat, 'result': result}, output_file, indent=2)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
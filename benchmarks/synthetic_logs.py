@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import string
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Shaped after datasets/example.log: HTTP requests seen by a public web server, mostly scanner traffic
+METHODS = ['GET', 'POST', 'PRI', 'OPTIONS', 'HEAD', 'PUT']
+METHOD_WEIGHTS = [0.92, 0.046, 0.024, 0.005, 0.003, 0.002]
+# {n} is replaced by a number, {word} by a random word, per log
+PATH_PATTERNS = [
+    '/', '/cgi-bin/luci/;stok=/locale', '/static/styles/{word}.css', '/static/js/{word}.{n}.js', '*', '/.env',
+    '/.git/config', '/vpn/index.html', '/wp-login.php', '/wp-admin/{word}.php', '/xmlrpc.php',
+    '/api/v1/users/{n}', '/api/v1/{word}/{n}/items', '/images/{word}_{n}.png', '/debug/default/view',
+    '/admin/{word}', '/phpmyadmin/index.php', '/boaform/admin/formLogin', '/owa/auth/logon.aspx',
+    '/remote/fgt_lang', '/actuator/health', '/server-status', '/{word}.php', '/backup/{word}.zip',
+]
+QUERY_KEYS = ['panel', 'rest_route', 'XDEBUG_SESSION_START', 'lang', 'id', 'page', 'redirect', 't', 'q']
+USER_AGENTS = [
+    'Mozilla/5.0 (X11; Linux x86_64; rv:126.0) Gecko/20100101 Firefox/126.0',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0 Safari/537.36',
+    'Go-http-client/1.1',
+    'python-requests/2.31.0',
+    'curl/8.5.0',
+    'zgrab/0.x',
+    'Mozilla/5.0 (compatible; CensysInspect/1.1; +https://about.censys.io/)',
+]
+# The header sets that make up most of example.log
+HEADER_SETS = [
+    ['Host', 'User-Agent', 'Accept', 'Accept-Encoding'],
+    ['Host', 'User-Agent', 'Accept', 'Connection', 'Content-Length', 'Content-Type', 'Upgrade-Insecure-Requests'],
+    ['Host', 'User-Agent', 'Accept-Encoding', 'Connection'],
+    ['Host', 'User-Agent', 'Accept', 'Accept-Language', 'Accept-Encoding', 'Connection', 'Upgrade-Insecure-Requests',
+     'Sec-Fetch-Dest', 'Sec-Fetch-Mode', 'Sec-Fetch-Site', 'Sec-Fetch-User', 'Priority'],
+]
+HEADER_VALUES = {
+    'Host': 'example.com',
+    'Accept': '*/*',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Connection': 'keep-alive',
+    'Content-Type': 'application/x-www-form-urlencoded',
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'none',
+    'Sec-Fetch-User': '?1',
+    'Priority': 'u=1',
+}
+DEFAULT_TEMPLATES = 200
+DEFAULT_TEMPLATE_RATIO = 0.9
+DEFAULT_DUPLICATE_RATIO = 0.05
+# Duplicates repeat one of this many most recent logs verbatim, like a log shipper resending a batch
+DUPLICATE_WINDOW = 1000
+# Words filled into paths, query values and forms; a fixed vocabulary keeps tokens recurring as in real traffic
+VOCABULARY_SIZE = 5000
+LOGS_PER_FILE = 100000
+START_TIME = datetime(2024, 6, 13)
+
+
+class SyntheticLogGenerator:
+    # Deterministic stream of HTTP request logs with the fields of example.log. template_ratio of the new logs
+    # come from a pool of request templates (method, path, query keys, headers, body) whose variable parts
+    # (numbers, words, client ip, time) change per log; the rest are one-off requests with random paths.
+    # duplicate_ratio of all logs repeat a recent log verbatim.
+    def __init__(self, templates=DEFAULT_TEMPLATES, template_ratio=DEFAULT_TEMPLATE_RATIO,
+                 duplicate_ratio=DEFAULT_DUPLICATE_RATIO, random_state=0):
+        self.rng = np.random.default_rng(random_state)
+        letters = np.array(list(string.ascii_lowercase))
+        self.vocabulary = [''.join(self.rng.choice(letters, int(length)))
+                           for length in self.rng.integers(3, 10, VOCABULARY_SIZE)]
+        self.template_ratio = template_ratio
+        self.duplicate_ratio = duplicate_ratio
+        self.templates = [self.random_template(self.rng.choice(PATH_PATTERNS)) for _ in range(max(templates, 1))]
+        # Template popularity is long-tailed, a few templates make up most of the traffic
+        weights = np.cumsum(1.0 / np.arange(1, len(self.templates) + 1))
+        self.template_cdf = weights / weights[-1]
+        self.client_ips = [f"{a}.{b}.113.{c}" for a, b, c in self.rng.integers(1, 255, size=(500, 3))]
+        self.time = START_TIME
+        self.recent = []
+
+    def random_word(self):
+        return self.vocabulary[int(self.rng.integers(VOCABULARY_SIZE))]
+
+    def random_template(self, path_pattern):
+        method = str(self.rng.choice(METHODS, p=METHOD_WEIGHTS))
+        query_keys = list(self.rng.choice(QUERY_KEYS, int(self.rng.integers(0, 3)), replace=False))
+        return {
+            'method': method,
+            'path': str(path_pattern),
+            'query_keys': query_keys,
+            'headers': HEADER_SETS[int(self.rng.integers(len(HEADER_SETS)))],
+            'user_agent': USER_AGENTS[int(self.rng.integers(len(USER_AGENTS)))],
+            'form': method in ('POST', 'PUT') and self.rng.random() < 0.5,
+        }
+
+    def fill(self, pattern):
+        return pattern.replace('{n}', str(int(self.rng.integers(1, 10000)))).replace('{word}', self.random_word())
+
+    def render(self, template):
+        path = self.fill(template['path'])
+        query_params = {key: self.fill(self.rng.choice(['{n}', '{word}'])) for key in template['query_keys']}
+        full_path = path + '?' + '&'.join(f"{key}={value}" for key, value in query_params.items())
+        headers = {name: HEADER_VALUES.get(name, '') for name in template['headers']}
+        headers['User-Agent'] = template['user_agent']
+        form_data = None
+        if template['form']:
+            form_data = {'username': self.random_word(),
+                         'password': self.random_word() + str(int(self.rng.integers(100)))}
+        if 'Content-Length' in headers:
+            headers['Content-Length'] = str(len(json.dumps(form_data)) if form_data else 0)
+        self.time += timedelta(seconds=float(self.rng.exponential(2.0)))
+        return {
+            'method': template['method'],
+            'full_path': full_path,
+            'query_params': query_params,
+            'headers': headers,
+            'cookies': {},
+            'form_data': form_data,
+            'files': {},
+            'body': None,
+            'json': None,
+            'client_ip': self.client_ips[int(self.rng.integers(len(self.client_ips)))],
+            'timestamp': self.time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+
+    def next_log(self):
+        if self.recent and self.rng.random() < self.duplicate_ratio:
+            return dict(self.recent[int(self.rng.integers(len(self.recent)))])
+        if self.rng.random() < self.template_ratio:
+            template = self.templates[int(np.searchsorted(self.template_cdf, self.rng.random()))]
+        else:
+            segments = '/'.join(self.random_word() for _ in range(int(self.rng.integers(1, 4))))
+            template = self.random_template('/' + segments)
+        log = self.render(template)
+        self.recent.append(log)
+        if len(self.recent) > DUPLICATE_WINDOW:
+            self.recent.pop(0)
+        return log
+
+    def logs(self, count):
+        for _ in range(count):
+            yield self.next_log()
+
+
+def write_log_files(output_dir, count, logs_per_file=LOGS_PER_FILE, **generator_options):
+    # Writes count logs as .log files of up to logs_per_file lines (one JSON object per line) and returns
+    # their paths
+    os.makedirs(output_dir, exist_ok=True)
+    generator = SyntheticLogGenerator(**generator_options)
+    file_paths = []
+    for start in range(0, count, logs_per_file):
+        file_path = os.path.join(output_dir, f"synthetic_{len(file_paths):04d}.log")
+        with open(file_path, 'w') as log_file:
+            for log in generator.logs(min(logs_per_file, count - start)):
+                log_file.write(json.dumps(log) + "\n")
+        file_paths.append(file_path)
+    return file_paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic HTTP request logs shaped like example.log.")
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--output', required=True, help="Folder to write the .log files to")
+    parser.add_argument('--templates', type=int, default=DEFAULT_TEMPLATES)
+    parser.add_argument('--template-ratio', type=float, default=DEFAULT_TEMPLATE_RATIO)
+    parser.add_argument('--duplicate-ratio', type=float, default=DEFAULT_DUPLICATE_RATIO)
+    parser.add_argument('--logs-per-file', type=int, default=LOGS_PER_FILE)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    file_paths = write_log_files(args.output, args.count, args.logs_per_file, templates=args.templates,
+                                 template_ratio=args.template_ratio, duplicate_ratio=args.duplicate_ratio,
+                                 random_state=args.seed)
+    print(json.dumps({'count': args.count, 'files': file_paths}))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,11 @@
 CREATE TABLE IF NOT EXISTS clusters (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT NOT NULL,
-    color TEXT NOT NULL
+    color TEXT NOT NULL,
+    centroid BLOB,
+    radius REAL,
+    size INTEGER,
+    metric TEXT
 );
 
 -- Update the default cluster to include a color
@@ -21,5 +25,125 @@ CREATE TABLE IF NOT EXISTS logs (
     FOREIGN KEY (cluster_id) REFERENCES clusters(id)
 );
 
+-- Cluster membership lookups and per-cluster paging in the tree
+CREATE INDEX IF NOT EXISTS idx_logs_cluster ON logs(cluster_id, id);
+
+-- Time windows. logs.timestamp is the log's time in UTC as 'YYYY-MM-DD HH:MM:SS', parsed from raw_data at
+-- import, so a window is one range scan here instead of a pass over every log
+CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs(timestamp);
+
+-- Embedding jobs with checkpoints so interrupted runs can be resumed
+CREATE TABLE IF NOT EXISTS embedding_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model_name TEXT NOT NULL,
+    config_hash TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    last_processed_id INTEGER DEFAULT 0,
+    processed_count INTEGER DEFAULT 0,
+    total_count INTEGER DEFAULT 0,
+    embedding_dim INTEGER,
+    time_window TEXT,
+    -- Fitted model the job embeds with, e.g. the SVD basis of the lexical model
+    model_state BLOB,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Saved 3D projections, one per reduction parameter set. The active one is mirrored into logs.tsne_x/y/z
+CREATE TABLE IF NOT EXISTS projections (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    params_key TEXT NOT NULL UNIQUE,
+    params TEXT NOT NULL,
+    is_active INTEGER DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS projection_points (
+    projection_id INTEGER NOT NULL,
+    log_id INTEGER NOT NULL,
+    x REAL,
+    y REAL,
+    z REAL,
+    PRIMARY KEY (projection_id, log_id),
+    FOREIGN KEY (projection_id) REFERENCES projections(id)
+) WITHOUT ROWID;
+
+-- Persisted approximate nearest-neighbor index (quantizer and bucket layout), one per metric
+CREATE TABLE IF NOT EXISTS ann_indexes (
+    metric TEXT PRIMARY KEY,
+    embedding_fingerprint TEXT NOT NULL,
+    data BLOB NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- One row per clustering run. New logs embedded afterwards are assigned online against it
+CREATE TABLE IF NOT EXISTS clustering_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    algorithm TEXT NOT NULL,
+    params TEXT NOT NULL,
+    max_log_id INTEGER NOT NULL,
+    log_count INTEGER NOT NULL,
+    noise_count INTEGER NOT NULL,
+    last_assigned_id INTEGER NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- DBSCAN core points of the latest run: a new log within eps of one joins its cluster
+CREATE TABLE IF NOT EXISTS cluster_core_points (
+    log_id INTEGER PRIMARY KEY,
+    cluster_id INTEGER NOT NULL
+);
+
+-- Per-cluster summary computed after clustering, so clusters can be described without reading their logs
+CREATE TABLE IF NOT EXISTS cluster_summaries (
+    cluster_id INTEGER PRIMARY KEY,
+    size INTEGER NOT NULL,
+    medoid_log_id INTEGER,
+    centroid_log_id INTEGER,
+    exemplar_texts TEXT,
+    top_tokens TEXT,
+    field_histograms TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Full-text index over the preprocessed text and the text values of raw_data (nested ones included),
+-- rowid = logs.id
+CREATE VIRTUAL TABLE IF NOT EXISTS logs_fts USING fts5(preprocessed_text, raw_fields);
+
+-- Logs written since the full-text index was last synced. FTS5 flushes its buffer at every statement, so
+-- the triggers only queue ids and sync_search_index applies a whole import or preprocessing run at once.
+CREATE TABLE IF NOT EXISTS logs_fts_pending (
+    log_id INTEGER PRIMARY KEY
+);
+
+CREATE TRIGGER IF NOT EXISTS logs_fts_insert AFTER INSERT ON logs BEGIN
+    INSERT OR IGNORE INTO logs_fts_pending (log_id) VALUES (new.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS logs_fts_update AFTER UPDATE OF preprocessed_text, raw_data ON logs BEGIN
+    INSERT OR IGNORE INTO logs_fts_pending (log_id) VALUES (new.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS logs_fts_delete AFTER DELETE ON logs BEGIN
+    INSERT OR IGNORE INTO logs_fts_pending (log_id) VALUES (old.id);
+END;
+
+-- One row per pipeline stage execution. input_fingerprint covers the stage parameters and the outputs of the
+-- stages it reads; output_fingerprint is what it left in the database. run_pipeline skips a stage whose last
+-- completed run had the same inputs while its output is still in place.
+CREATE TABLE IF NOT EXISTS stage_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    stage TEXT NOT NULL,
+    params TEXT NOT NULL,
+    input_fingerprint TEXT NOT NULL,
+    output_fingerprint TEXT,
+    status TEXT NOT NULL DEFAULT 'running',  -- running, completed, failed or cancelled
+    result TEXT,
+    started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    finished_at DATETIME
+);
+
+CREATE INDEX IF NOT EXISTS idx_stage_runs_stage ON stage_runs(stage, status, input_fingerprint);
+
 -- Insert default cluster
 INSERT OR IGNORE INTO clusters (id, name) VALUES (-1, 'Noise');
\ No newline at end of file
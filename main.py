@@ -1,18 +1,45 @@
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QPushButton, QVBoxLayout, QWidget, QSplitter, QScrollArea,
-                             QFileDialog, QProgressBar, QLabel, QTreeWidget, QTreeWidgetItem, QHBoxLayout, QComboBox, QSpacerItem, QSizePolicy, QCheckBox, QMessageBox, QGridLayout)
-from PyQt6.QtCore import Qt, QSize
+                             QFileDialog, QProgressBar, QLabel, QTreeView, QHBoxLayout, QComboBox, QSpacerItem, QSizePolicy, QCheckBox, QMessageBox, QGridLayout,
+                             QDoubleSpinBox, QSpinBox, QFormLayout, QTableWidget, QTableWidgetItem, QAbstractItemView, QLineEdit, QMenu,
+                             QDateTimeEdit)
+from PyQt6.QtCore import Qt, QSize, QTimer, QDateTime
 from PyQt6.QtGui import QColor, QBrush, QFont, QFontDatabase, QPainter, QPen, QIcon
-from src.import_logic import ImportThread
 from src.db_manager import DatabaseManager
-from src.embedding_generator import EmbeddingGeneratorThread
-from src.clustering import ClusteringThread
+from src.import_logic import find_log_files
+from src.workers import (ImportThread, PreprocessThread, EmbeddingGeneratorThread, ReductionThread, PlacementThread,
+                         ClusteringThread, ClusterSweepThread, OnlineAssignmentThread, SimilaritySearchThread,
+                         PipelineThread, StartupThread, EmbeddingOptionsThread, RenderDataThread)
+from src.lexical_embedding import LEXICAL_MODEL_NAME
+from src.clustering import NEIGHBOR_BACKENDS, CLUSTERING_ALGORITHMS
+from src.reduction import reduction_params, describe_projection, DEFAULT_REDUCTION_PARAMS
+from src.projection import PROJECTION_MODES
 from src.visualization import Visualization3D
-from src.preprocessor import preprocess_logs
+from src.log_tree_model import LogTreeModel, LOG_ID_ROLE
+from src.startup import read_common_fields
+from src.instrumentation import TRACER, enable_from_environment
+from src.time_window import ALL_TIME, describe_window
 import sys
 import json
 import os
+import time
+import sqlite3
 import numpy as np
 
+# Qt format of the time window editors, the same text as logs.timestamp
+WINDOW_DATETIME_FORMAT = "yyyy-MM-dd HH:mm:ss"
+
+class NumericTableItem(QTableWidgetItem):
+    # Sorts by the raw value stored in UserRole rather than the formatted text
+    def __lt__(self, other):
+        value, other_value = self.data(Qt.ItemDataRole.UserRole), other.data(Qt.ItemDataRole.UserRole)
+        # NaN (no silhouette) sorts first
+        if value != value:
+            return other_value == other_value
+        if other_value != other_value:
+            return False
+        return value < other_value
+
+
 class ArrowLabel(QLabel):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -45,7 +72,8 @@ class MainWindow(QMainWindow):
 
         self.embedding_models = [
             'sentence-transformers/all-MiniLM-L6-v2',
-            'sentence-transformers/all-mpnet-base-v2'
+            'sentence-transformers/all-mpnet-base-v2',
+            LEXICAL_MODEL_NAME  # Fast non-neural mode for first-pass triage
         ]
 
         # Set the database path
@@ -91,24 +119,41 @@ class MainWindow(QMainWindow):
         self.visualization.setMinimumSize(300, 300)
         left_layout.addWidget(self.visualization, 1)  # Add stretch factor
         self.visualization.hide()  # Hide it initially
+        self.visualization.log_picked.connect(self.select_log_in_tree)
 
         # Create right panel
         right_widget = QWidget()
         right_layout = QVBoxLayout(right_widget)
 
+        # Full-text search over the logs, filters the tree and highlights hits in the 3D view
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Search logs, e.g. /cgi-bin/ or a user agent")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_box.textChanged.connect(lambda: self.search_timer.start(300))
+        self.search_box.returnPressed.connect(self.run_search)
+        right_layout.addWidget(self.search_box)
+
         # Add tree widget to a scroll area
         tree_scroll_area = QScrollArea()
-        self.tree_widget = QTreeWidget()
-        self.tree_widget.setHeaderLabels(["Clusters/Logs", "Visibility", "Details"])
-        self.tree_widget.setColumnWidth(0, 300)
-        tree_scroll_area.setWidget(self.tree_widget)
+        self.tree_view = QTreeView()
+        tree_scroll_area.setWidget(self.tree_view)
         tree_scroll_area.setWidgetResizable(True)
         right_layout.addWidget(tree_scroll_area)
 
-        # Add progress bar
+        # Add progress bar, with a Cancel button that stops the running stages at their next batch
+        progress_layout = QHBoxLayout()
         self.progress_bar = QProgressBar()
         self.progress_bar.setMinimumHeight(20)
-        right_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.progress_bar, 1)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_running_stages)
+        self.cancel_button.setEnabled(False)
+        progress_layout.addWidget(self.cancel_button)
+        right_layout.addLayout(progress_layout)
+        self.running_threads = []
 
         # Add widgets to splitter
         main_splitter.addWidget(left_widget)
@@ -123,22 +168,21 @@ class MainWindow(QMainWindow):
         self.db_manager = DatabaseManager('log_data.db')
         self.db_manager.create_tables()
 
-        # After setting up all UI components, but before populating the tree:
-        self.check_and_show_common_fields()
-
-        # Populate tree with existing data
-        self.populate_tree()
-
-        # Call this method to update the button text initially
-        self.update_preprocess_button_text()
-        self.update_generate_embeddings_button()
-
-        # Check for embeddings and start visualization if present
-        self.check_and_start_visualization()
+        # Tree backed by a lazily loaded model, log rows are paged in as clusters are expanded
+        self.tree_model = LogTreeModel(self.db_manager)
+        self.tree_view.setModel(self.tree_model)
+        self.tree_view.setColumnWidth(0, 300)
+        self.tree_model.visibility_changed.connect(self.visualization.set_cluster_visibility)
+        self.tree_view.selectionModel().selectionChanged.connect(self.on_tree_selection_changed)
+        self.tree_view.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.tree_view.customContextMenuRequested.connect(self.show_tree_context_menu)
+        # Loaded embeddings (and index) of the last similarity query, reused until the embeddings change
+        self.similarity_searcher = None
+        self.similarity_fingerprint = None
+
+        # Fields, tree, buttons and the 3D view are filled in by a background thread once the window is shown
+        self.start_startup_loader()
 
-        # Connect the tree widget's item selection changed signal
-        self.tree_widget.itemSelectionChanged.connect(self.on_tree_selection_changed)
-    
     def add_upper_controls(self, layout):
         # Add buttons
         button_layout = QHBoxLayout()
@@ -168,6 +212,9 @@ class MainWindow(QMainWindow):
         self.common_fields_layout = QVBoxLayout()
         layout.addLayout(self.common_fields_layout)
 
+        # Time window the stages below run on
+        layout.addLayout(self.create_time_window_section())
+
         # Add preprocessing section
         preprocessing_section = self.create_preprocessing_section()
         layout.addLayout(preprocessing_section)
@@ -191,28 +238,73 @@ class MainWindow(QMainWindow):
         # Add arrow label
         layout.addWidget(self.create_arrow_label())
 
-        self.perform_clustering_button = QPushButton("Perform Clustering")
-        self.perform_clustering_button.clicked.connect(self.perform_clustering)
-        self.perform_clustering_button.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
-        layout.addWidget(self.perform_clustering_button)
+        # Add dimensionality reduction section
+        layout.addLayout(self.create_reduction_section())
+
+        # Add arrow label
+        layout.addWidget(self.create_arrow_label())
+
+        # Add clustering section
+        layout.addLayout(self.create_clustering_section())
+
+        # Runs every stage with the settings above, skipping those whose inputs did not change
+        self.run_pipeline_button = QPushButton("Run Pipeline")
+        self.run_pipeline_button.clicked.connect(self.run_pipeline)
+        self.run_pipeline_button.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
+        layout.addWidget(self.run_pipeline_button)
+        self.pipeline_summary_label = QLabel("")
+        self.pipeline_summary_label.setWordWrap(True)
+        layout.addWidget(self.pipeline_summary_label)
+
+        layout.addLayout(self.create_performance_section())
 
         # Add stretch to push everything to the top
         layout.addStretch(1)
     
+    def start_startup_loader(self):
+        self.status_label.setText("Loading database...")
+        self.startup_state = None
+        self.startup_thread = StartupThread(self.db_manager.db_name)
+        self.startup_thread.section_loaded.connect(self.on_startup_section_loaded)
+        self.startup_thread.status_update.connect(self.update_status)
+        self.startup_thread.start()
+
+    def on_startup_section_loaded(self, section, value):
+        if section == 'fields':
+            if value:
+                self.add_common_fields_checkboxes(value)
+        elif section == 'tree':
+            if self.search_box.text().strip():
+                # Searched while loading, the search reads the tree itself
+                self.run_search()
+            else:
+                self.tree_model.set_rows(value)
+        elif section == 'state':
+            self.startup_state = value
+            self.update_time_range(value['time_range'])
+            self.update_preprocess_button_text(value['preprocessed'])
+            self.update_generate_embeddings_button(value['embedded'])
+            self.update_projection_dropdown(value['projections'])
+            if not value['embedded']:
+                self.status_label.setText("No embeddings found. Generate embeddings to see visualization.")
+        elif section == 'render':
+            if value is not None:
+                self.show_visualization(value)
+                self.status_label.setText("Visualization started automatically.")
+            elif self.startup_state['embedded']:
+                self.status_label.setText("No data available for visualization. Please generate embeddings and "
+                                          "perform clustering first.")
+            # Offer to resume an embedding job that was interrupted last time
+            self.check_for_interrupted_embedding_job(self.startup_state['interrupted_job'])
+
     def check_and_show_common_fields(self):
-        logs = self.db_manager.get_all_logs()
-        if logs:
-            # Get common fields from the first log (assuming all logs have the same structure)
-            raw_data = json.loads(logs[0][3])  # Assuming raw_data is in the fourth column
-            common_fields = list(raw_data.keys())
+        common_fields = read_common_fields(self.db_manager)
+        if common_fields:
             self.add_common_fields_checkboxes(common_fields)
 
     def check_for_existing_logs(self):
-        logs = self.db_manager.get_all_logs()
-        if logs:
-            # Get common fields from the first log (assuming all logs have the same structure)
-            raw_data = json.loads(logs[0][3])  # Assuming raw_data is in the fourth column
-            common_fields = list(raw_data.keys())
+        common_fields = read_common_fields(self.db_manager)
+        if common_fields:
             self.add_common_fields_checkboxes(common_fields)
             self.preprocess_button.show()  # Show the preprocess button
         else:
@@ -231,17 +323,68 @@ class MainWindow(QMainWindow):
     def open_folder(self):
         folder_path = QFileDialog.getExistingDirectory(self, "Open Log Folder")
         if folder_path:
-            file_paths = []
-            for root, dirs, files in os.walk(folder_path):
-                for file in files:
-                    if file.endswith('.log') or file.endswith('.json') or file.endswith('.jsonl'):
-                        file_paths.append(os.path.join(root, file))
-            
+            file_paths = find_log_files(folder_path)
             if file_paths:
                 self.import_logs(file_paths)
             else:
                 QMessageBox.warning(self, "No Files Found", "No suitable log files found in the selected folder.")
 
+    def create_time_window_section(self):
+        # Preprocessing, embedding, projection and clustering only read the logs whose timestamp falls in the
+        # window, so a day of a large database is analysed at the cost of that day
+        window_layout = QVBoxLayout()
+        header_layout = QHBoxLayout()
+        header_layout.addWidget(QLabel("Time Window (UTC):"))
+        self.all_time_checkbox = QCheckBox("All time")
+        self.all_time_checkbox.setChecked(True)
+        self.all_time_checkbox.toggled.connect(self.on_all_time_toggled)
+        header_layout.addWidget(self.all_time_checkbox)
+        window_layout.addLayout(header_layout)
+
+        form_layout = QFormLayout()
+        self.window_start_edit = QDateTimeEdit()
+        self.window_end_edit = QDateTimeEdit()
+        for editor in (self.window_start_edit, self.window_end_edit):
+            editor.setDisplayFormat(WINDOW_DATETIME_FORMAT)
+            editor.setCalendarPopup(True)
+            editor.setEnabled(False)
+        # The end is exclusive and kept after the start
+        self.window_start_edit.dateTimeChanged.connect(
+            lambda value: self.window_end_edit.setMinimumDateTime(value.addSecs(1)))
+        form_layout.addRow("From:", self.window_start_edit)
+        form_layout.addRow("Until:", self.window_end_edit)
+        window_layout.addLayout(form_layout)
+
+        self.time_range_label = QLabel("")
+        self.time_range_label.setWordWrap(True)
+        window_layout.addWidget(self.time_range_label)
+        return window_layout
+
+    def on_all_time_toggled(self, checked):
+        self.window_start_edit.setEnabled(not checked)
+        self.window_end_edit.setEnabled(not checked)
+
+    def update_time_range(self, time_range=None):
+        # Shows the logs' time range and moves the editors to it while no window is in use
+        if time_range is None:
+            time_range = self.db_manager.get_timestamp_range()
+        earliest, latest = time_range
+        if earliest is None:
+            self.time_range_label.setText("No log timestamps yet, they are read from the timestamp field of "
+                                          "each log.")
+            return
+        self.time_range_label.setText(f"Logs from {earliest} to {latest}")
+        if self.all_time_checkbox.isChecked():
+            self.window_start_edit.setDateTime(QDateTime.fromString(earliest, WINDOW_DATETIME_FORMAT))
+            self.window_end_edit.setDateTime(QDateTime.fromString(latest, WINDOW_DATETIME_FORMAT).addSecs(1))
+
+    def current_time_window(self):
+        # None for all time, otherwise {'start', 'end'} with the end exclusive
+        if self.all_time_checkbox.isChecked():
+            return None
+        return {'start': self.window_start_edit.dateTime().toString(WINDOW_DATETIME_FORMAT),
+                'end': self.window_end_edit.dateTime().toString(WINDOW_DATETIME_FORMAT)}
+
     def create_preprocessing_section(self):
         preprocessing_layout = QVBoxLayout()
         
@@ -256,8 +399,285 @@ class MainWindow(QMainWindow):
 
         return preprocessing_layout
     
-    def update_preprocess_button_text(self):
-        if self.db_manager.check_preprocessed_text_exists():
+    def create_reduction_section(self):
+        reduction_layout = QVBoxLayout()
+        reduction_layout.addWidget(QLabel("Dimensionality Reduction (t-SNE):"))
+
+        form_layout = QFormLayout()
+        # auto = PCA pre-reduction, switching to landmark t-SNE once there are more points than landmarks
+        self.projection_mode_dropdown = QComboBox()
+        self.projection_mode_dropdown.addItems(PROJECTION_MODES)
+        form_layout.addRow("Mode:", self.projection_mode_dropdown)
+
+        self.pca_components_spinbox = QSpinBox()
+        self.pca_components_spinbox.setRange(2, 512)
+        self.pca_components_spinbox.setValue(DEFAULT_REDUCTION_PARAMS['pca_components'])
+        form_layout.addRow("PCA components:", self.pca_components_spinbox)
+
+        self.landmarks_spinbox = QSpinBox()
+        self.landmarks_spinbox.setRange(1000, 200000)
+        self.landmarks_spinbox.setSingleStep(1000)
+        self.landmarks_spinbox.setValue(DEFAULT_REDUCTION_PARAMS['landmarks'])
+        form_layout.addRow("Landmarks:", self.landmarks_spinbox)
+
+        self.perplexity_spinbox = QDoubleSpinBox()
+        self.perplexity_spinbox.setRange(2.0, 200.0)
+        self.perplexity_spinbox.setValue(DEFAULT_REDUCTION_PARAMS['perplexity'])
+        form_layout.addRow("Perplexity:", self.perplexity_spinbox)
+
+        self.iterations_spinbox = QSpinBox()
+        self.iterations_spinbox.setRange(250, 10000)
+        self.iterations_spinbox.setSingleStep(250)
+        self.iterations_spinbox.setValue(DEFAULT_REDUCTION_PARAMS['max_iter'])
+        form_layout.addRow("Iterations:", self.iterations_spinbox)
+
+        self.init_dropdown = QComboBox()
+        self.init_dropdown.addItems(['pca', 'random'])
+        form_layout.addRow("Init:", self.init_dropdown)
+
+        self.metric_dropdown = QComboBox()
+        self.metric_dropdown.addItems(['euclidean', 'cosine', 'manhattan'])
+        form_layout.addRow("Metric:", self.metric_dropdown)
+        reduction_layout.addLayout(form_layout)
+
+        self.reduce_button = QPushButton("Compute Projection")
+        self.reduce_button.clicked.connect(self.perform_reduction)
+        self.reduce_button.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
+        reduction_layout.addWidget(self.reduce_button)
+
+        # Switching between saved projections only copies stored coordinates, no model inference
+        reduction_layout.addWidget(QLabel("Saved Projections:"))
+        self.projection_dropdown = QComboBox()
+        self.projection_dropdown.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
+        self.projection_dropdown.activated.connect(self.on_projection_selected)
+        reduction_layout.addWidget(self.projection_dropdown)
+
+        return reduction_layout
+
+    def create_clustering_section(self):
+        clustering_layout = QVBoxLayout()
+        clustering_layout.addWidget(QLabel("Clustering:"))
+
+        form_layout = QFormLayout()
+        # minibatch_kmeans streams embeddings from the database in chunks for datasets larger than memory
+        self.clustering_algorithm_dropdown = QComboBox()
+        self.clustering_algorithm_dropdown.addItems(CLUSTERING_ALGORITHMS)
+        self.clustering_algorithm_dropdown.currentTextChanged.connect(self.on_clustering_algorithm_changed)
+        form_layout.addRow("Algorithm:", self.clustering_algorithm_dropdown)
+
+        self.n_clusters_spinbox = QSpinBox()
+        self.n_clusters_spinbox.setRange(2, 10000)
+        self.n_clusters_spinbox.setValue(50)
+        self.n_clusters_spinbox.setEnabled(False)
+        form_layout.addRow("Clusters:", self.n_clusters_spinbox)
+
+        self.eps_spinbox = QDoubleSpinBox()
+        self.eps_spinbox.setDecimals(4)
+        self.eps_spinbox.setRange(0.0001, 100.0)
+        self.eps_spinbox.setSingleStep(0.05)
+        self.eps_spinbox.setValue(0.5)
+        form_layout.addRow("eps:", self.eps_spinbox)
+
+        self.min_samples_spinbox = QSpinBox()
+        self.min_samples_spinbox.setRange(1, 1000)
+        self.min_samples_spinbox.setValue(5)
+        form_layout.addRow("Min samples:", self.min_samples_spinbox)
+
+        self.cluster_metric_dropdown = QComboBox()
+        self.cluster_metric_dropdown.addItems(['euclidean', 'cosine'])
+        form_layout.addRow("Metric:", self.cluster_metric_dropdown)
+
+        # auto = exact neighbors for small datasets, the persisted ANN index for large ones
+        self.neighbor_backend_dropdown = QComboBox()
+        self.neighbor_backend_dropdown.addItems(NEIGHBOR_BACKENDS)
+        form_layout.addRow("Neighbors:", self.neighbor_backend_dropdown)
+        clustering_layout.addLayout(form_layout)
+
+        self.sweep_button = QPushButton("Sweep Parameters")
+        self.sweep_button.clicked.connect(self.perform_parameter_sweep)
+        self.sweep_button.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
+        clustering_layout.addWidget(self.sweep_button)
+
+        # Selecting a sweep row copies its eps / min samples into the fields above
+        self.sweep_table = QTableWidget(0, 5)
+        self.sweep_table.setHorizontalHeaderLabels(["eps", "Min samples", "Clusters", "Noise", "Silhouette"])
+        self.sweep_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.sweep_table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.sweep_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.sweep_table.verticalHeader().setVisible(False)
+        self.sweep_table.setSortingEnabled(True)
+        self.sweep_table.itemSelectionChanged.connect(self.on_sweep_row_selected)
+        self.sweep_table.hide()
+        clustering_layout.addWidget(self.sweep_table)
+
+        self.perform_clustering_button = QPushButton("Perform Clustering")
+        self.perform_clustering_button.clicked.connect(self.perform_clustering)
+        self.perform_clustering_button.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
+        clustering_layout.addWidget(self.perform_clustering_button)
+
+        return clustering_layout
+
+    def create_performance_section(self):
+        performance_layout = QVBoxLayout()
+        # $CRYSTALIZE_TRACE records from startup and writes the trace there on exit
+        self.trace_path = enable_from_environment()
+
+        self.trace_checkbox = QCheckBox("Record performance trace")
+        self.trace_checkbox.setChecked(TRACER.enabled)
+        self.trace_checkbox.toggled.connect(self.toggle_trace)
+        performance_layout.addWidget(self.trace_checkbox)
+
+        # Time, rows/s and batch size per span name, refreshed while recording
+        self.trace_table = QTableWidget(0, 6)
+        self.trace_table.setHorizontalHeaderLabels(["Span", "Calls", "Total s", "Max ms", "Rows/s", "Rows/call"])
+        self.trace_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.trace_table.verticalHeader().setVisible(False)
+        self.trace_table.setSortingEnabled(True)
+        self.trace_table.setVisible(TRACER.enabled)
+        performance_layout.addWidget(self.trace_table)
+        self.peak_rss_label = QLabel("")
+        performance_layout.addWidget(self.peak_rss_label)
+
+        self.export_trace_button = QPushButton("Export Trace...")
+        self.export_trace_button.clicked.connect(self.export_trace)
+        self.export_trace_button.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
+        self.export_trace_button.setEnabled(TRACER.enabled)
+        performance_layout.addWidget(self.export_trace_button)
+
+        self.trace_timer = QTimer(self)
+        self.trace_timer.timeout.connect(self.refresh_trace_summary)
+        if TRACER.enabled:
+            self.trace_timer.start(1000)
+        return performance_layout
+
+    def toggle_trace(self, enabled):
+        if enabled:
+            TRACER.enable()
+            self.trace_timer.start(1000)
+        else:
+            # The recorded spans stay available for export until the next recording starts
+            TRACER.disable()
+            self.trace_timer.stop()
+            self.refresh_trace_summary()
+        self.trace_table.setVisible(enabled or self.trace_table.rowCount() > 0)
+        self.export_trace_button.setEnabled(enabled or self.trace_table.rowCount() > 0)
+
+    def refresh_trace_summary(self):
+        TRACER.sample_memory()
+        summary = TRACER.summary()
+        self.trace_table.setSortingEnabled(False)
+        self.trace_table.setRowCount(len(summary))
+        for row, span_row in enumerate(summary):
+            rate, batch = span_row['rows_per_second'], span_row['rows_per_call']
+            values = [span_row['calls'], span_row['seconds'], span_row['max_ms'],
+                      rate if rate is not None else float('nan'), batch if batch is not None else float('nan')]
+            labels = [str(span_row['calls']), f"{span_row['seconds']:.3f}", f"{span_row['max_ms']:.1f}",
+                      f"{rate:,.0f}" if rate is not None else "-", f"{batch:,.0f}" if batch is not None else "-"]
+            self.trace_table.setItem(row, 0, QTableWidgetItem(span_row['name']))
+            for column, (value, label) in enumerate(zip(values, labels), start=1):
+                item = NumericTableItem(label)
+                item.setData(Qt.ItemDataRole.UserRole, value)
+                self.trace_table.setItem(row, column, item)
+        self.trace_table.setSortingEnabled(True)
+        self.trace_table.resizeColumnsToContents()
+        peak_rss = TRACER.peak_rss_mb()
+        self.peak_rss_label.setText(f"Peak RSS: {peak_rss:.0f} MB" if peak_rss is not None else "")
+
+    def export_trace(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Trace", "crystalize-trace.json",
+                                                   "Chrome Trace (*.json);;All Files (*)")
+        if file_path:
+            TRACER.sample_memory()
+            TRACER.export_chrome_trace(file_path)
+            self.status_label.setText(f"Trace written to {file_path}, open it in ui.perfetto.dev")
+
+    def on_clustering_algorithm_changed(self, algorithm):
+        is_dbscan = algorithm == 'dbscan'
+        self.n_clusters_spinbox.setEnabled(not is_dbscan)
+        for widget in (self.eps_spinbox, self.min_samples_spinbox, self.neighbor_backend_dropdown, self.sweep_button):
+            widget.setEnabled(is_dbscan)
+
+    def current_reduction_params(self):
+        return reduction_params(mode=self.projection_mode_dropdown.currentText(),
+                                pca_components=self.pca_components_spinbox.value(),
+                                landmarks=self.landmarks_spinbox.value(),
+                                perplexity=self.perplexity_spinbox.value(),
+                                max_iter=self.iterations_spinbox.value(),
+                                init=self.init_dropdown.currentText(),
+                                metric=self.metric_dropdown.currentText())
+
+    def perform_reduction(self):
+        if not self.db_manager.check_embeddings_exist():
+            QMessageBox.warning(self, "No Embeddings", "Please generate embeddings first.")
+            return
+        self.reduction_thread = ReductionThread(self.db_manager.db_name, self.current_reduction_params(),
+                                                window=self.current_time_window())
+        self.reduction_thread.progress_update.connect(self.update_progress)
+        self.reduction_thread.status_update.connect(self.update_status)
+        self.reduction_thread.finished.connect(lambda: self.on_reduction_finished(self.reduction_thread))
+        self.reduce_button.setEnabled(False)
+        self.track_stage_thread(self.reduction_thread)
+        self.reduction_thread.start()
+
+    def place_new_logs(self):
+        if self.assignment_thread.failed():
+            return
+        self.placement_thread = PlacementThread(self.db_manager.db_name)
+        self.placement_thread.progress_update.connect(self.update_progress)
+        self.placement_thread.status_update.connect(self.update_status)
+        self.placement_thread.finished.connect(lambda: self.on_reduction_finished(self.placement_thread))
+        self.reduce_button.setEnabled(False)
+        self.track_stage_thread(self.placement_thread)
+        self.placement_thread.start()
+
+    def on_reduction_finished(self, thread):
+        self.reduce_button.setEnabled(True)
+        if thread.failed():
+            return
+        self.update_projection_dropdown()
+        self.show_visualization()
+
+    def update_projection_dropdown(self, projections=None):
+        if projections is None:
+            projections = self.db_manager.get_projections()
+        self.projection_dropdown.clear()
+        for projection_id, params, is_active, created_at, point_count in projections:
+            label = f"{describe_projection(json.loads(params))} ({point_count} points)"
+            self.projection_dropdown.addItem(label, projection_id)
+            if is_active:
+                self.projection_dropdown.setCurrentIndex(self.projection_dropdown.count() - 1)
+
+    def on_projection_selected(self, index):
+        projection_id = self.projection_dropdown.itemData(index)
+        if projection_id is None or projection_id == self.db_manager.get_active_projection_id():
+            return
+        self.status_label.setText("Switching projection...")
+        self.load_visualization(projection_id)
+
+    def load_visualization(self, projection_id=None):
+        # Activating a projection and reading the render data take seconds on large databases
+        self.projection_dropdown.setEnabled(False)
+        # Loads can overlap, e.g. a clustering finishing while a projection switch reads; the latest one is shown
+        render_thread = self.render_thread = RenderDataThread(self.db_manager.db_name, projection_id)
+        render_thread.status_update.connect(self.update_status)
+        render_thread.finished.connect(lambda: self.on_render_data_loaded(render_thread))
+        self.track_stage_thread(render_thread)
+        render_thread.start()
+
+    def on_render_data_loaded(self, thread):
+        if thread is not self.render_thread:
+            return
+        self.projection_dropdown.setEnabled(True)
+        if thread.failed():
+            # The dropdown may show a projection that was not activated
+            self.update_projection_dropdown()
+            return
+        self.display_visualization(thread.result)
+
+    def update_preprocess_button_text(self, preprocessed=None):
+        if preprocessed is None:
+            preprocessed = self.db_manager.check_preprocessed_text_exists()
+        if preprocessed:
             self.preprocess_button.setText("Re-Preprocess Data")
         else:
             self.preprocess_button.setText("Preprocess Data")
@@ -268,8 +688,10 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "No Fields Selected", "Please select at least one field for preprocessing.")
             return
 
+        window = self.current_time_window()
+        scope = f" of the logs {describe_window(window)}" if window else ""
         reply = QMessageBox.question(self, 'Confirm Preprocessing',
-                                    "This will overwrite any existing preprocessed data. Continue?",
+                                    f"This will overwrite any existing preprocessed data{scope}. Continue?",
                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
                                     QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.No:
@@ -277,15 +699,19 @@ class MainWindow(QMainWindow):
 
         self.status_label.setText("Preprocessing data...")
         self.progress_bar.setValue(0)
-
-        # Get all logs from the database
-        logs = self.db_manager.get_all_logs()
-
-        # Call the preprocess_logs function
-        preprocess_logs(logs, selected_fields, self.db_manager, self.update_progress, self.update_status)
-
-        self.status_label.setText("Preprocessing completed!")
-        self.progress_bar.setValue(100)
+        self.preprocess_thread = PreprocessThread(self.db_manager.db_name, selected_fields, window)
+        self.preprocess_thread.progress_update.connect(self.update_progress)
+        self.preprocess_thread.status_update.connect(self.update_status)
+        self.preprocess_thread.finished.connect(self.on_preprocessing_finished)
+        self.preprocess_button.setEnabled(False)
+        self.track_stage_thread(self.preprocess_thread)
+        self.preprocess_thread.start()
+
+    def on_preprocessing_finished(self):
+        self.preprocess_button.setEnabled(True)
+        if not self.preprocess_thread.failed():
+            self.status_label.setText("Preprocessing completed!")
+            self.progress_bar.setValue(100)
         self.update_preprocess_button_text()
 
 
@@ -295,6 +721,7 @@ class MainWindow(QMainWindow):
         self.import_thread.status_update.connect(self.update_status)
         self.import_thread.common_fields_found.connect(self.add_common_fields_checkboxes)
         self.import_thread.finished.connect(self.on_import_finished)
+        self.track_stage_thread(self.import_thread)
         self.import_thread.start()
     
     def add_common_fields_section(self, layout):
@@ -330,26 +757,173 @@ class MainWindow(QMainWindow):
             self.preprocess_button.show()
         
     def on_import_finished(self):
+        # Files imported before a failure stay in the database
         self.populate_tree()
+        self.update_time_range()
+        if self.import_thread.failed():
+            return
         self.preprocess_button.show()  # Show the preprocess button after import
 
+    def perform_parameter_sweep(self):
+        if not self.db_manager.check_embeddings_exist():
+            QMessageBox.warning(self, "No Embeddings", "Please generate embeddings first.")
+            return
+        self.sweep_thread = ClusterSweepThread(self.db_manager.db_name,
+                                               metric=self.cluster_metric_dropdown.currentText(),
+                                               neighbor_backend=self.neighbor_backend_dropdown.currentText(),
+                                               window=self.current_time_window())
+        self.sweep_thread.progress_update.connect(self.update_progress)
+        self.sweep_thread.status_update.connect(self.update_status)
+        self.sweep_thread.sweep_ready.connect(self.on_sweep_ready)
+        self.sweep_thread.finished.connect(lambda: self.sweep_button.setEnabled(True))
+        self.sweep_button.setEnabled(False)
+        self.track_stage_thread(self.sweep_thread)
+        self.sweep_thread.start()
+
+    def on_sweep_ready(self, results, knee):
+        self.sweep_table.setSortingEnabled(False)
+        self.sweep_table.setRowCount(len(results))
+        for row, result in enumerate(results):
+            silhouette = result['silhouette']
+            values = [result['eps'], result['min_samples'], result['n_clusters'], result['noise_ratio'],
+                      silhouette if silhouette is not None else float('nan')]
+            labels = [f"{result['eps']:.4g}", str(result['min_samples']), str(result['n_clusters']),
+                      f"{result['noise_ratio']:.1%}", f"{silhouette:.3f}" if silhouette is not None else "-"]
+            for column, (value, label) in enumerate(zip(values, labels)):
+                item = NumericTableItem(label)
+                item.setData(Qt.ItemDataRole.UserRole, value)
+                self.sweep_table.setItem(row, column, item)
+        self.sweep_table.setSortingEnabled(True)
+        self.sweep_table.resizeColumnsToContents()
+        self.sweep_table.show()
+        self.eps_spinbox.setToolTip(f"k-distance knee: {knee:.4g}")
+
+    def on_sweep_row_selected(self):
+        rows = self.sweep_table.selectionModel().selectedRows()
+        if not rows:
+            return
+        row = rows[0].row()
+        self.eps_spinbox.setValue(self.sweep_table.item(row, 0).data(Qt.ItemDataRole.UserRole))
+        self.min_samples_spinbox.setValue(self.sweep_table.item(row, 1).data(Qt.ItemDataRole.UserRole))
+
+    def run_pipeline(self):
+        # The button doubles as cancel while the pipeline runs; it stops after the current stage
+        if getattr(self, 'pipeline_thread', None) is not None and self.pipeline_thread.isRunning():
+            self.pipeline_thread.cancel()
+            self.run_pipeline_button.setEnabled(False)
+            self.status_label.setText("Cancelling the pipeline after the current stage...")
+            return
+        options = {'embed': {'model_name': self.model_dropdown.currentText()},
+                   'reduce': {'params': self.current_reduction_params()},
+                   'cluster': self.current_clustering_options()}
+        # Without checked fields the last preprocessing run's fields are used
+        selected_fields = [checkbox.text() for checkbox in self.common_fields_checkboxes if checkbox.isChecked()]
+        if selected_fields:
+            options['preprocess'] = {'fields': selected_fields}
+        self.pipeline_summary_label.setText("")
+        # All time is passed explicitly, otherwise stages without options would keep their last window
+        self.pipeline_thread = PipelineThread(self.db_manager.db_name, options,
+                                              window=self.current_time_window() or ALL_TIME)
+        self.pipeline_thread.progress_update.connect(self.update_progress)
+        self.pipeline_thread.status_update.connect(self.update_status)
+        self.pipeline_thread.pipeline_finished.connect(self.on_pipeline_finished)
+        self.pipeline_thread.finished.connect(self.on_pipeline_thread_finished)
+        self.run_pipeline_button.setText("Cancel Pipeline")
+        self.track_stage_thread(self.pipeline_thread)
+        self.pipeline_thread.start()
+
+    def on_pipeline_finished(self, reports):
+        lines = []
+        for report in reports:
+            if report['action'] == 'reused':
+                lines.append(f"{report['stage']}: reused output of {report['finished_at']}")
+            elif report['action'] == 'ran':
+                lines.append(f"{report['stage']}: ran in {report['seconds']:.1f} s")
+            else:
+                lines.append(f"{report['stage']}: skipped")
+        self.pipeline_summary_label.setText("\n".join(lines))
+
+    def on_pipeline_thread_finished(self):
+        self.run_pipeline_button.setText("Run Pipeline")
+        self.run_pipeline_button.setEnabled(True)
+        self.update_preprocess_button_text()
+        self.update_generate_embeddings_button()
+        self.update_projection_dropdown()
+        self.populate_tree()
+        self.show_visualization()
+
     def update_progress(self, value):
         self.progress_bar.setValue(value)
 
     def update_status(self, message):
         self.status_label.setText(message)
 
-    def update_generate_embeddings_button(self):
-        embeddings_exist = self.db_manager.check_embeddings_exist()
+    def update_generate_embeddings_button(self, embeddings_exist=None):
+        if embeddings_exist is None:
+            embeddings_exist = self.db_manager.check_embeddings_exist()
         if embeddings_exist:
             self.generate_embeddings_button.setText("Re-generate Embeddings")
         else:
             self.generate_embeddings_button.setText("Generate Embeddings")
 
     def generate_embeddings(self):
-        embeddings_exist = self.db_manager.check_embeddings_exist()
-        
-        if embeddings_exist:
+        # Interrupted jobs and new logs are looked up on a worker thread, the questions follow in
+        # on_embedding_options_ready
+        self.embedding_options_thread = EmbeddingOptionsThread(self.db_manager.db_name,
+                                                               self.model_dropdown.currentText(),
+                                                               window=self.current_time_window())
+        self.embedding_options_thread.status_update.connect(self.update_status)
+        self.embedding_options_thread.options_ready.connect(self.on_embedding_options_ready)
+        self.embedding_options_thread.finished.connect(self.on_embedding_options_finished)
+        self.generate_embeddings_button.setEnabled(False)
+        self.status_label.setText("Checking for interrupted jobs and new logs...")
+        self.track_stage_thread(self.embedding_options_thread)
+        self.embedding_options_thread.start()
+
+    def on_embedding_options_finished(self):
+        if self.embedding_options_thread.failed():
+            self.generate_embeddings_button.setEnabled(True)
+
+    def on_embedding_options_ready(self, options):
+        self.generate_embeddings_button.setEnabled(True)
+        selected_model = options['model_name']
+        window = options['window']
+        job = options['job']
+        if job is not None:
+            reply = QMessageBox.question(self, 'Resume Embedding',
+                                         f"An interrupted embedding job with this model stopped after "
+                                         f"{job['processed_count']} of {job['total_count']} logs. "
+                                         "Resume from the last checkpoint?\n\n"
+                                         "Choose No to start over and overwrite existing embeddings.",
+                                         QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No |
+                                         QMessageBox.StandardButton.Cancel,
+                                         QMessageBox.StandardButton.Yes)
+            if reply == QMessageBox.StandardButton.Cancel:
+                return
+            if reply == QMessageBox.StandardButton.Yes:
+                self.start_embedding_generation(selected_model, resume=True, only_missing=job['only_missing'],
+                                                window=window)
+            else:
+                self.start_embedding_generation(selected_model, resume=False, window=window)
+            return
+
+        embeddings_exist = options['embeddings_exist']
+        # New logs embedded with the same model can be added without touching the existing layout
+        new_logs = options['new_logs']
+        if new_logs and options['can_add_new_logs']:
+            reply = QMessageBox.question(self, 'New Logs',
+                                         f"{new_logs} logs have no embedding yet. Embed only these and place "
+                                         "them into the existing layout?\n\n"
+                                         "Choose No to re-generate all embeddings.",
+                                         QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No |
+                                         QMessageBox.StandardButton.Cancel,
+                                         QMessageBox.StandardButton.Yes)
+            if reply == QMessageBox.StandardButton.Cancel:
+                return
+            if reply == QMessageBox.StandardButton.Yes:
+                self.start_embedding_generation(selected_model, resume=False, only_missing=True, window=window)
+                return
+        elif embeddings_exist:
             reply = QMessageBox.question(self, 'Warning',
                                          "Existing embeddings will be overwritten. Are you sure you want to continue?",
                                          QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
@@ -357,24 +931,79 @@ class MainWindow(QMainWindow):
             if reply == QMessageBox.StandardButton.No:
                 return
 
-        selected_model = self.model_dropdown.currentText()
-        self.embedding_thread = EmbeddingGeneratorThread(self.db_manager.db_name, selected_model)
+        self.start_embedding_generation(selected_model, resume=False, window=window)
+
+    def start_embedding_generation(self, model_name, resume, only_missing=False, window=None):
+        self.embedding_thread = EmbeddingGeneratorThread(self.db_manager.db_name, model_name, resume=resume,
+                                                         only_missing=only_missing, window=window)
         self.embedding_thread.progress_update.connect(self.update_progress)
         self.embedding_thread.status_update.connect(self.update_status)
         self.embedding_thread.finished.connect(self.on_embedding_generation_finished)
+        self.generate_embeddings_button.setEnabled(False)
+        self.track_stage_thread(self.embedding_thread)
         self.embedding_thread.start()
 
+    def check_for_interrupted_embedding_job(self, job):
+        if job is None:
+            return
+        reply = QMessageBox.question(self, 'Resume Embedding',
+                                     f"The last embedding job ({job['model_name']}) was interrupted after "
+                                     f"{job['processed_count']} of {job['total_count']} logs. Resume it now?",
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                                     QMessageBox.StandardButton.Yes)
+        if reply == QMessageBox.StandardButton.Yes:
+            index = self.model_dropdown.findText(job['model_name'])
+            if index == -1:
+                self.model_dropdown.addItem(job['model_name'])
+                index = self.model_dropdown.count() - 1
+            self.model_dropdown.setCurrentIndex(index)
+            # only_missing was read with the startup state, see read_pipeline_state
+            self.start_embedding_generation(job['model_name'], resume=True, only_missing=job['only_missing'],
+                                            window=job['window'])
+
     def on_embedding_generation_finished(self):
+        self.generate_embeddings_button.setEnabled(True)
+        if self.embedding_thread.failed():
+            self.update_generate_embeddings_button()
+            return
         self.status_label.setText("Embedding generation completed!")
         self.populate_tree()  # Refresh the tree view
         self.update_generate_embeddings_button()  # Update button text
-        self.show_visualization()  # Automatically show visualization
+        self.update_projection_dropdown()
+        if self.embedding_thread.only_missing:
+            self.assign_new_logs()  # Join existing clusters first, then add the new points to the layout
+        else:
+            self.perform_reduction()  # Project the new embeddings for the visualization
+
+    def assign_new_logs(self):
+        self.assignment_thread = OnlineAssignmentThread(self.db_manager.db_name)
+        self.assignment_thread.progress_update.connect(self.update_progress)
+        self.assignment_thread.status_update.connect(self.update_status)
+        self.assignment_thread.recluster_recommended.connect(self.on_recluster_recommended)
+        self.assignment_thread.finished.connect(self.place_new_logs)
+        self.track_stage_thread(self.assignment_thread)
+        self.assignment_thread.start()
+
+    def on_recluster_recommended(self, reason):
+        self.perform_clustering_button.setText("Perform Clustering (recommended)")
+        self.perform_clustering_button.setToolTip(f"A full recluster is recommended: {reason}.")
+        self.status_label.setText(f"Recluster recommended: {reason}.")
+
+    def current_clustering_options(self):
+        return {'algorithm': self.clustering_algorithm_dropdown.currentText(),
+                'epsilon': self.eps_spinbox.value(),
+                'min_samples': self.min_samples_spinbox.value(),
+                'metric': self.cluster_metric_dropdown.currentText(),
+                'neighbor_backend': self.neighbor_backend_dropdown.currentText(),
+                'n_clusters': self.n_clusters_spinbox.value(),
+                'window': self.current_time_window()}
 
     def perform_clustering(self):
-        self.clustering_thread = ClusteringThread(self.db_manager.db_name)
+        self.clustering_thread = ClusteringThread(self.db_manager.db_name, **self.current_clustering_options())
         self.clustering_thread.progress_update.connect(self.update_progress)
         self.clustering_thread.status_update.connect(self.update_status)
-        self.clustering_thread.finished.connect(self.on_clustering_finished)
+        self.clustering_thread.clustering_finished.connect(self.on_clustering_finished)
+        self.track_stage_thread(self.clustering_thread)
         self.clustering_thread.start()
 
     def update_progress(self, value):
@@ -385,6 +1014,8 @@ class MainWindow(QMainWindow):
 
     def on_clustering_finished(self):
         self.status_label.setText("Clustering completed!")
+        self.perform_clustering_button.setText("Perform Clustering")
+        self.perform_clustering_button.setToolTip("")
         self.populate_tree()  # Refresh the tree view
         self.show_visualization()  # Automatically show visualization
 
@@ -400,25 +1031,24 @@ class MainWindow(QMainWindow):
             self.visualization.hide()
             self.status_label.setText("Database cleared and UI reset.")
             self.update_preprocess_button_text()
-            self.update_generate_embeddings_button()    
+            self.update_generate_embeddings_button()
+            self.update_projection_dropdown()
+            self.update_time_range()
+
+    def show_visualization(self, data=None):
+        # data is the result of prepare_render_data when it was already read, e.g. by the startup loader;
+        # otherwise it is read in a RenderDataThread
+        if data is None:
+            self.load_visualization()
+            return
+        self.display_visualization(data)
 
-    def show_visualization(self):
-        logs = self.db_manager.get_all_logs_with_coordinates()
-        
-        if not logs:
+    def display_visualization(self, data):
+        if data is None:
             self.status_label.setText("No data available for visualization. Please generate embeddings and perform clustering first.")
             return
 
-        points = [(log[2], log[3], log[4]) for log in logs]  # tsne_x, tsne_y, tsne_z
-        clusters = [log[1] for log in logs]  # cluster_id
-        
-        # Get color map
-        color_map = {}
-        for cluster in self.db_manager.get_clusters():
-            cluster_id, _, color = cluster
-            color_map[cluster_id] = color
-        
-        self.visualization.set_data(self.db_manager)
+        self.visualization.set_data(self.db_manager, data)
         self.visualization.show()
         self.status_label.setText("Visualization updated successfully.")
 
@@ -452,119 +1082,86 @@ class MainWindow(QMainWindow):
         return embeddings_standardized, cluster_ids, color_map
 
     def populate_tree(self):
-        self.tree_widget.clear()
-        self.tree_widget.setHeaderLabels(["Clusters/Logs", "Visibility", "Details"])
-        clusters = self.db_manager.get_cluster_log_counts()
-        
-        # Set a larger base font size
-        base_font = QFont()
-        base_font.setPointSize(11)  # Adjust this value as needed
-        self.tree_widget.setFont(base_font)
-        
-        # Set white text color
-        white_text = QColor(255, 255, 255)  # Pure white
-        
-        # Determine common fields
-        all_logs = self.db_manager.get_all_logs()
-        if all_logs:
-            first_log = json.loads(all_logs[0][3])  # Assuming raw_data is in index 3
-            common_fields = list(first_log.keys())[:3]  # Get the first 3 fields
-        else:
-            common_fields = []
-        
-        for cluster_id, cluster_name, cluster_color, log_count in clusters:
-            cluster_item = QTreeWidgetItem(self.tree_widget)
-            
-            # Create less saturated background color
-            bg_color = QColor(cluster_color)
-            bg_color.setAlpha(80)  # Increase opacity to 80% for better contrast with white text
-            
-            if cluster_id == -1:
-                cluster_text = f"Noise Cluster: {log_count} logs"
-                cluster_item.setData(0, Qt.ItemDataRole.UserRole, None)
-            else:
-                cluster_text = f"Cluster{cluster_id}: {log_count} logs)"
-                cluster_item.setData(0, Qt.ItemDataRole.UserRole, cluster_id)
-            
-            cluster_item.setText(0, cluster_text)
-            cluster_item.setExpanded(False)
-
-            # Set background color and white text color
-            for column in range(3):
-                cluster_item.setBackground(column, QBrush(bg_color))
-                cluster_item.setForeground(column, QBrush(white_text))
-
-            # Set bold and larger font for cluster items
-            font = QFont(base_font)
-            font.setBold(True)
-            font.setPointSize(base_font.pointSize() + 1)  # Make cluster font slightly larger
-            cluster_item.setFont(0, font)
-
-            # Create and set visibility checkbox
-            checkbox_widget = self.create_visibility_checkbox(cluster_id)
-            self.tree_widget.setItemWidget(cluster_item, 1, checkbox_widget)
-
-            if log_count > 0:
-                logs = self.db_manager.get_logs_in_cluster(cluster_id)
-                for log in logs:
-                    log_item = QTreeWidgetItem(cluster_item)
-                    log_item.setText(0, f"Log {log[0]}")  # Assuming log[0] is the log ID
-
-                    # Use a slightly darker shade of the cluster color for log items
-                    log_bg_color = bg_color.darker(110)
-                    for column in range(3):
-                        log_item.setBackground(column, QBrush(log_bg_color))
-                        log_item.setForeground(column, QBrush(white_text))
-
-                    # Parse the raw_data JSON
-                    raw_data = log[3]  # Assuming raw_data is in index 3
-                    content = json.loads(raw_data)
-
-                    # Add summary of log details to the "Details" column
-                    details = []
-                    for field in common_fields:
-                        value = content.get(field, 'N/A')
-                        # Truncate long values
-                        if isinstance(value, str) and len(value) > 30:
-                            value = value[:27] + "..."
-                        details.append(str(value))
-                    summary = " | ".join(details)
-                    log_item.setText(2, summary)
-
-                    # Add child items for each detail in the content
-                    for key, value in content.items():
-                        self.add_detail_item(log_item, key, value)
-
-        # Connect the tree widget's item selection changed signal
-        self.tree_widget.itemSelectionChanged.connect(self.on_tree_selection_changed)
-
-    def add_detail_item(self, parent, key, value):
-        item = QTreeWidgetItem(parent)
-        item.setText(0, key)
-        
-        # Inherit background color from parent and set white text
-        white_text = QColor(255, 255, 255)  # Pure white
-        for column in range(3):
-            item.setBackground(column, parent.background(column))
-            item.setForeground(column, QBrush(white_text))
-
-        if key == "Raw Data":
-            try:
-                parsed_value = json.loads(value)
-                item.setText(2, json.dumps(parsed_value, indent=2))
-            except json.JSONDecodeError:
-                item.setText(2, str(value))
+        # Only cluster rows are loaded here, logs and their fields are read when expanded
+        if self.search_box.text().strip():
+            # Rerun the search so logs added since are included
+            self.run_search()
         else:
-            if len(str(value)) > 100:
-                item.setText(2, str(value)[:100] + "...")
-            else:
-                item.setText(2, str(value))
+            self.tree_model.refresh()
+
+    def run_search(self):
+        self.search_timer.stop()
+        text = self.search_box.text().strip()
+        if not text:
+            self.tree_model.set_search_active(False)
+            self.visualization.set_highlighted_logs(None)
+            self.status_label.setText("Search cleared.")
+            return
+        started = time.perf_counter()
+        try:
+            hits = self.db_manager.search_logs(text)
+        except sqlite3.Error as e:
+            self.status_label.setText(f"Search failed: {e}")
+            return
+        elapsed = (time.perf_counter() - started) * 1000
+        self.tree_model.set_search_active(True)
+        self.visualization.set_highlighted_logs(hits)
+        self.status_label.setText(f"{len(hits)} logs match \"{text}\" ({elapsed:.0f} ms)")
+
+    def show_tree_context_menu(self, position):
+        index = self.tree_view.indexAt(position)
+        log_id = index.data(LOG_ID_ROLE) if index.isValid() else None
+        if log_id is None:
+            return
+        menu = QMenu(self)
+        metric = self.cluster_metric_dropdown.currentText()
+        find_action = menu.addAction(f"Find similar logs ({metric})")
+        find_action.setEnabled(getattr(self, 'similarity_thread', None) is None
+                               or not self.similarity_thread.isRunning())
+        if menu.exec(self.tree_view.viewport().mapToGlobal(position)) == find_action:
+            self.find_similar_logs(log_id, metric)
+
+    def find_similar_logs(self, log_id, metric):
+        self.status_label.setText(f"Finding logs similar to log {log_id}...")
+        self.similarity_thread = SimilaritySearchThread(self.db_manager.db_name, log_id, metric,
+                                                        searcher=self.similarity_searcher,
+                                                        fingerprint=self.similarity_fingerprint)
+        self.similarity_thread.status_update.connect(self.update_status)
+        self.similarity_thread.results_ready.connect(self.show_similar_logs)
+        self.similarity_thread.finished.connect(self.on_similarity_search_finished)
+        self.track_stage_thread(self.similarity_thread)
+        self.similarity_thread.start()
+
+    def on_similarity_search_finished(self):
+        self.similarity_searcher = self.similarity_thread.searcher
+        self.similarity_fingerprint = self.similarity_thread.fingerprint
+
+    def show_similar_logs(self, log_id, log_ids, distances, elapsed):
+        # The query log and its neighbours replace any text search in the tree and the 3D highlight
+        hits = np.append(log_ids, log_id)
+        self.search_box.blockSignals(True)
+        self.search_box.clear()
+        self.search_box.blockSignals(False)
+        self.db_manager.set_search_hits(hits)
+        self.tree_model.set_search_active(True)
+        self.visualization.set_highlighted_logs(hits)
+        self.visualization.set_picked_log(log_id)
+        searcher = self.similarity_thread.searcher
+        method = "exact" if searcher.exact else "index"
+        nearest = f", nearest {distances[0]:.3f}" if len(distances) else ""
+        self.status_label.setText(f"{len(log_ids)} logs most similar to log {log_id} by {searcher.metric} distance "
+                                  f"({method}, {elapsed:.1f} ms{nearest}). Press Enter in the search box to clear.")
 
     def on_tree_selection_changed(self):
-        selected_items = self.tree_widget.selectedItems()
-        if selected_items:
-            item = selected_items[0]
-            cluster_id = item.data(0, Qt.ItemDataRole.UserRole)
+        selected_rows = self.tree_view.selectionModel().selectedRows()
+        if selected_rows:
+            index = selected_rows[0]
+            log_id = index.data(LOG_ID_ROLE)
+            self.visualization.set_picked_log(log_id)
+            if log_id is not None:
+                # A log selects its cluster in the 3D view
+                index = index.parent()
+            cluster_id = index.data(Qt.ItemDataRole.UserRole)
             if cluster_id is not None and cluster_id != -1:
                 self.visualization.set_selected_cluster(cluster_id)
             else:
@@ -572,34 +1169,44 @@ class MainWindow(QMainWindow):
         else:
             self.visualization.set_selected_cluster(None)
     
-    def create_visibility_checkbox(self, cluster_id):
-        checkbox = QCheckBox("Visible")
-        checkbox.setChecked(True)
-        checkbox.stateChanged.connect(lambda state, cid=cluster_id: self.toggle_cluster_visibility(cid, state))
-        return checkbox
-    
-    def check_and_start_visualization(self):
-        if self.db_manager.check_embeddings_exist():
-            self.show_visualization()
-            self.status_label.setText("Visualization started automatically.")
-        else:
-            self.status_label.setText("No embeddings found. Generate embeddings to see visualization.")
-
-    def toggle_cluster_visibility(self, cluster_id, state):
-        is_visible = state == Qt.CheckState.Checked.value
-        self.visualization.set_cluster_visibility(cluster_id, is_visible)
-
-    def add_detail_item(self, parent, key, value):
-        item = QTreeWidgetItem(parent)
-        item.setText(0, key)
-        if key in ["Query Params", "Headers", "Cookies", "Form Data", "Files", "JSON"]:
-            try:
-                parsed_value = json.loads(value)
-                item.setText(2, json.dumps(parsed_value, indent=2))
-            except json.JSONDecodeError:
-                item.setText(2, str(value))
-        else:
-            item.setText(2, str(value))
+    def select_log_in_tree(self, log_id, cluster_id):
+        # A point picked in the 3D view: expand its cluster and select the log row
+        index = self.tree_model.log_index(log_id, cluster_id)
+        if not index.isValid():
+            self.status_label.setText(f"Log {log_id} is not in the tree, refresh it to show new logs.")
+            return
+        self.tree_view.expand(index.parent())
+        self.tree_view.setCurrentIndex(index)
+        self.tree_view.scrollTo(index)
+        self.status_label.setText(f"Selected log {log_id}")
+
+    def track_stage_thread(self, thread):
+        self.running_threads.append(thread)
+        thread.finished.connect(lambda: self.on_stage_thread_done(thread))
+        self.cancel_button.setEnabled(True)
+
+    def on_stage_thread_done(self, thread):
+        self.running_threads.remove(thread)
+        self.cancel_button.setEnabled(bool(self.running_threads))
+
+    def cancel_running_stages(self):
+        for thread in self.running_threads:
+            thread.cancel()
+        self.cancel_button.setEnabled(False)
+        self.status_label.setText("Cancelling...")
+
+    def closeEvent(self, event):
+        # SQLite reads cannot be interrupted, the startup loader is waited for
+        if self.startup_thread.isRunning():
+            self.startup_thread.wait()
+        # Stop running stages at their next batch boundary; an embedding job resumes from its checkpoint next start
+        for thread in list(self.running_threads):
+            thread.cancel()
+            thread.wait()
+        if self.trace_path:
+            TRACER.sample_memory()
+            TRACER.export_chrome_trace(self.trace_path)
+        super().closeEvent(event)
 
 def load_custom_font():
     font_path = os.path.join('fonts', 'MesloLGS NF Regular.ttf')
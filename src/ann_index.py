@@ -0,0 +1,237 @@
+import hashlib
+import io
+import numpy as np
+
+ANN_AUTO_THRESHOLD = 50000
+KMEANS_SAMPLE_PER_LIST = 64
+MAX_LISTS = 4096
+BLOCK_ROWS = 4096
+# Buckets holding more than this many times the average bucket size are split by a k-means of their own
+LIST_SPLIT_FACTOR = 4
+
+
+class IVFIndex:
+    # Inverted-file index: vectors are bucketed by their nearest k-means centroid and searches only
+    # scan the buckets whose centroids are close to the query. Cosine distance is handled by
+    # normalizing the vectors and searching with euclidean distance, since |a - b|^2 = 2 * (1 - cos).
+    # Only the quantizer and the bucket layout are persisted; vectors are reloaded from the database.
+    def __init__(self, metric='cosine', n_lists=None, n_probe=16, random_state=42):
+        if metric not in ('cosine', 'euclidean'):
+            raise ValueError(f"Unsupported metric: {metric}")
+        self.metric = metric
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.random_state = random_state
+        self.centroids = None
+        self.list_offsets = None
+        self.order = None
+        self.ids = None
+        self.vectors = None
+        self.squared_norms = None
+        self.radii = None
+
+    def prepare(self, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.metric == 'cosine':
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            vectors = vectors / norms
+        return vectors
+
+    def to_euclidean(self, distance):
+        return np.sqrt(2.0 * distance) if self.metric == 'cosine' else distance
+
+    def from_euclidean(self, distance):
+        return distance ** 2 / 2.0 if self.metric == 'cosine' else distance
+
+    def build(self, ids, vectors):
+        from sklearn.cluster import MiniBatchKMeans
+        vectors = self.prepare(vectors)
+        n_lists = self.n_lists or int(np.clip(np.sqrt(len(vectors)), 1, MAX_LISTS))
+        n_lists = min(n_lists, len(vectors))
+        rng = np.random.default_rng(self.random_state)
+        sample_size = min(len(vectors), max(n_lists * KMEANS_SAMPLE_PER_LIST, 10000))
+        sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, n_init=1, init='random', batch_size=4096,
+                                 random_state=self.random_state).fit(sample)
+        self.centroids = kmeans.cluster_centers_.astype(np.float32)
+        assignments = self.split_large_lists(vectors, self.nearest_lists(vectors, 1)[:, 0], rng)
+        self.set_layout(np.asarray(ids, dtype=np.int64), vectors, assignments)
+        return self
+
+    def split_large_lists(self, vectors, assignments, rng):
+        # Mini-batch k-means on tightly clustered data leaves a few buckets with a large share of the
+        # vectors, and every query probing them scans all of it. Those buckets get sub-centroids.
+        sizes = np.bincount(assignments, minlength=len(self.centroids))
+        average = len(vectors) / len(self.centroids)
+        large = np.flatnonzero(sizes > max(LIST_SPLIT_FACTOR * average, KMEANS_SAMPLE_PER_LIST))
+        if len(large) == 0:
+            return assignments
+        from sklearn.cluster import MiniBatchKMeans
+        centroids = [self.centroids]
+        for list_id in large:
+            members = np.flatnonzero(assignments == list_id)
+            parts = int(np.ceil(sizes[list_id] / average))
+            sample = vectors[np.sort(rng.choice(members, min(len(members), parts * KMEANS_SAMPLE_PER_LIST),
+                                                replace=False))]
+            split = MiniBatchKMeans(n_clusters=parts, n_init=1, init='random', batch_size=4096,
+                                    random_state=self.random_state).fit(sample).cluster_centers_
+            self.centroids[list_id] = split[0]
+            centroids.append(split[1:].astype(np.float32))
+        self.centroids = np.vstack(centroids)
+        return self.nearest_lists(vectors, 1)[:, 0]
+
+    def set_layout(self, ids, vectors, assignments):
+        self.order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=len(self.centroids))
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.attach(ids, vectors)
+
+    def attach(self, ids, vectors):
+        # Vectors (in the caller's order) are kept sorted by bucket so every bucket is one slice
+        self.ids = np.asarray(ids, dtype=np.int64)[self.order]
+        self.vectors = vectors[self.order]
+        # Squared norms let a search score a bucket with one matrix-vector product
+        self.squared_norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+        self.radii = np.zeros(len(self.centroids), dtype=np.float32)
+        for list_id in range(len(self.centroids)):
+            bucket = self.bucket(list_id)
+            # Blocks bound the temporary difference arrays of large buckets
+            for start in range(bucket.start, bucket.stop, BLOCK_ROWS * 16):
+                block = self.vectors[start:min(start + BLOCK_ROWS * 16, bucket.stop)]
+                self.radii[list_id] = max(self.radii[list_id],
+                                          np.linalg.norm(block - self.centroids[list_id], axis=1).max())
+
+    def nearest_lists(self, vectors, n_probe):
+        n_probe = min(n_probe, len(self.centroids))
+        centroid_norms = (self.centroids ** 2).sum(axis=1)
+        result = np.empty((len(vectors), n_probe), dtype=np.int64)
+        for start in range(0, len(vectors), BLOCK_ROWS):
+            block = vectors[start:start + BLOCK_ROWS]
+            scores = centroid_norms[None, :] - 2 * block @ self.centroids.T
+            nearest = np.argpartition(scores, n_probe - 1, axis=1)[:, :n_probe]
+            order = np.argsort(np.take_along_axis(scores, nearest, axis=1), axis=1)
+            result[start:start + BLOCK_ROWS] = np.take_along_axis(nearest, order, axis=1)
+        return result
+
+    def bucket(self, list_id):
+        return slice(self.list_offsets[list_id], self.list_offsets[list_id + 1])
+
+    @staticmethod
+    def block_distances(queries, candidates):
+        squared = ((queries ** 2).sum(axis=1)[:, None] + (candidates ** 2).sum(axis=1)[None, :]
+                   - 2 * queries @ candidates.T)
+        return np.sqrt(np.maximum(squared, 0))
+
+    def radius_neighbors_graph(self, radius, max_probe=None, progress=None):
+        # Sparse n x n graph (rows/columns in the order passed to build) holding the distance of
+        # every pair within `radius`. A bucket pair is only scanned when the centroid distance minus
+        # both bucket radii can be within the radius (exact pruning); at most max_probe buckets are
+        # scanned per bucket, which makes the graph approximate for very wide radii.
+        max_probe = max_probe or self.n_probe
+        euclidean_radius = self.to_euclidean(radius)
+        n_lists = len(self.centroids)
+        centroid_distances = self.block_distances(self.centroids, self.centroids)
+        lower_bounds = centroid_distances - self.radii[:, None] - self.radii[None, :]
+        rows, cols, values = [], [], []
+        for list_a in range(n_lists):
+            slice_a = self.bucket(list_a)
+            if slice_a.start == slice_a.stop:
+                continue
+            candidates = np.flatnonzero(lower_bounds[list_a] <= euclidean_radius)
+            if len(candidates) > max_probe:
+                candidates = candidates[np.argsort(centroid_distances[list_a, candidates])[:max_probe]]
+            for list_b in candidates:
+                slice_b = self.bucket(list_b)
+                # Blocks bound memory when k-means leaves some buckets much larger than others
+                for query_start in range(slice_a.start, slice_a.stop, BLOCK_ROWS):
+                    queries = self.vectors[query_start:min(query_start + BLOCK_ROWS, slice_a.stop)]
+                    for candidate_start in range(slice_b.start, slice_b.stop, BLOCK_ROWS):
+                        block = self.vectors[candidate_start:min(candidate_start + BLOCK_ROWS, slice_b.stop)]
+                        distances = self.block_distances(queries, block)
+                        query_index, candidate_index = np.nonzero(distances <= euclidean_radius)
+                        rows.append(query_index + query_start)
+                        cols.append(candidate_index + candidate_start)
+                        values.append(distances[query_index, candidate_index])
+            if progress is not None:
+                progress((list_a + 1) / n_lists)
+
+        n = len(self.vectors)
+        if rows:
+            rows, cols, values = np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+        else:
+            rows, cols, values = np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float32)
+        # Keep exact duplicates as explicit entries: sparse consumers drop stored zeros
+        values = np.maximum(self.from_euclidean(values), 1e-12).astype(np.float64)
+        # Map from bucket order back to the caller's order
+        from scipy import sparse
+        graph = sparse.csr_matrix((values, (self.order[rows], self.order[cols])), shape=(n, n))
+        # Make the graph symmetric when pruning kept a pair in one direction only
+        return graph.maximum(graph.T).tocsr()
+
+    def search(self, queries, k=10, n_probe=None):
+        # Approximate top-k: returns (distances, ids), nearest first. Buckets are scored in place as
+        # |v|^2 - 2 v.q, without copying their vectors.
+        queries = self.prepare(np.atleast_2d(queries))
+        probes = self.nearest_lists(queries, n_probe or self.n_probe)
+        all_distances = np.full((len(queries), k), np.inf, dtype=np.float64)
+        all_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for query_index, query in enumerate(queries):
+            buckets = [self.bucket(list_id) for list_id in probes[query_index]]
+            buckets = [bucket for bucket in buckets if bucket.start < bucket.stop]
+            if not buckets:
+                continue
+            scores = np.concatenate([self.squared_norms[bucket] - 2 * (self.vectors[bucket] @ query)
+                                     for bucket in buckets])
+            positions = np.concatenate([np.arange(bucket.start, bucket.stop) for bucket in buckets])
+            top = min(k, len(positions))
+            nearest = np.argpartition(scores, top - 1)[:top]
+            nearest = nearest[np.argsort(scores[nearest])]
+            distances = np.sqrt(np.maximum(scores[nearest] + float(query @ query), 0))
+            all_distances[query_index, :top] = self.from_euclidean(distances)
+            all_ids[query_index, :top] = self.ids[positions[nearest]]
+        return all_distances, all_ids
+
+    def to_bytes(self):
+        # Bucket layout stored as ids in bucket order, so it survives reloading vectors by id
+        buffer = io.BytesIO()
+        np.savez(buffer, centroids=self.centroids, list_offsets=self.list_offsets, ids=self.ids,
+                 metric=np.array(self.metric), n_probe=np.array(self.n_probe))
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data, ids, vectors):
+        # ids/vectors come from DatabaseManager.load_embeddings (sorted by id)
+        stored = np.load(io.BytesIO(data))
+        if not np.array_equal(np.sort(stored['ids']), ids):
+            raise ValueError("The stored index was built over other embeddings.")
+        index = cls(metric=str(stored['metric']), n_probe=int(stored['n_probe']))
+        index.centroids = stored['centroids']
+        index.list_offsets = stored['list_offsets']
+        index.order = np.searchsorted(ids, stored['ids'])
+        index.attach(ids, index.prepare(vectors))
+        return index
+
+
+def index_fingerprint(db_manager, ids):
+    # The embeddings and the exact id set the index covers: a stage on a time window loads a subset of the
+    # embeddings, and an index over other ids would map them to the wrong rows
+    ids_hash = hashlib.sha256(np.ascontiguousarray(ids, dtype=np.int64).tobytes()).hexdigest()[:16]
+    return f"{db_manager.get_embedding_fingerprint()}:{len(ids)}:{ids_hash}"
+
+
+def load_or_build_index(db_manager, ids, vectors, metric='cosine', status=None):
+    # ids must be sorted, as returned by DatabaseManager.load_embeddings
+    status = status or (lambda message: None)
+    fingerprint = index_fingerprint(db_manager, ids)
+    stored = db_manager.load_ann_index(metric)
+    if stored is not None and stored[0] == fingerprint:
+        status("Loading saved nearest-neighbor index...")
+        try:
+            return IVFIndex.from_bytes(stored[1], ids, vectors)
+        except ValueError:
+            pass
+    status(f"Building nearest-neighbor index over {len(ids)} embeddings...")
+    index = IVFIndex(metric=metric).build(ids, vectors)
+    db_manager.save_ann_index(metric, fingerprint, index.to_bytes())
+    return index
@@ -0,0 +1,21 @@
+import threading
+
+
+class OperationCancelled(Exception):
+    pass
+
+
+class CancellationToken:
+    # Cooperative cancellation: workers poll the token between batches and stop cleanly
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def is_cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise OperationCancelled()
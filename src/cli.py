@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+import traceback
+
+from .db_manager import DatabaseManager
+from .cancellation import CancellationToken, OperationCancelled
+from .pipeline import PipelineError, STAGES, CANCELLABLE_STAGES, run_stage, run_pipeline
+from .import_logic import find_log_files
+from .instrumentation import TRACER, TRACE_ENV_VAR, enable_from_environment
+from .embedding_generator import DEFAULT_EMBEDDING_MODEL
+from .reduction import DEFAULT_REDUCTION_PARAMS
+from .projection import PROJECTION_MODES
+from .clustering import NEIGHBOR_BACKENDS, CLUSTERING_ALGORITHMS
+from .time_window import ALL_TIME
+
+# Headless pipeline runner, e.g. for cron:
+#   python -m src.cli --db log_data.db import datasets/
+#   python -m src.cli --db log_data.db preprocess --fields method full_path headers
+#   python -m src.cli --db log_data.db embed --model crystalize/lexical-hashing-svd
+#   python -m src.cli --db log_data.db reduce --mode auto
+#   python -m src.cli --db log_data.db cluster --algorithm minibatch_kmeans --n-clusters 40
+#   python -m src.cli --db log_data.db run --files datasets/  # only stages whose inputs changed
+#   python -m src.cli --db log_data.db run --since 2024-06-13 --until 2024-06-14  # one day's logs only
+# Every line on stdout is one JSON event (status, progress, finished or error), anything else goes to stderr.
+
+EXIT_OK = 0
+EXIT_FAILED = 1  # The stage could not run, e.g. missing input
+EXIT_USAGE = 2  # Bad arguments (argparse)
+EXIT_ERROR = 3  # Unexpected exception, traceback on stderr
+EXIT_CANCELLED = 130
+
+
+class JsonEventWriter:
+    def __init__(self, stream, stage):
+        self.stream = stream
+        self.stage = stage
+        self.last_percent = None
+
+    def emit(self, event, **fields):
+        record = {'time': round(time.time(), 3), 'stage': self.stage, 'event': event}
+        record.update(fields)
+        self.stream.write(json.dumps(record, default=str) + "\n")
+        self.stream.flush()
+
+    def progress(self, percent):
+        # Repeated values are dropped
+        if percent != self.last_percent:
+            self.last_percent = percent
+            self.emit('progress', percent=percent)
+
+    def status(self, message):
+        self.emit('status', message=message)
+
+
+def add_window_arguments(parser):
+    parser.add_argument('--since', help="Only logs at or after this time (UTC), e.g. 2024-06-13 or "
+                                        "2024-06-13T08:00:00")
+    parser.add_argument('--until', help="Only logs before this time (UTC)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m src.cli",
+                                     description="Run Crystalize pipeline stages without the GUI.")
+    parser.add_argument('--db', default='log_data.db', help="SQLite database path (default: log_data.db)")
+    parser.add_argument('--trace', help="Record spans and counters and write them as a Chrome/Perfetto trace to "
+                                        f"this file (default: ${TRACE_ENV_VAR} if set)")
+    stages = parser.add_subparsers(dest='stage', required=True)
+
+    import_parser = stages.add_parser('import', help="Import log files or folders")
+    import_parser.add_argument('paths', nargs='+', help="Log files, or folders searched for .log/.json/.jsonl files")
+
+    preprocess_parser = stages.add_parser('preprocess', help="Build the text to embed from raw_data fields")
+    preprocess_parser.add_argument('--fields', nargs='+', required=True, help="raw_data fields, in order")
+    add_window_arguments(preprocess_parser)
+
+    embed_parser = stages.add_parser('embed', help="Generate embeddings")
+    embed_parser.add_argument('--model', default=DEFAULT_EMBEDDING_MODEL)
+    embed_parser.add_argument('--no-resume', action='store_true', help="Ignore an interrupted job's checkpoint")
+    embed_parser.add_argument('--only-missing', action='store_true',
+                              help="Only embed logs without an embedding, keeping existing results")
+    add_window_arguments(embed_parser)
+
+    reduce_parser = stages.add_parser('reduce', help="Project the embeddings to 3D")
+    reduce_parser.add_argument('--mode', choices=PROJECTION_MODES, default=DEFAULT_REDUCTION_PARAMS['mode'])
+    reduce_parser.add_argument('--pca-components', type=int, default=DEFAULT_REDUCTION_PARAMS['pca_components'])
+    reduce_parser.add_argument('--landmarks', type=int, default=DEFAULT_REDUCTION_PARAMS['landmarks'])
+    reduce_parser.add_argument('--perplexity', type=float, default=DEFAULT_REDUCTION_PARAMS['perplexity'])
+    reduce_parser.add_argument('--max-iter', type=int, default=DEFAULT_REDUCTION_PARAMS['max_iter'])
+    reduce_parser.add_argument('--init', choices=['pca', 'random'], default=DEFAULT_REDUCTION_PARAMS['init'])
+    reduce_parser.add_argument('--metric', choices=['euclidean', 'cosine', 'manhattan'],
+                               default=DEFAULT_REDUCTION_PARAMS['metric'])
+    reduce_parser.add_argument('--force', action='store_true', help="Recompute even if a saved projection matches")
+    add_window_arguments(reduce_parser)
+
+    cluster_parser = stages.add_parser('cluster', help="Cluster the embeddings")
+    cluster_parser.add_argument('--algorithm', choices=CLUSTERING_ALGORITHMS, default='dbscan')
+    cluster_parser.add_argument('--eps', type=float, default=0.5)
+    cluster_parser.add_argument('--min-samples', type=int, default=5)
+    cluster_parser.add_argument('--n-clusters', type=int, default=50)
+    cluster_parser.add_argument('--metric', choices=['euclidean', 'cosine'], default='euclidean')
+    cluster_parser.add_argument('--neighbor-backend', choices=NEIGHBOR_BACKENDS, default='auto')
+    add_window_arguments(cluster_parser)
+
+    run_parser = stages.add_parser('run', help="Run all stages, reusing the output of those whose inputs did not "
+                                               "change; stages use the parameters of their last run")
+    run_parser.add_argument('--files', nargs='+', default=[], help="Log files or folders to import first")
+    run_parser.add_argument('--fields', nargs='+', help="Preprocessing fields, instead of the last run's")
+    run_parser.add_argument('--model', help="Embedding model, instead of the last run's")
+    run_parser.add_argument('--force', nargs='+', choices=STAGES, default=[], help="Stages to rerun regardless")
+    add_window_arguments(run_parser)
+    run_parser.add_argument('--all-time', action='store_true',
+                            help="Run on all logs; without this or --since/--until each stage keeps its last window")
+    return parser
+
+
+def log_file_paths(paths):
+    file_paths = []
+    for path in paths:
+        file_paths.extend(find_log_files(path) if os.path.isdir(path) else [path])
+    return file_paths
+
+
+def time_window(args):
+    if args.since is None and args.until is None:
+        return ALL_TIME if getattr(args, 'all_time', False) else None
+    return {'start': args.since, 'end': args.until}
+
+
+def stage_options(args):
+    if args.stage == 'import':
+        return {'file_paths': log_file_paths(args.paths)}
+    if args.stage == 'preprocess':
+        return {'fields': args.fields, 'window': time_window(args)}
+    if args.stage == 'embed':
+        return {'model_name': args.model, 'resume': not args.no_resume, 'only_missing': args.only_missing,
+                'window': time_window(args)}
+    if args.stage == 'reduce':
+        return {'params': {'mode': args.mode, 'pca_components': args.pca_components, 'landmarks': args.landmarks,
+                           'perplexity': args.perplexity, 'max_iter': args.max_iter, 'init': args.init,
+                           'metric': args.metric},
+                'force': args.force, 'window': time_window(args)}
+    if args.stage == 'run':
+        options = {'import': {'file_paths': log_file_paths(args.files)} if args.files else None}
+        if args.fields:
+            options['preprocess'] = {'fields': args.fields}
+        if args.model:
+            options['embed'] = {'model_name': args.model}
+        return options
+    return {'algorithm': args.algorithm, 'epsilon': args.eps, 'min_samples': args.min_samples,
+            'n_clusters': args.n_clusters, 'metric': args.metric, 'neighbor_backend': args.neighbor_backend,
+            'window': time_window(args)}
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Libraries print to stdout (progress bars, warnings); only JSON events may go there
+    events = JsonEventWriter(sys.stdout, args.stage)
+    sys.stdout = sys.stderr
+
+    # Ctrl-C or SIGTERM asks the stage to stop at its next batch boundary, rolling back what it has not
+    # committed; a second one interrupts it
+    cancel_token = CancellationToken()
+
+    def request_cancel(signum, frame):
+        if cancel_token.is_cancelled() or args.stage not in CANCELLABLE_STAGES | {'run'}:
+            raise KeyboardInterrupt()
+        cancel_token.cancel()
+        events.status("Cancelling...")
+
+    signal.signal(signal.SIGINT, request_cancel)
+    signal.signal(signal.SIGTERM, request_cancel)
+
+    trace_path = args.trace or enable_from_environment()
+    if args.trace:
+        TRACER.enable()
+
+    options = stage_options(args)
+    events.emit('started', database=os.path.abspath(args.db))
+    started = time.perf_counter()
+    db_manager = DatabaseManager(args.db)
+    try:
+        db_manager.create_tables()
+        if args.stage == 'run':
+            result = run_pipeline(db_manager, options, set(args.force), events.progress, events.status,
+                                  cancel_token, time_window(args))
+        else:
+            result = run_stage(db_manager, args.stage, options, events.progress, events.status, cancel_token)
+    except PipelineError as e:
+        events.emit('error', message=str(e))
+        return EXIT_FAILED
+    except (OperationCancelled, KeyboardInterrupt):
+        events.emit('cancelled')
+        return EXIT_CANCELLED
+    except Exception as e:
+        traceback.print_exc()
+        events.emit('error', message=f"{type(e).__name__}: {e}")
+        return EXIT_ERROR
+    finally:
+        db_manager.close()
+        if trace_path:
+            TRACER.export_chrome_trace(trace_path)
+            events.emit('trace', path=os.path.abspath(trace_path), peak_rss_mb=TRACER.peak_rss_mb(),
+                        spans=TRACER.summary())
+    events.emit('finished', result=result, seconds=round(time.perf_counter() - started, 3))
+    return EXIT_OK
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,212 @@
+import json
+import numpy as np
+from .streaming_clustering import normalize_rows
+
+MEDOID_SAMPLE = 256
+TOP_TOKENS = 10
+TOKEN_VOCAB_SAMPLE = 50000
+TOKEN_VOCAB_SIZE = 20000
+FIELD_SAMPLE = 1000
+KEY_FIELD_MAX_DISTINCT = 30
+MAX_KEY_FIELDS = 6
+HISTOGRAM_BINS = 8
+EXEMPLAR_TEXT_LENGTH = 200
+
+
+def membership_matrix(labels, n_classes):
+    # Sparse n_classes x n_rows indicator, so per-class sums are one matrix product
+    from scipy import sparse
+    return sparse.csr_matrix((np.ones(len(labels), dtype=np.float32), (labels, np.arange(len(labels)))),
+                             shape=(n_classes, len(labels)))
+
+
+def class_tfidf(counts):
+    # Class-based TF-IDF: term frequency within the class, weighted by log(1 + A / f_t) where A is the average
+    # number of tokens per class and f_t the frequency of the term over all classes
+    from scipy import sparse
+    counts = sparse.csr_matrix(counts, dtype=np.float64)
+    class_totals = np.asarray(counts.sum(axis=1)).ravel()
+    term_totals = np.asarray(counts.sum(axis=0)).ravel()
+    average_class_size = class_totals.mean() if len(class_totals) else 0.0
+    idf = np.log1p(average_class_size / np.maximum(term_totals, 1))
+    tf = sparse.diags(1.0 / np.maximum(class_totals, 1)) @ counts
+    return (tf @ sparse.diags(idf)).tocsr()
+
+
+def top_tokens(db_manager, cluster_index, n_clusters, chunk_size):
+    sample = [text for text in db_manager.get_preprocessed_text_sample(TOKEN_VOCAB_SAMPLE) if text and text.strip()]
+    if not sample:
+        return [[] for _ in range(n_clusters)]
+    from scipy import sparse
+    from sklearn.feature_extraction.text import CountVectorizer
+    vectorizer = CountVectorizer(max_features=TOKEN_VOCAB_SIZE, lowercase=True)
+    try:
+        vectorizer.fit(sample)
+    except ValueError:
+        # Only stop words or empty documents
+        return [[] for _ in range(n_clusters)]
+    vocabulary = vectorizer.get_feature_names_out()
+
+    counts = sparse.csr_matrix((n_clusters, len(vocabulary)), dtype=np.float64)
+    for cluster_ids, texts in db_manager.iter_clustered_texts(chunk_size):
+        labels = cluster_index(np.asarray(cluster_ids, dtype=np.int64))
+        known = labels >= 0
+        if not known.any():
+            continue
+        documents = vectorizer.transform([text for text, keep in zip(texts, known) if keep])
+        counts = counts + membership_matrix(labels[known], n_clusters) @ documents
+
+    scores = class_tfidf(counts)
+    tokens = []
+    for row in range(n_clusters):
+        start, stop = scores.indptr[row], scores.indptr[row + 1]
+        columns, values = scores.indices[start:stop], scores.data[start:stop]
+        best = columns[np.argsort(-values)[:TOP_TOKENS]]
+        tokens.append([str(vocabulary[column]) for column in best])
+    return tokens
+
+
+def key_fields(db_manager):
+    # Top-level scalar fields with few distinct values, the ones where a histogram says something
+    distinct = {}
+    for raw_data in db_manager.get_raw_data_sample(FIELD_SAMPLE):
+        try:
+            record = json.loads(raw_data)
+        except (TypeError, ValueError):
+            continue
+        if not isinstance(record, dict):
+            continue
+        for field, value in record.items():
+            if isinstance(value, (dict, list)):
+                distinct[field] = None
+            elif distinct.get(field, set()) is not None:
+                distinct.setdefault(field, set()).add(value)
+    fields = [field for field, values in distinct.items()
+              if values is not None and 1 < len(values) <= KEY_FIELD_MAX_DISTINCT]
+    return fields[:MAX_KEY_FIELDS]
+
+
+def field_histograms(db_manager, cluster_index, n_clusters):
+    histograms = [{} for _ in range(n_clusters)]
+    for field in key_fields(db_manager):
+        for cluster_id, value, count in db_manager.get_field_value_counts(field):
+            row = cluster_index(np.array([cluster_id], dtype=np.int64))[0]
+            if row < 0:
+                continue
+            bins = histograms[row].setdefault(field, [])
+            if len(bins) < HISTOGRAM_BINS:
+                bins.append([value, count])
+    return histograms
+
+
+def exemplars(db_manager, log_ids, labels, n_clusters, normalize, chunk_size, random_state=42):
+    # Nearest-to-centroid log per cluster over all members, and the medoid of a fixed member sample
+    sums = None
+    for chunk_ids, chunk in db_manager.iter_embedding_chunks(chunk_size=chunk_size):
+        chunk = normalize_rows(chunk) if normalize else chunk
+        chunk_labels = labels[np.searchsorted(log_ids, chunk_ids)]
+        if sums is None:
+            sums = np.zeros((n_clusters, chunk.shape[1]), dtype=np.float64)
+        known = chunk_labels >= 0
+        sums += membership_matrix(chunk_labels[known], n_clusters) @ chunk[known]
+    if sums is None:
+        return None
+    counts = np.bincount(labels[labels >= 0], minlength=n_clusters)
+    centroids = (sums / np.maximum(counts, 1)[:, None]).astype(np.float32)
+
+    # Up to MEDOID_SAMPLE random members per cluster: shuffle, group by cluster, keep each group's head
+    rng = np.random.default_rng(random_state)
+    members = np.flatnonzero(labels >= 0)
+    members = members[rng.permutation(len(members))]
+    members = members[np.argsort(labels[members], kind='stable')]
+    starts = np.searchsorted(labels[members], np.arange(n_clusters))
+    rank = np.arange(len(members)) - np.repeat(starts, np.diff(np.append(starts, len(members))))
+    medoid_sample = np.sort(log_ids[members[rank < MEDOID_SAMPLE]])
+
+    best_distance = np.full(n_clusters, np.inf)
+    best_log = np.full(n_clusters, -1, dtype=np.int64)
+    sample_vectors = {}
+    for chunk_ids, chunk in db_manager.iter_embedding_chunks(chunk_size=chunk_size):
+        chunk = normalize_rows(chunk) if normalize else chunk
+        chunk_labels = labels[np.searchsorted(log_ids, chunk_ids)]
+        known = chunk_labels >= 0
+        chunk_ids, chunk, chunk_labels = chunk_ids[known], chunk[known], chunk_labels[known]
+        distances = np.linalg.norm(chunk - centroids[chunk_labels], axis=1)
+        # Smallest distance per cluster within the chunk
+        order = np.lexsort((distances, chunk_labels))
+        rows, first = np.unique(chunk_labels[order], return_index=True)
+        candidates = order[first]
+        better = distances[candidates] < best_distance[rows]
+        best_distance[rows[better]] = distances[candidates[better]]
+        best_log[rows[better]] = chunk_ids[candidates[better]]
+        in_sample = np.isin(chunk_ids, medoid_sample)
+        for log_id, label, vector in zip(chunk_ids[in_sample], chunk_labels[in_sample], chunk[in_sample]):
+            sample_vectors.setdefault(int(label), []).append((int(log_id), vector))
+
+    medoids = np.full(n_clusters, -1, dtype=np.int64)
+    for row, members in sample_vectors.items():
+        ids = np.array([log_id for log_id, _ in members])
+        vectors = np.vstack([vector for _, vector in members])
+        squared = (vectors ** 2).sum(axis=1)
+        pairwise = np.sqrt(np.maximum(squared[:, None] + squared[None, :] - 2 * vectors @ vectors.T, 0))
+        medoids[row] = ids[np.argmin(pairwise.sum(axis=1))]
+    return medoids, best_log
+
+
+def summarize_clusters(db_manager, metric='euclidean', chunk_size=16384, status=None):
+    # Summary rows for every non-noise cluster: size, medoid and nearest-to-centroid exemplars with a text
+    # snippet, class-based TF-IDF top tokens and value histograms of low-cardinality raw_data fields
+    status = status or (lambda message: None)
+    log_ids, log_clusters = db_manager.get_log_cluster_assignments()
+    clustered = log_clusters != -1
+    if not clustered.any():
+        return []
+    cluster_ids, labels = np.unique(log_clusters[clustered], return_inverse=True)
+    n_clusters = len(cluster_ids)
+    all_labels = np.full(len(log_ids), -1, dtype=np.int64)
+    all_labels[clustered] = labels
+
+    def cluster_index(values):
+        positions = np.minimum(np.searchsorted(cluster_ids, values), n_clusters - 1)
+        return np.where(cluster_ids[positions] == values, positions, -1)
+
+    status(f"Finding exemplar logs for {n_clusters} clusters...")
+    medoids, centroid_logs = exemplars(db_manager, log_ids, all_labels, n_clusters, metric == 'cosine', chunk_size)
+    status("Extracting distinctive tokens per cluster...")
+    tokens = top_tokens(db_manager, cluster_index, n_clusters, chunk_size)
+    status("Counting field values per cluster...")
+    histograms = field_histograms(db_manager, cluster_index, n_clusters)
+
+    texts = db_manager.get_texts_for_logs(np.unique(np.concatenate([medoids, centroid_logs])).tolist())
+    sizes = np.bincount(labels, minlength=n_clusters)
+    summaries = []
+    for row, cluster_id in enumerate(cluster_ids):
+        medoid, centroid_log = int(medoids[row]), int(centroid_logs[row])
+        summaries.append({
+            'cluster_id': int(cluster_id),
+            'size': int(sizes[row]),
+            'medoid_log_id': medoid if medoid >= 0 else None,
+            'centroid_log_id': centroid_log if centroid_log >= 0 else None,
+            'exemplar_texts': {
+                'medoid': (texts.get(medoid) or '')[:EXEMPLAR_TEXT_LENGTH],
+                'centroid': (texts.get(centroid_log) or '')[:EXEMPLAR_TEXT_LENGTH],
+            },
+            'top_tokens': tokens[row],
+            'field_histograms': histograms[row],
+        })
+    return summaries
+
+
+def describe_summary(summary):
+    # Multi-line text for tooltips and the 3D overlay
+    lines = [f"{summary['size']} logs"]
+    if summary['top_tokens']:
+        lines.append("Top tokens: " + ", ".join(summary['top_tokens']))
+    for kind in ('medoid', 'centroid'):
+        text = summary['exemplar_texts'].get(kind, '').strip().replace('\n', ' ')
+        if text:
+            lines.append(f"{kind.capitalize()} log {summary[kind + '_log_id']}: {text}")
+    for field, bins in summary['field_histograms'].items():
+        values = ", ".join(f"{value} ({count / max(summary['size'], 1):.0%})" for value, count in bins[:4])
+        lines.append(f"{field}: {values}")
+    return "\n".join(lines)
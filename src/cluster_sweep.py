@@ -0,0 +1,178 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from sklearn.metrics import pairwise_distances, silhouette_score
+from sklearn.neighbors import NearestNeighbors
+
+SILHOUETTE_SAMPLE = 3000
+K_DISTANCE_SAMPLE = 20000
+EPS_QUANTILES = [0.5, 0.6, 0.7, 0.8, 0.9]
+DEFAULT_MIN_SAMPLES = [3, 5, 10, 20]
+
+
+def exact_radius_graph(embeddings, radius, metric='euclidean'):
+    neighbors = NearestNeighbors(radius=radius, metric=metric).fit(embeddings)
+    graph = neighbors.radius_neighbors_graph(mode='distance').tocoo()
+    # Keep exact duplicates as explicit entries: sparse consumers drop stored zeros
+    return sparse.csr_matrix((np.maximum(graph.data, 1e-12), (graph.row, graph.col)), shape=graph.shape)
+
+
+def build_neighbor_graph(embeddings, radius, metric='euclidean', index=None, progress=None):
+    # Sparse distance graph of every pair within `radius`, from the IVF index when one is given
+    if index is not None:
+        return index.radius_neighbors_graph(radius, progress=progress)
+    return exact_radius_graph(embeddings, radius, metric)
+
+
+def restrict_graph(graph, radius):
+    # Edges of a graph built for a larger radius that fall within `radius`, self-loops dropped
+    graph = graph.tocoo()
+    keep = (graph.data <= radius) & (graph.row != graph.col)
+    return sparse.csr_matrix((graph.data[keep], (graph.row[keep], graph.col[keep])), shape=graph.shape)
+
+
+def graph_dbscan_labels(graph, min_samples):
+    # DBSCAN on a restricted neighbor graph: core points are those with at least min_samples neighbors
+    # (themselves included), clusters are the connected components of the core points, and border points
+    # join the cluster of their first core neighbor. Matches sklearn up to the choice between clusters
+    # for border points that touch several.
+    degree = np.diff(graph.indptr)
+    core = degree + 1 >= min_samples
+    labels = np.full(graph.shape[0], -1, dtype=np.int64)
+    if not core.any():
+        return labels
+    rows = np.repeat(np.arange(graph.shape[0]), degree)
+    cols = graph.indices
+    core_edges = core[rows] & core[cols]
+    # Same sparsity structure with non-core edges zeroed out, no re-sorting needed
+    core_graph = sparse.csr_matrix((core_edges.astype(np.int8), graph.indices.copy(), graph.indptr.copy()),
+                                   shape=graph.shape)
+    core_graph.eliminate_zeros()
+    # The graph is symmetric, so strong components equal undirected ones without building the transpose
+    _, components = connected_components(core_graph, directed=True, connection='strong')
+    # Renumber so the clusters are 0..k-1 over core points only
+    labels[core] = np.unique(components[core], return_inverse=True)[1]
+    border_edges = ~core[rows] & core[cols]
+    border_rows, first = np.unique(rows[border_edges], return_index=True)
+    labels[border_rows] = labels[cols[border_edges][first]]
+    return labels
+
+
+def k_distance_curve(embeddings, k, metric='euclidean', index=None, sample_size=K_DISTANCE_SAMPLE,
+                     random_state=42):
+    # Sorted distance of a sample of points to their k-th nearest neighbor (the point itself excluded)
+    rng = np.random.default_rng(random_state)
+    sample = np.sort(rng.choice(len(embeddings), min(sample_size, len(embeddings)), replace=False))
+    k = min(k, len(embeddings) - 1)
+    if k < 1:
+        return np.zeros(0, dtype=np.float32)
+    if index is not None:
+        distances, _ = index.search(embeddings[sample], k + 1)
+        distances = distances[:, k]
+        distances = distances[np.isfinite(distances)]
+    else:
+        neighbors = NearestNeighbors(n_neighbors=k + 1, metric=metric).fit(embeddings)
+        distances = neighbors.kneighbors(embeddings[sample])[0][:, k]
+    return np.sort(distances).astype(np.float32)
+
+
+def knee_point(curve):
+    # Point of the sorted curve furthest from the chord between its ends
+    if len(curve) < 3:
+        return float(curve[-1]) if len(curve) else 0.0
+    x = np.linspace(0, 1, len(curve))
+    span = curve[-1] - curve[0]
+    y = (curve - curve[0]) / span if span > 0 else np.zeros_like(curve)
+    return float(curve[np.argmax(x - y)])
+
+
+def suggest_eps_grid(curve, n_values=5):
+    # Quantiles of the k-distance curve plus its knee, the usual DBSCAN eps heuristic
+    if len(curve) == 0:
+        return []
+    quantiles = np.linspace(EPS_QUANTILES[0], EPS_QUANTILES[-1], n_values)
+    values = list(np.quantile(curve, quantiles)) + [knee_point(curve)]
+    return sorted({round(float(value), 4) for value in values if value > 0})
+
+
+# Worker state, set once per process by the pool initializer so the graph is only sent once
+_worker_state = {}
+
+
+def _init_worker(graph, sample, sample_distances):
+    _worker_state.update(graph=graph, sample=sample, sample_distances=sample_distances)
+
+
+def evaluate_setting(graph, sample, sample_distances, eps, min_samples):
+    labels = graph_dbscan_labels(graph, min_samples)
+    n_clusters = len(set(labels.tolist()) - {-1})
+    result = {
+        'eps': eps,
+        'min_samples': min_samples,
+        'n_clusters': n_clusters,
+        'noise_ratio': float(np.mean(labels == -1)),
+        'silhouette': None,
+    }
+    # Silhouette over clustered points of a fixed sample, noise excluded
+    sample_labels = labels[sample]
+    clustered = sample_labels != -1
+    if len(np.unique(sample_labels[clustered])) >= 2 and clustered.sum() > 2:
+        distances = sample_distances[np.ix_(clustered, clustered)]
+        result['silhouette'] = float(silhouette_score(distances, sample_labels[clustered], metric='precomputed'))
+    return result
+
+
+def _evaluate_eps(eps, min_samples_values):
+    state = _worker_state
+    graph = restrict_graph(state['graph'], eps)
+    return [evaluate_setting(graph, state['sample'], state['sample_distances'], eps, min_samples)
+            for min_samples in min_samples_values]
+
+
+def sweep_dbscan(embeddings, eps_values, min_samples_values, metric='euclidean', index=None,
+                 max_workers=None, progress=None, status=None, random_state=42):
+    # Evaluates every (eps, min_samples) pair against one neighbor graph built for the largest eps
+    status = status or (lambda message: None)
+    eps_values = sorted(eps_values)
+    status(f"Computing neighbors within eps={eps_values[-1]:g}...")
+    graph = build_neighbor_graph(embeddings, eps_values[-1], metric, index)
+
+    rng = np.random.default_rng(random_state)
+    sample = np.sort(rng.choice(len(embeddings), min(SILHOUETTE_SAMPLE, len(embeddings)), replace=False))
+    # Distances between the silhouette sample are shared by every setting
+    sample_distances = pairwise_distances(embeddings[sample], metric=metric).astype(np.float32)
+
+    status(f"Evaluating {len(eps_values) * len(min_samples_values)} DBSCAN settings "
+           f"({graph.nnz} neighbor pairs)...")
+    results = []
+    max_workers = min(max_workers or os.cpu_count() or 1, len(eps_values))
+    if max_workers == 1:
+        # A pool only adds startup and pickling cost without a second core
+        _init_worker(graph, sample, sample_distances)
+        try:
+            for done, eps in enumerate(eps_values):
+                results.extend(_evaluate_eps(eps, list(min_samples_values)))
+                if progress is not None:
+                    progress((done + 1) / len(eps_values))
+        finally:
+            _worker_state.clear()
+        return results
+    # Spawned workers avoid forking a process that is running Qt threads
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker,
+                             initargs=(graph, sample, sample_distances)) as executor:
+        futures = [executor.submit(_evaluate_eps, eps, list(min_samples_values)) for eps in eps_values]
+        try:
+            for done, future in enumerate(as_completed(futures)):
+                results.extend(future.result())
+                if progress is not None:
+                    progress((done + 1) / len(futures))
+        except BaseException:
+            # E.g. cancelled from the progress callback: settings not started yet are dropped
+            for future in futures:
+                future.cancel()
+            raise
+    return sorted(results, key=lambda result: (result['eps'], result['min_samples']))
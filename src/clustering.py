@@ -1,108 +1,227 @@
 import numpy as np
-from sklearn.cluster import DBSCAN
-from PyQt6.QtCore import QThread, pyqtSignal
-from src.db_manager import DatabaseManager
-
-class ClusteringThread(QThread):
-    progress_update = pyqtSignal(int)
-    status_update = pyqtSignal(str)
-    finished = pyqtSignal()
-
-    def __init__(self, db_name, epsilon=0.5, min_samples=5):
-        super().__init__()
-        self.db_name = db_name
-        self.epsilon = epsilon
-        self.min_samples = min_samples
-
-    def run(self):
-        self.status_update.emit("Starting clustering process...")
-        self.progress_update.emit(0)
-        db_manager = DatabaseManager(self.db_name)
-
-        # Fetch embeddings
-        embeddings, log_ids = self.fetch_embeddings(db_manager)
-        if len(embeddings) == 0:
-            self.status_update.emit("No embeddings found in the database.")
-            return
-
-        # Perform clustering
-        self.status_update.emit(f"Performing DBSCAN clustering on {len(embeddings)} embeddings...")
-        self.progress_update.emit(25)  # 25% progress after fetching embeddings
-
-        dbscan = DBSCAN(eps=self.epsilon, min_samples=self.min_samples)
-        cluster_labels = dbscan.fit_predict(embeddings)
-
-        self.progress_update.emit(75)  # 75% progress after clustering
-
-        # Update database with clustering results
-        self.update_database_with_clusters(db_manager, log_ids, cluster_labels)
-
-        self.status_update.emit("Clustering completed and database updated.")
-        self.progress_update.emit(100)  # 100% progress when finished
-        self.finished.emit()
-
-    def fetch_embeddings(self, db_manager):
-        embeddings = []
-        log_ids = []
-        logs = db_manager.get_all_logs()
-        print(f"Total logs retrieved: {len(logs)}")
-        for log in logs:
-            if log[4] is not None:  # Assuming the embedding is in the 16th column
-                try:
-                    if isinstance(log[5], bytes):
-                        # If it's already bytes, use it directly
-                        embedding = np.frombuffer(log[5], dtype=np.float32)
-                    elif isinstance(log[5], str):
-                        # If it's a string, try to convert from string representation
-                        embedding = np.fromstring(log[5].strip('[]'), sep=',', dtype=np.float32)
-                    else:
-                        print(f"Unexpected embedding type for log {log[0]}: {type(log[5])}")
-                        continue
-                    if embedding.size > 0:
-                        embeddings.append(embedding)
-                        log_ids.append(log[0])  # Log ID
-                    else:
-                        print(f"Skipping log {log[0]}: Empty embedding")
-                except Exception as e:
-                    print(f"Error processing embedding for log {log[0]}: {str(e)}")
-        
-        print(f"Total valid embeddings: {len(embeddings)}")
-        if not embeddings:
-            print("No valid embeddings found in the database.")
-            return np.array([]), []
-
-        # Ensure all embeddings have the same dimensionality
-        embedding_dim = embeddings[0].shape[0]
-        valid_embeddings = [emb for emb in embeddings if emb.shape[0] == embedding_dim]
-        valid_log_ids = [log_id for emb, log_id in zip(embeddings, log_ids) if emb.shape[0] == embedding_dim]
-        
-        if len(valid_embeddings) != len(embeddings):
-            print(f"Removed {len(embeddings) - len(valid_embeddings)} embeddings with inconsistent dimensions.")
-        
-        return np.array(valid_embeddings), valid_log_ids
-
-    def update_database_with_clusters(self, db_manager, log_ids, cluster_labels):
-        cluster_ids = {}
-        default_cluster_id = -1
-        unique_clusters = set(cluster_labels) - {-1}  # Exclude -1 from unique clusters
-        total_clusters = len(unique_clusters)
-        
-        for i, cluster_label in enumerate(unique_clusters):
-            cluster_name = f'Cluster {cluster_label}'
-            cluster_id = db_manager.create_cluster(cluster_name)
-            cluster_ids[cluster_label] = cluster_id
-            progress = 75 + int((i + 1) / total_clusters * 20)  # Progress from 75% to 95%
-            self.progress_update.emit(progress)
-
-        total_logs = len(log_ids)
-        for i, (log_id, cluster_label) in enumerate(zip(log_ids, cluster_labels)):
-            if cluster_label == -1:
-                # Assume the default cluster ID is known or can be retrieved
-                db_manager.assign_to_cluster(log_id, default_cluster_id)
-            else:
-                db_manager.assign_to_cluster(log_id, cluster_ids[cluster_label])
-            if i % 100 == 0:  # Update progress every 100 logs
-                progress = 95 + int((i + 1) / total_logs * 5)  # Progress from 95% to 100%
-                self.progress_update.emit(progress)
-
-        self.status_update.emit(f"Created {total_clusters} clusters. Points labeled -1 assigned to default cluster.")
\ No newline at end of file
+from src.cancellation import CancellationToken, OperationCancelled
+from src.pipeline import PipelineError
+from src.ann_index import ANN_AUTO_THRESHOLD, load_or_build_index
+from src.streaming_clustering import StreamingClusterer, STREAMING_ALGORITHMS, STREAMING_CHUNK_SIZE
+from src.online_assignment import OnlineAssigner, recluster_reason
+from src.cluster_summary import summarize_clusters
+from src.instrumentation import span
+from src.time_window import describe_window
+
+NEIGHBOR_BACKENDS = ['auto', 'exact', 'ann']
+CLUSTERING_ALGORITHMS = ['dbscan'] + STREAMING_ALGORITHMS
+
+
+def use_ann(neighbor_backend, n_samples):
+    if neighbor_backend == 'auto':
+        return n_samples > ANN_AUTO_THRESHOLD
+    return neighbor_backend == 'ann'
+
+
+def run_params(algorithm, epsilon, min_samples, n_clusters, metric):
+    if algorithm == 'dbscan':
+        return {'epsilon': epsilon, 'min_samples': min_samples, 'metric': metric}
+    return {'n_clusters': n_clusters, 'metric': metric}
+
+
+def cluster_logs(db_manager, algorithm='dbscan', epsilon=0.5, min_samples=5, metric='euclidean',
+                 neighbor_backend='auto', n_clusters=50, progress=None, status=None, cancel_token=None, window=None):
+    # Clusters the embeddings of the time window (all of them by default), swaps the result in atomically and
+    # stores the cluster summaries. Logs outside the window end up unclustered. Cancelling before the swap
+    # keeps the previous clustering.
+    progress = progress or (lambda percent: None)
+    status = status or (lambda message: None)
+    cancel_token = cancel_token or CancellationToken()
+    status("Starting clustering process...")
+    progress(0)
+    params = run_params(algorithm, epsilon, min_samples, n_clusters, metric)
+    if window:
+        # Recorded with the run, online assignment only extends it within the window
+        params['window'] = window
+    where, where_params = db_manager.window_filter(window)
+
+    if algorithm in STREAMING_ALGORITHMS:
+        cluster_count = cluster_streaming(db_manager, algorithm, n_clusters, metric, params, progress, status,
+                                          cancel_token, where, where_params)
+    else:
+        log_ids, embeddings = db_manager.load_embeddings(where, where_params)
+        if len(log_ids) == 0:
+            raise PipelineError("No embeddings found in the database"
+                                + (f" {describe_window(window)}." if window else "."))
+        status(f"Performing DBSCAN clustering on {len(embeddings)} embeddings...")
+        progress(25)  # 25% progress after fetching embeddings
+        cancel_token.raise_if_cancelled()
+
+        with span('cluster.fit', rows=len(log_ids), algorithm='dbscan'):
+            cluster_labels, core_indices = run_dbscan(db_manager, embeddings, log_ids, epsilon, min_samples, metric,
+                                                      neighbor_backend, progress, status, cancel_token)
+        progress(75)  # 75% progress after clustering
+        cancel_token.raise_if_cancelled()
+
+        # Labels are staged and swapped in with one transaction, the old clustering stays visible until then
+        core = np.zeros(len(log_ids), dtype=bool)
+        core[core_indices] = True
+        with span('cluster.write', rows=len(log_ids)):
+            db_manager.start_cluster_staging()
+            db_manager.stage_cluster_labels(log_ids, cluster_labels, core)
+            progress(85)
+            cluster_count = len(db_manager.swap_clusters('dbscan', params, metric))
+        status(f"Created {cluster_count} clusters. Points labeled -1 assigned to default cluster.")
+
+    with span('cluster.summaries'):
+        summaries = summarize_clusters(db_manager, metric, status=status)
+        db_manager.save_cluster_summaries(summaries)
+    status("Clustering completed and database updated.")
+    progress(100)
+    return {'algorithm': algorithm, 'params': params, 'clusters': cluster_count}
+
+
+def cluster_streaming(db_manager, algorithm, n_clusters, metric, params, progress, status, cancel_token,
+                      where="", where_params=()):
+    # Bounded memory: embeddings are streamed from the database twice, once to fit and once to assign
+    total = db_manager.count_embeddings(where, where_params)
+    if total == 0:
+        raise PipelineError("No embeddings found in the database"
+                            + (f" {describe_window(params['window'])}." if where else "."))
+    n_clusters = min(n_clusters, total)
+    clusterer = StreamingClusterer(algorithm, n_clusters, metric)
+
+    status(f"Fitting mini-batch k-means with {n_clusters} clusters on {total} embeddings...")
+    seen = 0
+    try:
+        for log_ids, chunk in db_manager.iter_embedding_chunks(where, where_params,
+                                                               chunk_size=STREAMING_CHUNK_SIZE):
+            cancel_token.raise_if_cancelled()
+            with span('cluster.fit', rows=len(log_ids), algorithm=algorithm):
+                clusterer.partial_fit(chunk)
+            seen += len(log_ids)
+            progress(int(seen / total * 45))
+    except ValueError as e:
+        raise PipelineError(f"Clustering failed: {e}")
+
+    status(f"Assigning {total} logs to clusters...")
+    db_manager.start_cluster_staging()
+    seen = 0
+    for log_ids, chunk in db_manager.iter_embedding_chunks(where, where_params, chunk_size=STREAMING_CHUNK_SIZE):
+        cancel_token.raise_if_cancelled()
+        with span('cluster.assign', rows=len(log_ids)):
+            labels = clusterer.assign(chunk)
+        with span('cluster.write', rows=len(log_ids)):
+            db_manager.stage_cluster_labels(log_ids, labels)
+        seen += len(log_ids)
+        progress(50 + int(seen / total * 45))
+
+    labels, centroids, radii, _ = clusterer.cluster_models()
+    cancel_token.raise_if_cancelled()
+    with span('cluster.write'):
+        db_manager.swap_clusters(algorithm, params, metric, (labels, centroids, radii))
+    status(f"Created {len(labels)} clusters with mini-batch k-means.")
+    return len(labels)
+
+
+def run_dbscan(db_manager, embeddings, log_ids, epsilon, min_samples, metric, neighbor_backend, progress, status,
+               cancel_token):
+    # Returns (labels, indices of the core points)
+    from sklearn.cluster import DBSCAN
+    from src.cluster_sweep import build_neighbor_graph
+    if not use_ann(neighbor_backend, len(embeddings)):
+        dbscan = DBSCAN(eps=epsilon, min_samples=min_samples, metric=metric).fit(embeddings)
+        return dbscan.labels_, dbscan.core_sample_indices_
+
+    # Large inputs: build the eps-neighborhood graph with the persisted IVF index,
+    # then let DBSCAN expand clusters from the precomputed sparse distances
+    index = load_or_build_index(db_manager, np.asarray(log_ids, dtype=np.int64), embeddings, metric=metric,
+                                status=status)
+    status(f"Computing neighbors within eps={epsilon:g}...")
+
+    def graph_progress(fraction):
+        # Reported once per index list, the batch boundary of the graph build
+        cancel_token.raise_if_cancelled()
+        progress(25 + int(fraction * 35))
+    graph = build_neighbor_graph(embeddings, epsilon, metric, index, progress=graph_progress)
+    cancel_token.raise_if_cancelled()
+    status(f"Performing DBSCAN clustering on {len(embeddings)} embeddings ({graph.nnz} neighbor pairs)...")
+    dbscan = DBSCAN(eps=epsilon, min_samples=min_samples, metric='precomputed').fit(graph)
+    return dbscan.labels_, dbscan.core_sample_indices_
+
+
+def sweep_parameters(db_manager, eps_values=None, min_samples_values=None, metric='euclidean',
+                     neighbor_backend='auto', progress=None, status=None, cancel_token=None, window=None):
+    # Evaluates a grid of DBSCAN settings on the embeddings of the time window without touching the stored
+    # clusters; returns (results, knee)
+    from src.cluster_sweep import k_distance_curve, knee_point, suggest_eps_grid, sweep_dbscan, DEFAULT_MIN_SAMPLES
+    progress = progress or (lambda percent: None)
+    status = status or (lambda message: None)
+    cancel_token = cancel_token or CancellationToken()
+    min_samples_values = min_samples_values or DEFAULT_MIN_SAMPLES
+    status("Loading embeddings for the parameter sweep...")
+    progress(0)
+    log_ids, embeddings = db_manager.load_embeddings(*db_manager.window_filter(window))
+    if len(log_ids) < 2:
+        raise PipelineError("Not enough embeddings for a parameter sweep.")
+    index = None
+    if use_ann(neighbor_backend, len(log_ids)):
+        index = load_or_build_index(db_manager, log_ids, embeddings, metric=metric, status=status)
+    progress(10)
+    cancel_token.raise_if_cancelled()
+
+    status("Computing the k-distance curve...")
+    curve = k_distance_curve(embeddings, max(min_samples_values) - 1, metric, index)
+    knee = knee_point(curve)
+    eps_values = eps_values or suggest_eps_grid(curve)
+    if not eps_values:
+        raise PipelineError("Could not derive eps candidates from the k-distance curve.")
+    progress(25)
+    cancel_token.raise_if_cancelled()
+
+    def sweep_progress(fraction):
+        # Reported per eps value; pending settings are dropped when cancelled
+        cancel_token.raise_if_cancelled()
+        progress(25 + int(fraction * 75))
+    results = sweep_dbscan(embeddings, eps_values, min_samples_values, metric, index, progress=sweep_progress,
+                           status=status)
+    progress(100)
+    status(f"Evaluated {len(results)} DBSCAN settings (k-distance knee at {knee:.4g}).")
+    return results, knee
+
+
+def assign_new_logs(db_manager, progress=None, status=None, cancel_token=None):
+    # Assigns logs embedded since the last clustering run to its clusters, leaving earlier logs and those
+    # outside the run's time window untouched. Returns the reason a full recluster is recommended, or None.
+    progress = progress or (lambda percent: None)
+    status = status or (lambda message: None)
+    cancel_token = cancel_token or CancellationToken()
+    run = db_manager.get_last_clustering_run()
+    if run is None:
+        return None
+    where, where_params = db_manager.window_filter(run['params'].get('window'))
+    new_logs = "l.id > ? AND l.cluster_id = -1" + (f" AND {where}" if where else "")
+    new_log_params = (run['last_assigned_id'],) + where_params
+    total = db_manager.count_embeddings(new_logs, new_log_params)
+    if total == 0:
+        return None
+    assigner = OnlineAssigner.from_database(db_manager, run)
+    if assigner is None:
+        return None
+
+    status(f"Assigning {total} new logs to existing clusters...")
+    assigned = 0
+    seen = 0
+    last_id = run['last_assigned_id']
+    for log_ids, chunk in db_manager.iter_embedding_chunks(new_logs, new_log_params,
+                                                           chunk_size=STREAMING_CHUNK_SIZE):
+        if cancel_token.is_cancelled():
+            # Nothing is kept, the next run starts again from the last assigned id
+            db_manager.rollback()
+            raise OperationCancelled()
+        cluster_ids = assigner.assign(chunk)
+        matched = cluster_ids != -1
+        db_manager.assign_clusters(log_ids[matched], cluster_ids[matched])
+        assigned += int(matched.sum())
+        seen += len(log_ids)
+        last_id = int(log_ids[-1])
+        progress(int(seen / total * 100))
+    db_manager.commit()
+    db_manager.set_last_assigned_id(run['id'], last_id)
+    status(f"Assigned {assigned} of {total} new logs to existing clusters.")
+    return recluster_reason(run, *db_manager.get_new_log_cluster_counts(run['max_log_id'], where, where_params))
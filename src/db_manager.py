@@ -4,9 +4,42 @@ import os
 from datetime import datetime
 import threading
 import numpy as np
-import random
 import logging
 import colorsys
+from .instrumentation import span, counter
+
+EMBEDDING_CHUNK_SIZE = 16384
+# Columns added to existing tables after the first release, as (table, column, type); see migrate_tables
+SCHEMA_MIGRATIONS = [
+    ('clusters', 'centroid', 'BLOB'),
+    ('clusters', 'radius', 'REAL'),
+    ('clusters', 'size', 'INTEGER'),
+    ('clusters', 'metric', 'TEXT'),
+    ('embedding_jobs', 'time_window', 'TEXT'),
+    ('embedding_jobs', 'model_state', 'BLOB'),
+]
+# Consecutive multiples of the golden ratio conjugate are spread evenly around the hue circle
+GOLDEN_RATIO_CONJUGATE = 0.618033988749895
+
+
+def cluster_color(index):
+    # Deterministic, well separated color for the index-th cluster of a run
+    hue = (index * GOLDEN_RATIO_CONJUGATE) % 1.0
+    r, g, b = colorsys.hsv_to_rgb(hue, 0.55, 0.95)
+    return "#{:02x}{:02x}{:02x}".format(int(r * 255), int(g * 255), int(b * 255))
+
+
+def build_match_query(text):
+    # FTS5 query from free text: every whitespace-separated term becomes a quoted phrase of its words (so
+    # "/cgi-bin/" matches the adjacent tokens cgi, bin), terms are ANDed, and the last one is a prefix match
+    # for search-as-you-type
+    terms = [term.replace('"', '""') for term in text.split()]
+    if not terms:
+        return None
+    phrases = [f'"{term}"' for term in terms]
+    phrases[-1] += '*'
+    return " AND ".join(phrases)
+
 
 class DatabaseManager:
     _local = threading.local()
@@ -20,6 +53,8 @@ class DatabaseManager:
     def get_connection(self):
         if not hasattr(self._local, 'connection'):
             self._local.connection = sqlite3.connect(self.db_name)
+            # WAL lets readers keep seeing the last committed clustering while a new one is being written
+            self._local.connection.execute("PRAGMA journal_mode=WAL")
         return self._local.connection
 
     def get_cursor(self):
@@ -32,16 +67,82 @@ class DatabaseManager:
         schema_path = os.path.join(project_root, 'database_schema.sql')
         with open(schema_path, 'r') as schema_file:
             cursor.executescript(schema_file.read())
+        self.migrate_tables()
+        self.build_search_index()
+        self.get_connection().commit()
+
+    def migrate_tables(self):
+        # Columns added after the first release, CREATE TABLE IF NOT EXISTS leaves older databases without them
+        cursor = self.get_cursor()
+        for table, column, column_type in SCHEMA_MIGRATIONS:
+            cursor.execute(f"PRAGMA table_info({table})")
+            if column not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    def build_search_index(self):
+        # Databases created before the full-text index have logs but an empty index; queue them all
+        cursor = self.get_cursor()
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM logs) AND NOT EXISTS (SELECT 1 FROM logs_fts) "
+                       "AND NOT EXISTS (SELECT 1 FROM logs_fts_pending)")
+        if cursor.fetchone()[0]:
+            cursor.execute("INSERT INTO logs_fts_pending (log_id) SELECT id FROM logs")
+
+    def sync_search_index(self):
+        # Applies the queued inserts, updates and deletes to the full-text index in three statements
+        cursor = self.get_cursor()
+        cursor.execute("SELECT COUNT(*) FROM logs_fts_pending")
+        pending = cursor.fetchone()[0]
+        counter('search_index.pending', depth=pending)
+        if pending == 0:
+            return 0
+        with span('db.search_index_sync', rows=pending):
+            cursor.execute("DELETE FROM logs_fts WHERE rowid IN (SELECT log_id FROM logs_fts_pending)")
+            cursor.execute('''
+            INSERT INTO logs_fts (rowid, preprocessed_text, raw_fields)
+            SELECT l.id, l.preprocessed_text,
+                   (SELECT group_concat(value, ' ') FROM json_tree(l.raw_data) WHERE type = 'text')
+            FROM logs_fts_pending p JOIN logs l ON l.id = p.log_id
+            ''')
+            cursor.execute("DELETE FROM logs_fts_pending")
+            self.get_connection().commit()
+        logging.info(f"Search index updated for {pending} logs.")
+        return pending
+
+    def search_logs(self, text):
+        # Stores the ids of logs matching a free-text query in temp.search_hits, which the tree and the
+        # per-cluster queries join against, and returns them sorted. Malformed queries raise sqlite3.Error.
+        self.sync_search_index()
+        cursor = self.clear_search_hits()
+        query = build_match_query(text)
+        if query is not None:
+            cursor.execute("INSERT INTO temp.search_hits (log_id) SELECT rowid FROM logs_fts WHERE logs_fts MATCH ?",
+                           (query,))
         self.get_connection().commit()
+        cursor.execute("SELECT log_id FROM temp.search_hits ORDER BY log_id")
+        return np.array([row[0] for row in cursor.fetchall()], dtype=np.int64)
+
+    def set_search_hits(self, log_ids):
+        # Hits found elsewhere (e.g. a similarity query) filter the tree like a full-text search
+        cursor = self.clear_search_hits()
+        cursor.executemany("INSERT OR IGNORE INTO temp.search_hits (log_id) VALUES (?)",
+                           ((int(log_id),) for log_id in log_ids))
+        self.get_connection().commit()
+
+    def clear_search_hits(self):
+        cursor = self.get_cursor()
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS search_hits (log_id INTEGER PRIMARY KEY)")
+        cursor.execute("DELETE FROM temp.search_hits")
+        return cursor
 
-    def insert_log(self, log):
+    def insert_log(self, log, timestamp=None):
         cursor = self.get_cursor()
         try:
             cursor.execute('''
-            INSERT INTO logs (cluster_id, raw_data)
-            VALUES (?, ?)
+            INSERT INTO logs (cluster_id, timestamp, raw_data)
+            VALUES (?, ?, ?)
             ''', (
                 -1,  # Default cluster_id
+                timestamp,  # Parsed by the import, see time_window.log_timestamp
                 json.dumps(log),  # Store the entire log as JSON in raw_data
             ))
             return cursor.lastrowid
@@ -50,11 +151,56 @@ class DatabaseManager:
             print(f"Log data: {log}")
             raise
     
+    def get_untimed_log_page(self, after_id, limit):
+        # (id, raw_data) of the next logs without a timestamp, for databases imported before timestamps were parsed
+        cursor = self.get_cursor()
+        cursor.execute("SELECT id, raw_data FROM logs WHERE id > ? AND timestamp IS NULL ORDER BY id LIMIT ?",
+                       (after_id, limit))
+        return cursor.fetchall()
+
+    def update_log_timestamps(self, rows):
+        # rows: iterable of (timestamp, log_id); committed by the caller
+        cursor = self.get_cursor()
+        cursor.executemany("UPDATE logs SET timestamp = ? WHERE id = ?", rows)
+
+    def get_timestamp_range(self):
+        # (earliest, latest) log timestamp, both None when no log has one; two lookups on idx_logs_timestamp
+        cursor = self.get_cursor()
+        cursor.execute("SELECT MIN(timestamp), MAX(timestamp) FROM logs")
+        return cursor.fetchone()
+
+    def window_filter(self, window):
+        # SQL condition on the logs table aliased as l, and its params, selecting the logs of a normalized time
+        # window (see time_window.normalize_window); ("", ()) for all time. Logs without a timestamp are outside
+        # every window. The window is resolved once to the id range of its logs through idx_logs_timestamp, so
+        # the id-ordered keyset queries the stages page with only walk that range. Logs are usually imported in
+        # time order, which makes the range about as long as the window. Otherwise the range also holds logs of
+        # other times, which the timestamp conditions drop: the logs selected are the same, and at worst the
+        # pages walk every log once.
+        if not window:
+            return "", ()
+        conditions, params = [], []
+        if window['start'] is not None:
+            conditions.append("timestamp >= ?")
+            params.append(window['start'])
+        if window['end'] is not None:
+            conditions.append("timestamp < ?")
+            params.append(window['end'])
+        cursor = self.get_cursor()
+        cursor.execute("SELECT MIN(id), MAX(id) FROM logs WHERE " + " AND ".join(conditions), params)
+        first_id, last_id = cursor.fetchone()
+        if first_id is None:
+            return "0", ()
+        # The unary + keeps the planner on the rowid range instead of the timestamp index, which would return
+        # rows out of id order and need a sort per page
+        return (" AND ".join(["l.id BETWEEN ? AND ?"] + ["+l." + condition for condition in conditions]),
+                (first_id, last_id) + tuple(params))
+
     def check_embeddings_exist(self):
+        # EXISTS stops at the first match instead of counting every row
         cursor = self.get_cursor()
-        cursor.execute("SELECT COUNT(*) FROM logs WHERE embedding IS NOT NULL")
-        count = cursor.fetchone()[0]
-        return count > 0
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM logs WHERE embedding IS NOT NULL)")
+        return bool(cursor.fetchone()[0])
 
     def get_logs_without_embeddings(self):
         cursor = self.get_cursor()
@@ -71,6 +217,9 @@ class DatabaseManager:
             
             # Delete all existing clusters except -1
             cursor.execute("DELETE FROM clusters WHERE id != -1")
+            cursor.execute("DELETE FROM cluster_core_points")
+            cursor.execute("DELETE FROM clustering_runs")
+            cursor.execute("DELETE FROM cluster_summaries")
             
             # Ensure cluster -1 exists
             cursor.execute("INSERT OR IGNORE INTO clusters (id, name, color) VALUES (-1, 'Noise', '#808080')")
@@ -86,7 +235,19 @@ class DatabaseManager:
         try:
             # Delete all logs
             cursor.execute("DELETE FROM logs")
-            
+            cursor.execute("DELETE FROM logs_fts")
+            cursor.execute("DELETE FROM logs_fts_pending")
+
+            # Delete saved projections and embedding job checkpoints, they refer to the deleted logs
+            cursor.execute("DELETE FROM projection_points")
+            cursor.execute("DELETE FROM projections")
+            cursor.execute("DELETE FROM embedding_jobs")
+            cursor.execute("DELETE FROM ann_indexes")
+            cursor.execute("DELETE FROM cluster_core_points")
+            cursor.execute("DELETE FROM clustering_runs")
+            cursor.execute("DELETE FROM cluster_summaries")
+            cursor.execute("DELETE FROM stage_runs")
+
             # Delete all clusters except the default one (id = -1)
             cursor.execute("DELETE FROM clusters WHERE id != -1")
             
@@ -114,49 +275,395 @@ class DatabaseManager:
             logging.error(f"Error deleting coordinates: {e}")
             self.get_connection().rollback()
 
+    def clear_embeddings(self):
+        cursor = self.get_cursor()
+        try:
+            cursor.execute("UPDATE logs SET embedding = NULL, sentiment = NULL")
+            self.get_connection().commit()
+            logging.info("Embeddings cleared successfully.")
+        except Exception as e:
+            logging.error(f"Error clearing embeddings: {e}")
+            self.get_connection().rollback()
+
+    def delete_projections(self):
+        cursor = self.get_cursor()
+        try:
+            cursor.execute("DELETE FROM projection_points")
+            cursor.execute("DELETE FROM projections")
+            self.get_connection().commit()
+            logging.info("Saved projections deleted successfully.")
+        except Exception as e:
+            logging.error(f"Error deleting projections: {e}")
+            self.get_connection().rollback()
+
     def prepare_for_embedding_regeneration(self):
         try:
             self.reset_clusters()
             self.delete_coordinates()
+            self.delete_projections()
+            self.clear_embeddings()
             logging.info("Preparation for embedding regeneration completed.")
         except Exception as e:
             logging.error(f"Error during preparation for embedding regeneration: {e}")
 
 
-    def update_log_embedding(self, log_id, embedding):
+    def update_log_embeddings(self, rows):
+        # rows: iterable of (embedding, sentiment, log_id); committed by the caller
+        cursor = self.get_cursor()
+        cursor.executemany("UPDATE logs SET embedding = ?, sentiment = ? WHERE id = ?",
+                           [(embedding.tobytes(), sentiment, log_id) for embedding, sentiment, log_id in rows])
+
+    @staticmethod
+    def _embedded_filter(embedded):
+        # embedded: None = any log, False = only logs without an embedding, True = only logs with one
+        if embedded is None:
+            return ""
+        return " AND embedding IS NOT NULL" if embedded else " AND embedding IS NULL"
+
+    def count_logs_to_embed(self, after_id=0, embedded=None, where="", params=()):
+        # `where` is an extra SQL condition on the logs table aliased as l, e.g. a window_filter
+        cursor = self.get_cursor()
+        cursor.execute("SELECT COUNT(*) FROM logs l WHERE id > ? AND TRIM(COALESCE(preprocessed_text, '')) != ''"
+                       + self._embedded_filter(embedded) + (f" AND ({where})" if where else ""),
+                       (after_id,) + tuple(params))
+        return cursor.fetchone()[0]
+
+    def get_logs_to_embed(self, after_id, limit, embedded=None, where="", params=()):
+        cursor = self.get_cursor()
+        cursor.execute("SELECT id, preprocessed_text FROM logs l "
+                       "WHERE id > ? AND TRIM(COALESCE(preprocessed_text, '')) != ''"
+                       + self._embedded_filter(embedded) + (f" AND ({where})" if where else "")
+                       + " ORDER BY id LIMIT ?", (after_id,) + tuple(params) + (limit,))
+        return cursor.fetchall()
+
+    def get_preprocessed_text_fingerprint(self):
+        cursor = self.get_cursor()
+        cursor.execute("SELECT COUNT(preprocessed_text), MAX(id), TOTAL(LENGTH(preprocessed_text)) FROM logs")
+        count, max_id, total_length = cursor.fetchone()
+        return f"{count}:{max_id}:{int(total_length)}"
+
+    def create_embedding_job(self, model_name, config_hash, total_count, window=None):
+        cursor = self.get_cursor()
+        # Only one job can be resumed at a time, older unfinished ones are superseded
+        cursor.execute("UPDATE embedding_jobs SET status = 'abandoned' WHERE status IN ('running', 'cancelled')")
+        cursor.execute('''
+        INSERT INTO embedding_jobs (model_name, config_hash, status, total_count, time_window)
+        VALUES (?, ?, 'running', ?, ?)
+        ''', (model_name, config_hash, total_count, json.dumps(window) if window else None))
+        self.get_connection().commit()
+        return cursor.lastrowid
+
+    def get_resumable_embedding_job(self, model_name=None, config_hash=None):
+        cursor = self.get_cursor()
+        query = '''
+        SELECT id, model_name, config_hash, status, last_processed_id, processed_count, total_count, time_window
+        FROM embedding_jobs WHERE status IN ('running', 'cancelled')
+        '''
+        params = []
+        if model_name is not None:
+            query += " AND model_name = ?"
+            params.append(model_name)
+        if config_hash is not None:
+            query += " AND config_hash = ?"
+            params.append(config_hash)
+        cursor.execute(query + " ORDER BY id DESC LIMIT 1", params)
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        keys = ('id', 'model_name', 'config_hash', 'status', 'last_processed_id', 'processed_count', 'total_count',
+                'window')
+        job = dict(zip(keys, row))
+        job['window'] = json.loads(job['window']) if job['window'] else None
+        return job
+
+    def get_last_completed_embedding_job(self):
+        cursor = self.get_cursor()
+        cursor.execute('''
+        SELECT id, model_name, config_hash, embedding_dim FROM embedding_jobs
+        WHERE status = 'completed' ORDER BY id DESC LIMIT 1
+        ''')
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip(('id', 'model_name', 'config_hash', 'embedding_dim'), row))
+
+    def checkpoint_embedding_job(self, job_id, last_processed_id, processed_count, embedding_dim=None):
+        # Commits the pending embedding updates together with the checkpoint
+        cursor = self.get_cursor()
+        cursor.execute('''
+        UPDATE embedding_jobs
+        SET last_processed_id = ?, processed_count = ?, embedding_dim = COALESCE(?, embedding_dim),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+        ''', (last_processed_id, processed_count, embedding_dim, job_id))
+        self.get_connection().commit()
+
+    def save_embedding_model_state(self, job_id, data):
+        cursor = self.get_cursor()
+        cursor.execute("UPDATE embedding_jobs SET model_state = ? WHERE id = ?", (sqlite3.Binary(data), job_id))
+        self.get_connection().commit()
+
+    def get_embedding_model_state(self, job_id=None, model_name=None):
+        # The state of one job, or the latest one saved for the model: every job since the last full run of
+        # a model embeds with the state of that run
+        cursor = self.get_cursor()
+        if job_id is not None:
+            cursor.execute("SELECT model_state FROM embedding_jobs WHERE id = ?", (job_id,))
+        else:
+            cursor.execute("SELECT model_state FROM embedding_jobs WHERE model_name = ? AND model_state IS NOT NULL "
+                           "ORDER BY id DESC LIMIT 1", (model_name,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def set_embedding_job_status(self, job_id, status):
+        cursor = self.get_cursor()
+        cursor.execute("UPDATE embedding_jobs SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                       (status, job_id))
+        self.get_connection().commit()
+
+    def get_embedding_dim(self):
+        # Embeddings written since embedding jobs were introduced are float32 with a recorded dimension
+        cursor = self.get_cursor()
+        cursor.execute("SELECT embedding_dim FROM embedding_jobs WHERE embedding_dim IS NOT NULL "
+                       "ORDER BY id DESC LIMIT 1")
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def iter_embedding_chunks(self, where="", params=(), expected_dim=None, chunk_size=EMBEDDING_CHUNK_SIZE):
+        # Yields (ids, float32 matrix) chunks in id order, so callers can stream embeddings that do not fit
+        # in memory. Each chunk is its own keyset query, leaving the connection free for writes in between.
+        # `where` is an extra SQL condition on the logs table aliased as l.
+        # Blobs of dim float32 values are used as is. Blobs of dim float64 values, written before
+        # embeddings were stored as float32, are converted. Anything else is skipped.
+        cursor = self.get_cursor()
+        condition = "l.embedding IS NOT NULL" + (f" AND ({where})" if where else "")
+        dim = expected_dim or self.get_embedding_dim()
+        legacy_only = dim is None
+        if legacy_only:
+            cursor.execute(f"SELECT LENGTH(l.embedding) FROM logs l WHERE {condition} LIMIT 1", params)
+            row = cursor.fetchone()
+            if row is None or row[0] < 8:
+                return
+            dim = row[0] // 8
+        float32_bytes = dim * 4
+        float64_bytes = dim * 8
+
+        skipped = 0
+        last_id = -1
+        while True:
+            with span('db.read_embeddings') as read_span:
+                cursor.execute(f"SELECT l.id, l.embedding FROM logs l WHERE {condition} AND l.id > ? "
+                               f"ORDER BY l.id LIMIT ?", tuple(params) + (last_id, chunk_size))
+                rows = cursor.fetchall()
+                read_span.set(rows=len(rows))
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            chunk_ids, blobs = zip(*rows)
+            lengths = np.fromiter(map(len, blobs), dtype=np.int64, count=len(blobs))
+            if not legacy_only and (lengths == float32_bytes).all():
+                # Fast path: one buffer for the whole chunk
+                yield (np.array(chunk_ids, dtype=np.int64),
+                       np.frombuffer(b''.join(blobs), dtype=np.float32).reshape(-1, dim))
+                continue
+            ids = np.empty(len(rows), dtype=np.int64)
+            matrix = np.empty((len(rows), dim), dtype=np.float32)
+            filled = 0
+            for log_id, blob, length in zip(chunk_ids, blobs, lengths):
+                if length == float32_bytes and not legacy_only:
+                    matrix[filled] = np.frombuffer(blob, dtype=np.float32)
+                elif length == float64_bytes:
+                    matrix[filled] = np.frombuffer(blob, dtype=np.float64)
+                else:
+                    skipped += 1
+                    continue
+                ids[filled] = log_id
+                filled += 1
+            if filled:
+                yield ids[:filled], matrix[:filled]
+
+        if skipped:
+            logging.warning(f"Skipped {skipped} embeddings that are not {dim}-dimensional float32/float64 vectors.")
+
+    def count_embeddings(self, where="", params=()):
+        cursor = self.get_cursor()
+        condition = "l.embedding IS NOT NULL" + (f" AND ({where})" if where else "")
+        cursor.execute(f"SELECT COUNT(*) FROM logs l WHERE {condition}", params)
+        return cursor.fetchone()[0]
+
+    def load_embeddings(self, where="", params=(), expected_dim=None, chunk_size=EMBEDDING_CHUNK_SIZE):
+        # All matching embeddings as (ids, matrix), streamed into one preallocated float32 matrix
+        total = self.count_embeddings(where, params)
+        ids = None
+        filled = 0
+        for chunk_ids, chunk in self.iter_embedding_chunks(where, params, expected_dim, chunk_size):
+            if ids is None:
+                ids = np.empty(total, dtype=np.int64)
+                matrix = np.empty((total, chunk.shape[1]), dtype=np.float32)
+            stop = filled + len(chunk_ids)
+            ids[filled:stop] = chunk_ids
+            matrix[filled:stop] = chunk
+            filled = stop
+        if ids is None:
+            return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+        return ids[:filled], matrix[:filled]
+
+    def get_projection_id(self, params_key):
+        cursor = self.get_cursor()
+        cursor.execute("SELECT id FROM projections WHERE params_key = ?", (params_key,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def get_projections(self):
+        cursor = self.get_cursor()
+        cursor.execute('''
+        SELECT p.id, p.params, p.is_active, p.created_at, COUNT(pp.log_id)
+        FROM projections p
+        LEFT JOIN projection_points pp ON pp.projection_id = p.id
+        GROUP BY p.id
+        ORDER BY p.id
+        ''')
+        return cursor.fetchall()
+
+    def get_projection_fingerprint(self):
+        # Active projection and how many points it holds; placing new logs changes it
+        cursor = self.get_cursor()
+        cursor.execute('''
+        SELECT p.id, COUNT(pp.log_id) FROM projections p
+        LEFT JOIN projection_points pp ON pp.projection_id = p.id
+        WHERE p.is_active = 1 GROUP BY p.id
+        ''')
+        row = cursor.fetchone()
+        return f"{row[0]}:{row[1]}" if row else None
+
+    def get_active_projection_id(self):
+        cursor = self.get_cursor()
+        cursor.execute("SELECT id FROM projections WHERE is_active = 1 LIMIT 1")
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def save_projection(self, params_key, params, log_ids, coordinates):
         cursor = self.get_cursor()
         try:
-            logging.info(f"Updating log ID {log_id} with embedding.")
-            cursor.execute("UPDATE logs SET embedding = ? WHERE id = ?", (embedding.tobytes(), log_id))
+            projection_id = self.get_projection_id(params_key)
+            if projection_id is not None:
+                cursor.execute("DELETE FROM projection_points WHERE projection_id = ?", (projection_id,))
+                cursor.execute("UPDATE projections SET params = ?, created_at = CURRENT_TIMESTAMP WHERE id = ?",
+                               (params, projection_id))
+            else:
+                cursor.execute("INSERT INTO projections (params_key, params) VALUES (?, ?)", (params_key, params))
+                projection_id = cursor.lastrowid
+            cursor.executemany(
+                "INSERT INTO projection_points (projection_id, log_id, x, y, z) VALUES (?, ?, ?, ?, ?)",
+                ((projection_id, int(log_id), float(x), float(y), float(z))
+                 for log_id, (x, y, z) in zip(log_ids, coordinates)))
             self.get_connection().commit()
-            logging.info(f"Successfully updated log ID {log_id} with embedding.")
+            return projection_id
         except Exception as e:
-            logging.error(f"Error updating log ID {log_id}: {e}")
+            logging.error(f"Error saving projection: {e}")
+            self.get_connection().rollback()
+            raise
 
-    
-    def check_preprocessed_text_exists(self):
-        cursor = self.get_cursor()
-        cursor.execute("SELECT COUNT(*) FROM logs WHERE preprocessed_text IS NOT NULL AND preprocessed_text != ''")
-        count = cursor.fetchone()[0]
-        return count > 0
-    
-    def update_preprocessed_text(self, log_id, preprocessed_text):
+    def activate_projection(self, projection_id):
+        # Mirror the chosen projection into logs.tsne_x/y/z, which the visualization reads
         cursor = self.get_cursor()
         try:
-            cursor.execute("UPDATE logs SET preprocessed_text = ? WHERE id = ?", (preprocessed_text, log_id))
+            cursor.execute("UPDATE logs SET tsne_x = NULL, tsne_y = NULL, tsne_z = NULL")
+            cursor.execute('''
+            UPDATE logs SET tsne_x = pp.x, tsne_y = pp.y, tsne_z = pp.z
+            FROM projection_points pp
+            WHERE pp.projection_id = ? AND pp.log_id = logs.id
+            ''', (projection_id,))
+            cursor.execute("UPDATE projections SET is_active = (id = ?)", (projection_id,))
             self.get_connection().commit()
         except Exception as e:
-            print(f"Error updating preprocessed_text for log_id {log_id}: {e}")
+            logging.error(f"Error activating projection {projection_id}: {e}")
+            self.get_connection().rollback()
+            raise
+
+    def get_embedding_fingerprint(self):
+        # Changes whenever embeddings are added, removed or regenerated
+        cursor = self.get_cursor()
+        cursor.execute("SELECT COUNT(*), MAX(id), TOTAL(id) FROM logs WHERE embedding IS NOT NULL")
+        count, max_id, id_total = cursor.fetchone()
+        cursor.execute("SELECT MAX(id), MAX(updated_at) FROM embedding_jobs")
+        job_id, job_updated = cursor.fetchone()
+        return f"{count}:{max_id}:{int(id_total)}:{job_id}:{job_updated}"
+
+    def save_ann_index(self, metric, embedding_fingerprint, data):
+        cursor = self.get_cursor()
+        cursor.execute('''
+        INSERT OR REPLACE INTO ann_indexes (metric, embedding_fingerprint, data, created_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (metric, embedding_fingerprint, sqlite3.Binary(data)))
+        self.get_connection().commit()
 
-    def insert_preprocessed_log(self, log_id, preprocessed_data):
+    def load_ann_index(self, metric):
+        cursor = self.get_cursor()
+        cursor.execute("SELECT embedding_fingerprint, data FROM ann_indexes WHERE metric = ?", (metric,))
+        return cursor.fetchone()
+
+    def get_cluster_ids_for_logs(self, log_ids):
+        # Cluster ids aligned with a sorted array of embedded log ids
+        cursor = self.get_cursor()
+        cursor.execute("SELECT id, cluster_id FROM logs WHERE embedding IS NOT NULL ORDER BY id")
+        rows = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+        return rows[np.searchsorted(rows[:, 0], log_ids), 1]
+
+    def get_projection_coordinates(self, projection_id, log_ids):
+        # Coordinates of a saved projection aligned with a sorted array of log ids in it
+        cursor = self.get_cursor()
+        cursor.execute("SELECT log_id, x, y, z FROM projection_points WHERE projection_id = ? ORDER BY log_id",
+                       (projection_id,))
+        rows = np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, 4)
+        return rows[np.searchsorted(rows[:, 0], log_ids), 1:].astype(np.float32)
+
+    def add_projection_points(self, projection_id, log_ids, coordinates):
+        # Adds points to a saved projection without touching the points already in it
+        cursor = self.get_cursor()
         try:
-            # Assuming you have a table 'preprocessed_logs' with 'log_id' and 'data'
-            query = "INSERT INTO preprocessed_logs (log_id, data) VALUES (?, ?)"
-            self.conn.execute(query, (log_id, preprocessed_data))
-            self.conn.commit()
-            print(f"Inserted preprocessed data for log {log_id}")
+            rows = [(projection_id, int(log_id), float(x), float(y), float(z))
+                    for log_id, (x, y, z) in zip(log_ids, coordinates)]
+            cursor.executemany(
+                "INSERT OR REPLACE INTO projection_points (projection_id, log_id, x, y, z) VALUES (?, ?, ?, ?, ?)",
+                rows)
+            if projection_id == self.get_active_projection_id():
+                cursor.executemany("UPDATE logs SET tsne_x = ?, tsne_y = ?, tsne_z = ? WHERE id = ?",
+                                   [(x, y, z, log_id) for _, log_id, x, y, z in rows])
+            self.get_connection().commit()
         except Exception as e:
-            print(f"Error inserting preprocessed log {log_id}: {e}")
+            logging.error(f"Error adding points to projection {projection_id}: {e}")
+            self.get_connection().rollback()
+            raise
+
+    def check_preprocessed_text_exists(self):
+        cursor = self.get_cursor()
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM logs WHERE preprocessed_text IS NOT NULL "
+                       "AND preprocessed_text != '')")
+        return bool(cursor.fetchone()[0])
+    
+    def update_preprocessed_texts(self, rows):
+        # rows: iterable of (preprocessed_text, log_id); committed by the caller
+        cursor = self.get_cursor()
+        cursor.executemany("UPDATE logs SET preprocessed_text = ? WHERE id = ?", rows)
+
+    def count_logs(self, where="", params=()):
+        cursor = self.get_cursor()
+        cursor.execute("SELECT COUNT(*) FROM logs l" + (f" WHERE {where}" if where else ""), params)
+        return cursor.fetchone()[0]
+
+    def get_log_fingerprint(self):
+        cursor = self.get_cursor()
+        cursor.execute("SELECT COUNT(*), MAX(id) FROM logs")
+        count, max_id = cursor.fetchone()
+        return f"{count}:{max_id}"
+
+    def get_raw_log_page(self, after_id, limit, where="", params=()):
+        # (id, raw_data) of the next logs in id order
+        cursor = self.get_cursor()
+        cursor.execute("SELECT id, raw_data FROM logs l WHERE id > ?" + (f" AND ({where})" if where else "")
+                       + " ORDER BY id LIMIT ?", (after_id,) + tuple(params) + (limit,))
+        return cursor.fetchall()
 
     def get_sample_log(self):
         cursor = self.get_cursor()
@@ -183,30 +690,273 @@ class DatabaseManager:
         cursor.execute('SELECT id, cluster_id, tsne_x, tsne_y, tsne_z FROM logs WHERE tsne_x IS NOT NULL')
         return cursor.fetchall()
 
-    def create_cluster(self, name):
+    def start_cluster_staging(self):
+        # Labels of a new clustering are collected in a temp table, invisible to other connections,
+        # until swap_clusters publishes them
+        cursor = self.get_cursor()
+        cursor.execute("DROP TABLE IF EXISTS temp.staged_labels")
+        cursor.execute("CREATE TEMP TABLE staged_labels "
+                       "(log_id INTEGER PRIMARY KEY, label INTEGER NOT NULL, core INTEGER NOT NULL DEFAULT 0)")
+        self.get_connection().commit()
+
+    def stage_cluster_labels(self, log_ids, labels, core=None):
+        # Algorithm labels (-1 for noise) of a chunk of logs, core flags mark DBSCAN core points
         cursor = self.get_cursor()
-        color = self.generate_random_color()
-        cursor.execute('INSERT INTO clusters (name, color) VALUES (?, ?)', (name, color))
+        core = np.zeros(len(log_ids), dtype=bool) if core is None else core
+        cursor.executemany("INSERT OR REPLACE INTO temp.staged_labels (log_id, label, core) VALUES (?, ?, ?)",
+                           zip(map(int, log_ids), map(int, labels), map(int, core)))
         self.get_connection().commit()
+
+    def swap_clusters(self, algorithm, params, metric=None, models=None):
+        # Replaces the current clustering with the staged labels in one write transaction: clusters are
+        # inserted with deterministic colors, logs are relabeled through a join on the staged table and the
+        # run is recorded. Readers see either the old clustering or the new one, never a mix.
+        # models is an optional (labels, centroids, radii) triple; returns {label: cluster id}.
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("DELETE FROM clusters WHERE id != -1")
+            cursor.execute("DELETE FROM cluster_core_points")
+            cursor.execute("DELETE FROM clustering_runs")
+            cursor.execute("DELETE FROM cluster_summaries")
+            cursor.execute("INSERT OR IGNORE INTO clusters (id, name, color) VALUES (-1, 'Noise', '#808080')")
+
+            centroids, radii = {}, {}
+            if models is not None:
+                for label, centroid, radius in zip(*models):
+                    centroids[int(label)] = sqlite3.Binary(np.asarray(centroid, dtype=np.float32).tobytes())
+                    radii[int(label)] = float(radius)
+            cursor.execute("SELECT label, COUNT(*) FROM temp.staged_labels WHERE label != -1 "
+                           "GROUP BY label ORDER BY label")
+            cluster_ids = {}
+            for index, (label, size) in enumerate(cursor.fetchall()):
+                cursor.execute('INSERT INTO clusters (name, color, centroid, radius, size, metric) '
+                               'VALUES (?, ?, ?, ?, ?, ?)',
+                               (f'Cluster {label}', cluster_color(index), centroids.get(label), radii.get(label),
+                                size, metric))
+                cluster_ids[label] = cursor.lastrowid
+
+            cursor.execute("DROP TABLE IF EXISTS temp.cluster_map")
+            cursor.execute("CREATE TEMP TABLE cluster_map (label INTEGER PRIMARY KEY, cluster_id INTEGER NOT NULL)")
+            cursor.executemany("INSERT INTO temp.cluster_map (label, cluster_id) VALUES (?, ?)", cluster_ids.items())
+            cursor.execute("UPDATE logs SET cluster_id = -1 WHERE cluster_id != -1")
+            cursor.execute('''
+            UPDATE logs SET cluster_id = m.cluster_id
+            FROM temp.staged_labels s JOIN temp.cluster_map m ON m.label = s.label
+            WHERE logs.id = s.log_id
+            ''')
+            # Core points let logs embedded later join these clusters without a rerun
+            cursor.execute('''
+            INSERT INTO cluster_core_points (log_id, cluster_id)
+            SELECT s.log_id, m.cluster_id FROM temp.staged_labels s JOIN temp.cluster_map m ON m.label = s.label
+            WHERE s.core
+            ''')
+            self.insert_clustering_run(cursor, algorithm, params)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.execute("DROP TABLE IF EXISTS temp.staged_labels")
+            cursor.execute("DROP TABLE IF EXISTS temp.cluster_map")
+        logging.info(f"Swapped in {len(cluster_ids)} clusters from {algorithm}.")
+        return cluster_ids
+
+    def assign_clusters(self, log_ids, cluster_ids):
+        # Bulk assignment, committed by the caller
+        cursor = self.get_cursor()
+        cursor.executemany('UPDATE logs SET cluster_id = ? WHERE id = ?',
+                           zip(map(int, cluster_ids), map(int, log_ids)))
+
+    def get_cluster_centroids(self):
+        # (cluster ids, float32 centroid matrix, radii, metric) for clusters with a stored centroid
+        cursor = self.get_cursor()
+        cursor.execute('SELECT id, centroid, radius, metric FROM clusters '
+                       'WHERE centroid IS NOT NULL AND id != -1 ORDER BY id')
+        rows = cursor.fetchall()
+        if not rows:
+            return (np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32),
+                    np.empty(0, dtype=np.float32), None)
+        cluster_ids, blobs, radii, metrics = zip(*rows)
+        centroids = np.vstack([np.frombuffer(blob, dtype=np.float32) for blob in blobs])
+        return (np.array(cluster_ids, dtype=np.int64), centroids,
+                np.array([np.inf if radius is None else radius for radius in radii], dtype=np.float32),
+                metrics[0] or 'euclidean')
+
+    def get_core_point_clusters(self):
+        # (log ids, cluster ids) of the stored DBSCAN core points, sorted by log id
+        cursor = self.get_cursor()
+        cursor.execute("SELECT log_id, cluster_id FROM cluster_core_points ORDER BY log_id")
+        rows = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+        return rows[:, 0], rows[:, 1]
+
+    def insert_clustering_run(self, cursor, algorithm, params):
+        # Snapshot of what the run covered, the baseline for online assignment and recluster hints: the staged
+        # logs, which are the embeddings of the run's time window. Runs inside the caller's transaction.
+        cursor.execute("SELECT COALESCE(MAX(log_id), 0), COUNT(*), COALESCE(SUM(label = -1), 0) "
+                       "FROM temp.staged_labels")
+        max_log_id, log_count, noise_count = cursor.fetchone()
+        cursor.execute('''
+        INSERT INTO clustering_runs (algorithm, params, max_log_id, log_count, noise_count, last_assigned_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', (algorithm, json.dumps(params), max_log_id, log_count, noise_count, max_log_id))
         return cursor.lastrowid
-    
-    def get_cluster_log_counts(self):
+
+    def get_last_clustering_run(self):
+        cursor = self.get_cursor()
+        cursor.execute('''
+        SELECT id, algorithm, params, max_log_id, log_count, noise_count, last_assigned_id
+        FROM clustering_runs ORDER BY id DESC LIMIT 1
+        ''')
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        keys = ['id', 'algorithm', 'params', 'max_log_id', 'log_count', 'noise_count', 'last_assigned_id']
+        run = dict(zip(keys, row))
+        run['params'] = json.loads(run['params'])
+        return run
+
+    def get_clustering_fingerprint(self):
+        # Latest run and the labels as they are now, online assignment included
+        cursor = self.get_cursor()
+        cursor.execute("SELECT MAX(id) FROM clustering_runs")
+        run_id = cursor.fetchone()[0]
+        if run_id is None:
+            return None
+        cursor.execute("SELECT COUNT(*), TOTAL(cluster_id) FROM logs WHERE cluster_id IS NOT NULL")
+        count, label_total = cursor.fetchone()
+        return f"{run_id}:{count}:{int(label_total)}"
+
+    def set_last_assigned_id(self, run_id, last_assigned_id):
+        cursor = self.get_cursor()
+        cursor.execute("UPDATE clustering_runs SET last_assigned_id = ? WHERE id = ?", (last_assigned_id, run_id))
+        self.get_connection().commit()
+
+    def get_new_log_cluster_counts(self, max_log_id, where="", params=()):
+        # (embedded logs added after a clustering run, how many of them are still noise)
+        cursor = self.get_cursor()
+        cursor.execute("SELECT COUNT(*), COALESCE(SUM(cluster_id = -1), 0) FROM logs l "
+                       "WHERE embedding IS NOT NULL AND id > ?" + (f" AND ({where})" if where else ""),
+                       (max_log_id,) + tuple(params))
+        return cursor.fetchone()
+
+    def get_log_cluster_assignments(self):
+        # (log ids, cluster ids) of all embedded logs, sorted by log id
+        cursor = self.get_cursor()
+        cursor.execute("SELECT id, cluster_id FROM logs WHERE embedding IS NOT NULL ORDER BY id")
+        rows = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+        return rows[:, 0], rows[:, 1]
+
+    def iter_clustered_texts(self, chunk_size=EMBEDDING_CHUNK_SIZE):
+        # Yields (cluster ids, preprocessed texts) of clustered logs in keyset-paginated chunks
+        cursor = self.get_cursor()
+        last_id = -1
+        while True:
+            cursor.execute("SELECT id, cluster_id, preprocessed_text FROM logs "
+                           "WHERE id > ? AND cluster_id != -1 AND preprocessed_text IS NOT NULL "
+                           "ORDER BY id LIMIT ?", (last_id, chunk_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            yield [row[1] for row in rows], [row[2] for row in rows]
+
+    def get_preprocessed_text_sample(self, size):
+        cursor = self.get_cursor()
+        cursor.execute("SELECT preprocessed_text FROM logs WHERE cluster_id != -1 AND preprocessed_text IS NOT NULL "
+                       "ORDER BY RANDOM() LIMIT ?", (size,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def get_raw_data_sample(self, size):
+        cursor = self.get_cursor()
+        cursor.execute("SELECT raw_data FROM logs ORDER BY RANDOM() LIMIT ?", (size,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def get_field_value_counts(self, field):
+        # (cluster id, value, count) of a top-level raw_data field over clustered logs, most frequent first
+        path = '$."' + field.replace('"', '\\"') + '"'
         cursor = self.get_cursor()
         cursor.execute('''
-        SELECT c.id, c.name, c.color, COUNT(l.id) as log_count
+        SELECT cluster_id, json_extract(raw_data, ?) AS value, COUNT(*) AS value_count
+        FROM logs WHERE cluster_id != -1
+        GROUP BY cluster_id, value
+        ORDER BY cluster_id, value_count DESC
+        ''', (path,))
+        return cursor.fetchall()
+
+    def get_texts_for_logs(self, log_ids):
+        cursor = self.get_cursor()
+        placeholders = ','.join('?' * len(log_ids))
+        cursor.execute(f"SELECT id, preprocessed_text FROM logs WHERE id IN ({placeholders})", [int(i) for i in log_ids])
+        return dict(cursor.fetchall())
+
+    def save_cluster_summaries(self, summaries):
+        cursor = self.get_cursor()
+        cursor.execute("DELETE FROM cluster_summaries")
+        cursor.executemany('''
+        INSERT INTO cluster_summaries (cluster_id, size, medoid_log_id, centroid_log_id, exemplar_texts,
+                                       top_tokens, field_histograms)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [(summary['cluster_id'], summary['size'], summary['medoid_log_id'], summary['centroid_log_id'],
+               json.dumps(summary['exemplar_texts']), json.dumps(summary['top_tokens']),
+               json.dumps(summary['field_histograms'])) for summary in summaries])
+        self.get_connection().commit()
+
+    def get_cluster_summaries(self):
+        cursor = self.get_cursor()
+        cursor.execute('''
+        SELECT cluster_id, size, medoid_log_id, centroid_log_id, exemplar_texts, top_tokens, field_histograms
+        FROM cluster_summaries
+        ''')
+        summaries = {}
+        for cluster_id, size, medoid_log_id, centroid_log_id, exemplar_texts, top_tokens, field_histograms in cursor:
+            summaries[cluster_id] = {
+                'cluster_id': cluster_id,
+                'size': size,
+                'medoid_log_id': medoid_log_id,
+                'centroid_log_id': centroid_log_id,
+                'exemplar_texts': json.loads(exemplar_texts or '{}'),
+                'top_tokens': json.loads(top_tokens or '[]'),
+                'field_histograms': json.loads(field_histograms or '{}'),
+            }
+        return summaries
+
+    @staticmethod
+    def search_filter(search):
+        # Restricts a logs query to the hits of the last search_logs call
+        return " AND id IN (SELECT log_id FROM temp.search_hits)" if search else ""
+
+    def get_cluster_log_counts(self, search=False):
+        # Counts come from an index-only scan of idx_logs_cluster, log rows are not read. With search, only
+        # the last search's hits are counted and clusters without hits are left out.
+        cursor = self.get_cursor()
+        cursor.execute(f'''
+        SELECT c.id, c.name, c.color, COALESCE(n.log_count, 0) as log_count
         FROM clusters c
-        LEFT JOIN logs l ON c.id = l.cluster_id
-        GROUP BY c.id
+        {"JOIN" if search else "LEFT JOIN"} (SELECT cluster_id, COUNT(*) AS log_count FROM logs
+                   WHERE 1 {self.search_filter(search)} GROUP BY cluster_id) n ON n.cluster_id = c.id
         ORDER BY c.id
         ''')
         return cursor.fetchall()
 
-    def generate_random_color(self):
-        r = random.randint(100, 255)
-        g = random.randint(100, 255)
-        b = random.randint(100, 255)
-        
-        return "#{:02x}{:02x}{:02x}".format(r, g, b)
+    def get_log_page(self, cluster_id, after_id, limit, search=False):
+        # (id, raw_data) of the next logs of a cluster, keyset-paginated by id
+        cursor = self.get_cursor()
+        cursor.execute(f"SELECT id, raw_data FROM logs WHERE cluster_id = ? AND id > ? {self.search_filter(search)} "
+                       "ORDER BY id LIMIT ?", (cluster_id, after_id, limit))
+        return cursor.fetchall()
+
+    def get_log_position_in_cluster(self, cluster_id, log_id, search=False):
+        # Row of a log among its cluster's logs ordered by id, None when it is not in the cluster
+        cursor = self.get_cursor()
+        cursor.execute(f"SELECT 1 FROM logs WHERE id = ? AND cluster_id = ? {self.search_filter(search)}",
+                       (log_id, cluster_id))
+        if cursor.fetchone() is None:
+            return None
+        cursor.execute(f"SELECT COUNT(*) FROM logs WHERE cluster_id = ? AND id < ? {self.search_filter(search)}",
+                       (cluster_id, log_id))
+        return cursor.fetchone()[0]
 
     def get_cluster_color(self, cluster_id):
         cursor = self.get_cursor()
@@ -214,14 +964,48 @@ class DatabaseManager:
         result = cursor.fetchone()
         return result[0] if result else None
 
-    def assign_to_cluster(self, log_id, cluster_id):
+    def start_stage_run(self, stage, params, input_fingerprint):
+        cursor = self.get_cursor()
+        cursor.execute("INSERT INTO stage_runs (stage, params, input_fingerprint) VALUES (?, ?, ?)",
+                       (stage, json.dumps(params), input_fingerprint))
+        self.get_connection().commit()
+        return cursor.lastrowid
+
+    def finish_stage_run(self, run_id, status, output_fingerprint=None, result=None):
         cursor = self.get_cursor()
-        cursor.execute('UPDATE logs SET cluster_id = ? WHERE id = ?', (cluster_id, log_id))
+        cursor.execute('''
+        UPDATE stage_runs SET status = ?, output_fingerprint = ?, result = ?, finished_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+        ''', (status, output_fingerprint, json.dumps(result, default=str), run_id))
         self.get_connection().commit()
 
+    def get_stage_run(self, stage, input_fingerprint=None):
+        # Latest completed run of the stage, optionally only one with the given inputs
+        cursor = self.get_cursor()
+        query = '''
+        SELECT id, params, input_fingerprint, output_fingerprint, result, finished_at
+        FROM stage_runs WHERE stage = ? AND status = 'completed'
+        '''
+        params = [stage]
+        if input_fingerprint is not None:
+            query += " AND input_fingerprint = ?"
+            params.append(input_fingerprint)
+        cursor.execute(query + " ORDER BY id DESC LIMIT 1", params)
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        keys = ['id', 'params', 'input_fingerprint', 'output_fingerprint', 'result', 'finished_at']
+        run = dict(zip(keys, row))
+        run['params'] = json.loads(run['params'])
+        run['result'] = json.loads(run['result']) if run['result'] else None
+        return run
+
     def commit(self):
         self.get_connection().commit()
 
+    def rollback(self):
+        self.get_connection().rollback()
+
     def close(self):
         if hasattr(self._local, 'connection'):
             self._local.connection.close()
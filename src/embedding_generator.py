@@ -1,92 +1,247 @@
-from sentence_transformers import SentenceTransformer
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-from sklearn.manifold import TSNE
+import hashlib
+import json
 import numpy as np
-import torch
-from PyQt6.QtCore import QThread, pyqtSignal
-from .db_manager import DatabaseManager
+from .cancellation import CancellationToken
+from .instrumentation import span, counter
+from .progress import ProgressReporter
+from .lexical_embedding import LexicalEmbedder, LEXICAL_MODEL_NAME
 
-class EmbeddingGeneratorThread(QThread):
-    progress_update = pyqtSignal(int)
-    status_update = pyqtSignal(str)
+DEFAULT_EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+EMBEDDING_BATCH_SIZE = 64
+LEXICAL_BATCH_SIZE = 2048
+LEXICAL_FIT_ROWS = 100000
+CHECKPOINT_EVERY_BATCHES = 8
 
-    def __init__(self, db_path, model_name):
-        super().__init__()
-        self.db_path = db_path
+
+def embedding_batch_size(model_name):
+    return LEXICAL_BATCH_SIZE if model_name == LEXICAL_MODEL_NAME else EMBEDDING_BATCH_SIZE
+
+
+def embedding_config_hash(db_manager, model_name, only_missing=False, window=None, input_fingerprint=None):
+    # A checkpoint is only valid for the same model, settings, time window and preprocessed input. The input
+    # fingerprint scans the logs table, callers hashing several configs pass it in.
+    batch_size = embedding_batch_size(model_name)
+    config = {
+        'model_name': model_name,
+        'batch_size': batch_size,
+        'only_missing': only_missing,
+        'input': input_fingerprint or db_manager.get_preprocessed_text_fingerprint(),
+    }
+    if window:
+        config['window'] = window
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def find_resumable_job(db_manager, model_name, window=None):
+    # The interrupted job a run of this model and window would resume, with its only_missing setting; None
+    input_fingerprint = db_manager.get_preprocessed_text_fingerprint()
+    for only_missing in (False, True):
+        job = db_manager.get_resumable_embedding_job(
+            model_name, embedding_config_hash(db_manager, model_name, only_missing, window, input_fingerprint))
+        if job is not None:
+            return dict(job, only_missing=only_missing)
+    return None
+
+
+def resumable_job_only_missing(db_manager, job):
+    # Whether an interrupted job (see DatabaseManager.get_resumable_embedding_job) only embedded new logs
+    return job['config_hash'] == embedding_config_hash(db_manager, job['model_name'], True, job['window'])
+
+
+def read_embedding_options(db_manager, model_name, window=None):
+    # What the GUI asks about before embedding: an interrupted job to resume, or whether only the logs
+    # without an embedding can be added to the existing layout. Both scan the logs table, so they are
+    # read on a worker thread.
+    embeddings_exist = db_manager.check_embeddings_exist()
+    last_job = db_manager.get_last_completed_embedding_job()
+    return {
+        'model_name': model_name,
+        'window': window,
+        'job': find_resumable_job(db_manager, model_name, window),
+        'embeddings_exist': embeddings_exist,
+        'new_logs': db_manager.count_logs_to_embed(0, False, *db_manager.window_filter(window))
+        if embeddings_exist else 0,
+        'can_add_new_logs': (last_job is not None and last_job['model_name'] == model_name
+                             and db_manager.get_active_projection_id() is not None),
+    }
+
+
+class EmbeddingGenerator:
+    # Embeds preprocessed text in id-ordered batches with a resumable job checkpoint. generate() returns
+    # False when the cancel token stopped it; the job then resumes from its last checkpoint.
+    def __init__(self, model_name, resume=True, cancel_token=None, only_missing=False, progress=None, status=None,
+                 window=None):
         self.model_name = model_name
-        self.semantic_model = SentenceTransformer(self.model_name)
-        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-        self.sentiment_model = AutoModelForSequenceClassification.from_pretrained(self.model_name, num_labels=2)
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.semantic_model.to(self.device)
-        self.sentiment_model.to(self.device)
-
-    def run(self):
-        self.status_update.emit("Starting embedding generation...")
-        db_manager = DatabaseManager(self.db_path)
-        
-        # Prepare for embedding regeneration
-        self.status_update.emit("Preparing for embedding regeneration...")
-        db_manager.prepare_for_embedding_regeneration()
-
-        cursor = db_manager.get_cursor()
-
-        # Get all logs
-        cursor.execute("SELECT id, preprocessed_text FROM logs")
-        logs = [{'id': row[0], 'text': row[1]} for row in cursor.fetchall()]
-        total_logs = len(logs)
-        embeddings = []
-        log_ids = []
-
-        for i, log in enumerate(logs):
-            if log['text'] is None or log['text'].strip() == '':
-                self.status_update.emit(f"Skipping log {i+1} due to empty text")
-                continue
-
-            semantic_embedding = self.get_semantic_embedding(log['text'])
-            sentiment = self.get_sentiment(log['text'])
-            sentiment_value = 1 if sentiment['label'] == 'POSITIVE' else 0
-            combined_embedding = np.concatenate([semantic_embedding, np.array([sentiment_value])])
-            embeddings.append(combined_embedding)
-            log_ids.append(log['id'])
-            db_manager.update_log_embedding(log['id'], combined_embedding)
-            db_manager.get_cursor().execute("UPDATE logs SET sentiment = ? WHERE id = ?",
-                                            (sentiment_value, log['id']))
-            progress = int((i + 1) / total_logs * 50)  # First half of progress
-            self.progress_update.emit(progress)
-            self.status_update.emit(f"Generated embedding for log {i+1} of {total_logs}")
-
-        db_manager.get_connection().commit()
-
-        # Perform t-SNE
-        self.status_update.emit("Performing dimensionality reduction...")
-        tsne = TSNE(n_components=3, random_state=42)
-        reduced_embeddings = tsne.fit_transform(np.array(embeddings))
-
-        # Save reduced coordinates
-        for i, (x, y, z) in enumerate(reduced_embeddings):
-            cursor.execute("UPDATE logs SET tsne_x = ?, tsne_y = ?, tsne_z = ? WHERE id = ?",
-                           (float(x), float(y), float(z), log_ids[i]))
-            progress = 50 + int((i + 1) / total_logs * 50)  # Second half of progress
-            self.progress_update.emit(progress)
-            self.status_update.emit(f"Saved reduced coordinates for log {i+1} of {total_logs}")
-
-        db_manager.get_connection().commit()
-        db_manager.close()
-        self.status_update.emit("Embedding generation and dimensionality reduction completed!")
-
-    def get_semantic_embedding(self, text):
-        return self.semantic_model.encode(text, convert_to_numpy=True)
-
-    def get_sentiment(self, text):
-        encoded_input = self.tokenizer(text, truncation=True, max_length=512, return_tensors='pt', padding=True)
+        self.resume = resume
+        # only_missing embeds newly imported logs and keeps existing embeddings, clusters and layouts
+        self.only_missing = only_missing
+        # Only logs of the time window are embedded. Regenerating still clears every embedding, vectors of
+        # different runs may not share a model or basis.
+        self.window = window
+        self.cancel_token = cancel_token or CancellationToken()
+        self.batch_size = embedding_batch_size(model_name)
+        self.lexical = model_name == LEXICAL_MODEL_NAME
+        self.lexical_embedder = None
+        self.progress = progress or (lambda percent: None)
+        self.status = status or (lambda message: None)
+        if not self.lexical:
+            # Only the neural models need torch and transformers, lexical mode runs without them
+            import torch
+            from sentence_transformers import SentenceTransformer
+            from transformers import AutoTokenizer, AutoModelForSequenceClassification
+            self.torch = torch
+            self.semantic_model = SentenceTransformer(self.model_name)
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            self.sentiment_model = AutoModelForSequenceClassification.from_pretrained(self.model_name, num_labels=2)
+            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+            self.semantic_model.to(self.device)
+            self.sentiment_model.to(self.device)
+
+    def cancel(self):
+        self.cancel_token.cancel()
+
+    def generate(self, db_manager):
+        self.status("Starting embedding generation...")
+        if not self.generate_embeddings(db_manager):
+            return False
+        self.progress(100)
+        self.status("Embedding generation completed!")
+        return True
+
+    def generate_embeddings(self, db_manager):
+        config_hash = embedding_config_hash(db_manager, self.model_name, self.only_missing, self.window)
+        pending = False if self.only_missing else None
+        where, params = db_manager.window_filter(self.window)
+        job = db_manager.get_resumable_embedding_job(self.model_name, config_hash) if self.resume else None
+
+        if job is not None:
+            job_id = job['id']
+            last_id = job['last_processed_id']
+            processed = job['processed_count']
+            total_logs = job['total_count']
+            db_manager.set_embedding_job_status(job_id, 'running')
+            self.status(f"Resuming embedding job from checkpoint ({processed} of {total_logs} logs done)...")
+        else:
+            if not self.only_missing:
+                # Prepare for embedding regeneration
+                self.status("Preparing for embedding regeneration...")
+                db_manager.prepare_for_embedding_regeneration()
+            last_id = 0
+            processed = 0
+            total_logs = db_manager.count_logs_to_embed(embedded=pending, where=where, params=params)
+            job_id = db_manager.create_embedding_job(self.model_name, config_hash, total_logs, self.window)
+
+        if self.lexical and not self.prepare_lexical_embedder(db_manager, job_id, job is not None, where, params):
+            db_manager.set_embedding_job_status(job_id, 'cancelled')
+            self.status("Embedding cancelled while fitting the lexical model.")
+            return False
+
+        embedding_dim = None
+        batches_since_checkpoint = 0
+        reporter = ProgressReporter(self.progress, self.status, total_logs, "Generated embeddings for",
+                                    initial=processed)
+        while True:
+            if self.cancel_token.is_cancelled():
+                db_manager.checkpoint_embedding_job(job_id, last_id, processed, embedding_dim)
+                db_manager.set_embedding_job_status(job_id, 'cancelled')
+                self.status(f"Embedding cancelled after {processed} of {total_logs} logs. "
+                            "It will resume from the last checkpoint.")
+                return False
+
+            with span('embed.read') as read_span:
+                batch = db_manager.get_logs_to_embed(last_id, self.batch_size, pending, where, params)
+                read_span.set(rows=len(batch))
+            if not batch:
+                break
+
+            texts = [row[1] for row in batch]
+            with span('embed.forward', rows=len(texts)):
+                combined_embeddings, sentiment_values = self.embed_batch(texts)
+            embedding_dim = combined_embeddings.shape[1]
+
+            with span('embed.write', rows=len(batch)):
+                db_manager.update_log_embeddings(
+                    (embedding, sentiment, row[0])
+                    for embedding, sentiment, row in zip(combined_embeddings, sentiment_values, batch))
+            last_id = batch[-1][0]
+            processed += len(batch)
+            # Logs still waiting to be embedded
+            counter('embed.backlog', depth=total_logs - processed)
+
+            batches_since_checkpoint += 1
+            if batches_since_checkpoint >= CHECKPOINT_EVERY_BATCHES:
+                with span('embed.commit'):
+                    db_manager.checkpoint_embedding_job(job_id, last_id, processed, embedding_dim)
+                batches_since_checkpoint = 0
+
+            reporter.update(processed)
+
+        db_manager.checkpoint_embedding_job(job_id, last_id, processed, embedding_dim)
+        db_manager.set_embedding_job_status(job_id, 'completed')
+        return True
+
+    def prepare_lexical_embedder(self, db_manager, job_id, resumed, where="", params=()):
+        # A full run fits the SVD basis on the logs of its window. The basis is saved with the job, so a
+        # resumed job and later runs that only embed new logs reuse it and their vectors stay comparable
+        # with the stored ones.
+        state = db_manager.get_embedding_model_state(job_id=job_id) if resumed else None
+        if state is None and self.only_missing:
+            state = db_manager.get_embedding_model_state(model_name=self.model_name)
+        if state is not None:
+            self.status("Loading the lexical model of the stored embeddings...")
+            self.lexical_embedder = LexicalEmbedder.from_bytes(state)
+        elif not self.fit_lexical_embedder(db_manager, where, params):
+            return False
+        if not resumed or state is None:
+            db_manager.save_embedding_model_state(job_id, self.lexical_embedder.to_bytes())
+        return True
+
+    def fit_lexical_embedder(self, db_manager, where="", params=()):
+        # The sample is chosen by position in id order and the fit is deterministic. Embeddings written
+        # before the basis was saved with the job have no stored basis: new logs are then embedded with a
+        # basis refit on the logs that already have an embedding.
+        self.status("Fitting lexical model...")
+        self.lexical_embedder = LexicalEmbedder()
+        fit_set = True if self.only_missing else None
+        if self.only_missing:
+            where, params = "", ()
+        stride = max(1, -(-db_manager.count_logs_to_embed(0, fit_set, where, params) // LEXICAL_FIT_ROWS))
+        last_id = 0
+        while True:
+            if self.cancel_token.is_cancelled():
+                return False
+            with span('embed.read') as read_span:
+                batch = db_manager.get_logs_to_embed(last_id, self.batch_size, fit_set, where, params)
+                read_span.set(rows=len(batch))
+            if not batch:
+                break
+            with span('embed.fit', rows=len(batch[::stride])):
+                self.lexical_embedder.partial_fit([row[1] for row in batch[::stride]])
+            last_id = batch[-1][0]
+        with span('embed.fit_finalize'):
+            self.lexical_embedder.finalize()
+        return True
+
+    def embed_batch(self, texts):
+        if self.lexical:
+            # No sentiment model in lexical mode
+            return self.lexical_embedder.transform(texts), [None] * len(texts)
+        semantic_embeddings = self.get_semantic_embeddings(texts)
+        sentiment_values = self.get_sentiments(texts)
+        # Stored as float32 so a resumed job can reload what earlier runs wrote
+        combined_embeddings = np.hstack([semantic_embeddings,
+                                         sentiment_values[:, None]]).astype(np.float32)
+        return combined_embeddings, [int(value) for value in sentiment_values]
+
+    def get_semantic_embeddings(self, texts):
+        return self.semantic_model.encode(texts, convert_to_numpy=True, batch_size=EMBEDDING_BATCH_SIZE)
+
+    def get_sentiments(self, texts):
+        encoded_input = self.tokenizer(texts, truncation=True, max_length=512, return_tensors='pt', padding=True)
         encoded_input = {k: v.to(self.device) for k, v in encoded_input.items()}
-        
-        with torch.no_grad():
+
+        with self.torch.no_grad():
             output = self.sentiment_model(**encoded_input)
-        
-        predicted_class = output.logits.argmax().item()
-        score = torch.softmax(output.logits, dim=1)[0, predicted_class].item()
-        
-        label = 'POSITIVE' if predicted_class == 1 else 'NEGATIVE'
-        return {'label': label, 'score': score}
\ No newline at end of file
+
+        # 1 = POSITIVE, 0 = NEGATIVE
+        return output.logits.argmax(dim=1).cpu().numpy().astype(np.float32)
@@ -1,36 +1,53 @@
 import json
 import jsonlines
 import os
-from PyQt6.QtCore import QThread, pyqtSignal
-from .db_manager import DatabaseManager
-
-class ImportThread(QThread):
-    progress_update = pyqtSignal(int)
-    status_update = pyqtSignal(str)
-    common_fields_found = pyqtSignal(list)  # Signal to emit common fields
-
-    def __init__(self, file_paths, db_path):
-        super().__init__()
-        self.file_paths = file_paths
-        self.db_path = db_path
-        self.common_fields = None  # To store the common fields
-    
-    def run(self):
-        db_manager = DatabaseManager(self.db_path)
-        db_manager.create_tables()
-        total_files = len(self.file_paths)
-        total_logs_processed = 0
-        total_logs_inserted = 0
-        first_log = True
-        common_fields = []
-
-        for file_index, file_path in enumerate(self.file_paths):
-            self.status_update.emit(f"Processing file {file_index + 1} of {total_files}: {os.path.basename(file_path)}")
-            try:
-                logs = self.parse_log_file(file_path)
-                self.status_update.emit(f"Parsed {len(logs)} logs from file")
+from .cancellation import CancellationToken, OperationCancelled
+from .instrumentation import span
+from .progress import ProgressReporter
+from .time_window import log_timestamp
+
+# Files picked up when importing a folder
+LOG_FILE_EXTENSIONS = ('.log', '.json', '.jsonl')
+
+
+# Logs inserted between two checks of the cancel token
+IMPORT_CANCEL_CHECK_EVERY = 1000
+TIMESTAMP_BACKFILL_BATCH_SIZE = 5000
+
+
+def import_logs(db_manager, file_paths, progress=None, status=None, cancel_token=None):
+    # Inserts every log of the given files with its parsed timestamp, committing per file. Returns counts and
+    # the fields present in all logs, in the order of the first log. Cancelling leaves the logs of the current
+    # file uncommitted.
+    progress = progress or (lambda percent: None)
+    status = status or (lambda message: None)
+    cancel_token = cancel_token or CancellationToken()
+    db_manager.create_tables()
+    backfill_timestamps(db_manager, status)
+    total_files = len(file_paths)
+    total_logs_processed = 0
+    total_logs_inserted = 0
+    total_logs_timestamped = 0
+    first_log = True
+    common_fields = []
 
+    for file_index, file_path in enumerate(file_paths):
+        cancel_token.raise_if_cancelled()
+        status(f"Processing file {file_index + 1} of {total_files}: {os.path.basename(file_path)}")
+        try:
+            with span('import.parse', file=os.path.basename(file_path)) as parse_span:
+                logs = parse_log_file(file_path, status)
+                parse_span.set(rows=len(logs))
+            status(f"Parsed {len(logs)} logs from file")
+
+            # The file's share of the progress bar fills in as its logs are inserted
+            reporter = ProgressReporter(progress, status, len(logs), f"Imported {os.path.basename(file_path)}:",
+                                        start=file_index * 100 / total_files,
+                                        end=(file_index + 1) * 100 / total_files)
+            with span('import.write', rows=len(logs)):
                 for log_index, log in enumerate(logs):
+                    if log_index % IMPORT_CANCEL_CHECK_EVERY == 0:
+                        cancel_token.raise_if_cancelled()
                     try:
                         if first_log:
                             common_fields = list(log.keys())  # Initialize with the first log's keys, preserving order
@@ -38,58 +55,100 @@ class ImportThread(QThread):
                         else:
                             # Update common_fields to keep only fields present in all logs, preserving order
                             common_fields = [field for field in common_fields if field in log]
-                        
-                        log_id = db_manager.insert_log(log)
+
+                        timestamp = log_timestamp(log)
+                        log_id = db_manager.insert_log(log, timestamp)
                         if log_id:
                             total_logs_inserted += 1
+                            total_logs_timestamped += timestamp is not None
                         total_logs_processed += 1
-
-                        if log_index % 100 == 0:  # Update status every 100 logs
-                            self.status_update.emit(f"Processed {log_index + 1} logs in current file")
+                        reporter.update(log_index + 1)
 
                     except Exception as e:
-                        self.status_update.emit(f"Error processing log in file {file_path}, index {log_index}: {str(e)}")
+                        status(f"Error processing log in file {file_path}, index {log_index}: {str(e)}")
 
-                progress = int((file_index * 100 + (log_index + 1) / len(logs) * 100) / total_files)
-                self.progress_update.emit(progress)
+            progress(int((file_index + 1) * 100 / total_files))
+            with span('import.commit'):
                 db_manager.commit()
-                self.status_update.emit(f"Committed changes for file {file_index + 1}")
-
-            except Exception as e:
-                self.status_update.emit(f"Error processing file {file_path}: {str(e)}")
-
-        db_manager.close()
-
-        # Emit the common fields (now ordered)
-        self.common_fields_found.emit(common_fields)
-        self.status_update.emit(f"Import completed. Processed {total_logs_processed} logs, inserted {total_logs_inserted} logs.")
-
-    def parse_log_file(self, file_path):
-        _, file_extension = os.path.splitext(file_path)
-        
-        if file_extension.lower() in ('.json', '.jsonl'):
-            return self.parse_json_logs(file_path)
-        elif file_extension.lower() in ('.log', '.txt'):
-            return self.parse_text_logs(file_path)
-        else:
-            raise ValueError(f"Unsupported file format: {file_extension}")
-
-    def parse_json_logs(self, file_path):
-        logs = []
-        with jsonlines.open(file_path) as reader:
-            for log in reader:
+            status(f"Committed changes for file {file_index + 1}")
+            db_manager.sync_search_index()
+
+        except OperationCancelled:
+            raise
+        except Exception as e:
+            status(f"Error processing file {file_path}: {str(e)}")
+
+    status(f"Import completed. Processed {total_logs_processed} logs, inserted {total_logs_inserted} logs, "
+           f"{total_logs_timestamped} with a timestamp.")
+    return {'processed': total_logs_processed, 'inserted': total_logs_inserted,
+            'timestamped': total_logs_timestamped, 'common_fields': common_fields}
+
+
+def backfill_timestamps(db_manager, status=None):
+    # Logs imported before timestamps were parsed have none, which leaves them outside every time window. They
+    # are parsed once: when the first log lacks a timestamp that its raw_data has. Returns the logs updated.
+    status = status or (lambda message: None)
+    sample = db_manager.get_sample_log()
+    if sample is None or sample[2] is not None or log_timestamp(json.loads(sample[3])) is None:
+        return 0
+    status("Reading the timestamps of previously imported logs...")
+    updated = 0
+    last_id = 0
+    with span('import.backfill_timestamps') as backfill_span:
+        while True:
+            logs = db_manager.get_untimed_log_page(last_id, TIMESTAMP_BACKFILL_BATCH_SIZE)
+            if not logs:
+                break
+            rows = [(timestamp, log_id) for timestamp, log_id in
+                    ((log_timestamp(json.loads(raw_data)), log_id) for log_id, raw_data in logs)
+                    if timestamp is not None]
+            db_manager.update_log_timestamps(rows)
+            updated += len(rows)
+            last_id = logs[-1][0]
+        db_manager.commit()
+        backfill_span.set(rows=updated)
+    status(f"Read the timestamps of {updated} previously imported logs.")
+    return updated
+
+
+def find_log_files(folder_path):
+    file_paths = []
+    for root, dirs, files in os.walk(folder_path):
+        for file in files:
+            if file.endswith(LOG_FILE_EXTENSIONS):
+                file_paths.append(os.path.join(root, file))
+    return file_paths
+
+
+def parse_log_file(file_path, status=None):
+    _, file_extension = os.path.splitext(file_path)
+
+    if file_extension.lower() in ('.json', '.jsonl'):
+        return parse_json_logs(file_path)
+    elif file_extension.lower() in ('.log', '.txt'):
+        return parse_text_logs(file_path, status)
+    else:
+        raise ValueError(f"Unsupported file format: {file_extension}")
+
+
+def parse_json_logs(file_path):
+    logs = []
+    with jsonlines.open(file_path) as reader:
+        for log in reader:
+            logs.append(log)
+    return logs
+
+
+def parse_text_logs(file_path, status=None):
+    status = status or (lambda message: None)
+    logs = []
+    with open(file_path, 'r') as file:
+        for line_index, line in enumerate(file, start=1):
+            try:
+                log = json.loads(line.strip())
                 logs.append(log)
-        return logs
-
-    def parse_text_logs(self, file_path):
-        logs = []
-        with open(file_path, 'r') as file:
-            for line_index, line in enumerate(file, start=1):
-                try:
-                    log = json.loads(line.strip())
-                    logs.append(log)
-                except json.JSONDecodeError:
-                    # Emit a status update with the line number instead of the full line
-                    truncated_line = (line.strip()[:75] + '...') if len(line) > 75 else line.strip()
-                    self.status_update.emit(f"Error parsing line {line_index}: {truncated_line}")
-        return logs
+            except json.JSONDecodeError:
+                # Report the line number instead of the full line
+                truncated_line = (line.strip()[:75] + '...') if len(line) > 75 else line.strip()
+                status(f"Error parsing line {line_index}: {truncated_line}")
+    return logs
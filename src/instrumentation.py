@@ -0,0 +1,163 @@
+import json
+import os
+import resource
+import threading
+import time
+
+# Setting this to a file path records a trace from startup and writes it there on exit (GUI and CLI)
+TRACE_ENV_VAR = 'CRYSTALIZE_TRACE'
+
+
+class Span:
+    # A timed section of one thread. Arguments given at the start or added with set() end up in the trace;
+    # a 'rows' argument is summed up for the rows/s of the summary.
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.add_span(self.name, self.start, end, self.args)
+        return False
+
+
+class NullSpan:
+    # Returned while tracing is off, so instrumented code needs no checks of its own
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+    # Collects spans and counters of all threads in memory, exported as a Chrome / Perfetto trace
+    # (chrome://tracing, ui.perfetto.dev) or summarized per span name. Off by default; while off, span() and
+    # counter() return immediately.
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.events = []
+        self.thread_names = {}
+        self.origin = time.perf_counter()
+
+    def enable(self):
+        with self.lock:
+            self.events = []
+            self.thread_names = {}
+            self.origin = time.perf_counter()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+    def counter(self, name, **values):
+        if not self.enabled:
+            return
+        self.add_event({'name': name, 'ph': 'C', 'ts': self.timestamp(time.perf_counter()), 'args': values})
+
+    def sample_memory(self):
+        if not self.enabled:
+            return
+        # ru_maxrss is in KiB on Linux
+        self.counter('memory', max_rss_mb=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1))
+
+    def timestamp(self, seconds):
+        return round((seconds - self.origin) * 1e6, 1)
+
+    def add_span(self, name, start, end, args):
+        self.add_event({'name': name, 'cat': name.split('.')[0], 'ph': 'X', 'ts': self.timestamp(start),
+                        'dur': round((end - start) * 1e6, 1), 'args': args})
+
+    def add_event(self, event):
+        thread = threading.current_thread()
+        event['pid'] = os.getpid()
+        event['tid'] = thread.ident
+        with self.lock:
+            self.thread_names.setdefault(thread.ident, thread.name)
+            self.events.append(event)
+
+    def chrome_trace(self):
+        with self.lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}}
+                    for tid, name in thread_names.items()]
+        return {'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, path):
+        with open(path, 'w') as trace_file:
+            json.dump(self.chrome_trace(), trace_file, default=str)
+
+    def summary(self):
+        # One row per span name in order of total time: calls, total and max time, rows, rows/s and the
+        # average rows per call (the batch size for batch spans)
+        rows = {}
+        with self.lock:
+            events = list(self.events)
+        for event in events:
+            if event['ph'] != 'X':
+                continue
+            row = rows.setdefault(event['name'], {'name': event['name'], 'calls': 0, 'seconds': 0.0,
+                                                  'max_ms': 0.0, 'rows': 0})
+            row['calls'] += 1
+            row['seconds'] += event['dur'] / 1e6
+            row['max_ms'] = max(row['max_ms'], event['dur'] / 1e3)
+            row['rows'] += event['args'].get('rows', 0) or 0
+        for row in rows.values():
+            row['rows_per_second'] = round(row['rows'] / row['seconds'], 1) if row['rows'] and row['seconds'] else None
+            row['rows_per_call'] = round(row['rows'] / row['calls'], 1) if row['rows'] else None
+            row['seconds'] = round(row['seconds'], 6)
+            row['max_ms'] = round(row['max_ms'], 3)
+        return sorted(rows.values(), key=lambda row: row['seconds'], reverse=True)
+
+    def peak_rss_mb(self):
+        with self.lock:
+            values = [event['args']['max_rss_mb'] for event in self.events
+                      if event['ph'] == 'C' and event['name'] == 'memory']
+        return max(values) if values else None
+
+
+TRACER = Tracer()
+
+
+def span(name, **args):
+    return TRACER.span(name, **args)
+
+
+def counter(name, **values):
+    TRACER.counter(name, **values)
+
+
+def sample_memory():
+    TRACER.sample_memory()
+
+
+def enable_from_environment():
+    # Returns the trace path from CRYSTALIZE_TRACE, with tracing enabled, or None
+    path = os.environ.get(TRACE_ENV_VAR)
+    if path:
+        TRACER.enable()
+    return path
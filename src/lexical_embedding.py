@@ -0,0 +1,149 @@
+import io
+import numpy as np
+
+LEXICAL_MODEL_NAME = 'crystalize/lexical-hashing-svd'
+# Byte n-grams and word n-grams hashed into the sketch
+CHAR_NGRAMS = (3, 4)
+WORD_NGRAMS = (1, 2)
+# Bytes of a token past this position share the hash multiplier of the last one
+MAX_TOKEN_POSITION = 64
+# Bytes that are part of a word, like the \w+ tokens of sklearn's HashingVectorizer; every non-ASCII byte counts
+WORD_BYTES = np.zeros(256, dtype=bool)
+WORD_BYTES[[ord(char) for char in '0123456789_abcdefghijklmnopqrstuvwxyz']] = True
+WORD_BYTES[128:] = True
+SEPARATOR = b'\n'
+
+
+def mix(hashes):
+    # splitmix64 finalizer: spreads linear n-gram hashes over all 64 bits before taking buckets and signs
+    hashes = (hashes ^ (hashes >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    hashes = (hashes ^ (hashes >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+class LexicalEmbedder:
+    # Non-neural embedding: char and word n-grams are hashed straight into a signed count sketch, which is a
+    # sparse random projection of the n-gram counts that never materializes the n-gram space, and reduced to a
+    # dense vector by a streaming truncated SVD. The Gram matrix of the sketches is accumulated, so fitting
+    # needs one pass and bounded memory. Hashing runs in numpy over the bytes of a whole batch.
+    def __init__(self, n_components=256, sketch_size=1024, random_state=42):
+        rng = np.random.default_rng(random_state)
+        self.n_components = n_components
+        self.sketch_size = sketch_size
+        self.random_state = random_state
+        # Odd multipliers per byte position of an n-gram or token, and per token of a word n-gram
+        self.char_multipliers = rng.integers(1, 2 ** 63, max(CHAR_NGRAMS), dtype=np.uint64) * 2 + 1
+        self.token_multipliers = rng.integers(1, 2 ** 63, MAX_TOKEN_POSITION, dtype=np.uint64) * 2 + 1
+        self.word_multipliers = rng.integers(1, 2 ** 63, max(WORD_NGRAMS), dtype=np.uint64) * 2 + 1
+        self.gram = np.zeros((sketch_size, sketch_size), dtype=np.float64)
+        self.components = None
+
+    def sketch(self, texts):
+        # Lowercased UTF-8 bytes of the batch, one separator after each text
+        data = [text.lower().encode('utf-8') + SEPARATOR for text in texts]
+        codes = np.frombuffer(b''.join(data), dtype=np.uint8)
+        ends = np.cumsum(np.fromiter(map(len, data), dtype=np.int64, count=len(data)))
+        doc_of_byte = np.repeat(np.arange(len(texts)), np.diff(ends, prepend=0))
+        sketched = (self.normalized(self.char_counts(codes, doc_of_byte, len(texts)))
+                    + self.normalized(self.word_counts(codes, doc_of_byte, len(texts))))
+        return sketched.astype(np.float32)
+
+    def char_counts(self, codes, doc_of_byte, n_docs):
+        values = codes.astype(np.uint64) + np.uint64(1)
+        separators = np.concatenate([[0], np.cumsum(codes == SEPARATOR[0])])
+        docs, hashes = [], []
+        for n in range(CHAR_NGRAMS[0], CHAR_NGRAMS[1] + 1):
+            count = len(codes) - n + 1
+            if count <= 0:
+                continue
+            ngram = np.zeros(count, dtype=np.uint64)
+            for offset in range(n):
+                ngram += values[offset:offset + count] * self.char_multipliers[offset]
+            # n-grams spanning a separator would join the end of one text with the next
+            valid = separators[n:n + count] == separators[:count]
+            docs.append(doc_of_byte[:count][valid])
+            hashes.append(ngram[valid] + np.uint64(n))
+        return self.bucket_counts(docs, hashes, n_docs, seed=1)
+
+    def word_counts(self, codes, doc_of_byte, n_docs):
+        is_word = WORD_BYTES[codes]
+        edges = np.diff(np.concatenate([[False], is_word, [False]]).astype(np.int8))
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        if len(starts) == 0:
+            return self.bucket_counts([], [], n_docs, seed=2)
+        # A token's hash is the sum of its bytes times a multiplier per position within the token
+        word_positions = np.flatnonzero(is_word)
+        token_of_byte = np.cumsum(edges[:-1] == 1) - 1
+        position = np.minimum(word_positions - starts[token_of_byte[word_positions]], MAX_TOKEN_POSITION - 1)
+        weighted = (codes[word_positions].astype(np.uint64) + np.uint64(1)) * self.token_multipliers[position]
+        tokens = np.add.reduceat(weighted, np.concatenate([[0], np.cumsum(ends - starts)[:-1]]))
+        token_docs = doc_of_byte[starts]
+        docs, hashes = [], []
+        for n in range(WORD_NGRAMS[0], WORD_NGRAMS[1] + 1):
+            count = len(tokens) - n + 1
+            if count <= 0:
+                continue
+            ngram = np.zeros(count, dtype=np.uint64)
+            for offset in range(n):
+                ngram += tokens[offset:offset + count] * self.word_multipliers[offset]
+            valid = token_docs[n - 1:n - 1 + count] == token_docs[:count]
+            docs.append(token_docs[:count][valid])
+            hashes.append(ngram[valid] + np.uint64(n))
+        return self.bucket_counts(docs, hashes, n_docs, seed=2)
+
+    def bucket_counts(self, docs, hashes, n_docs, seed):
+        # Each n-gram adds +1 or -1 to one bucket of its text's sketch, both picked by the hash
+        if not docs:
+            return np.zeros((n_docs, self.sketch_size), dtype=np.float64)
+        docs, hashes = np.concatenate(docs), np.concatenate(hashes)
+        mixed = mix(hashes ^ mix(np.full(1, self.random_state * 4 + seed, dtype=np.uint64)))
+        buckets = (mixed >> np.uint64(32)) % np.uint64(self.sketch_size)
+        signs = 1.0 - 2.0 * ((mixed >> np.uint64(31)) & np.uint64(1))
+        counts = np.bincount(docs * self.sketch_size + buckets.astype(np.int64), weights=signs,
+                             minlength=n_docs * self.sketch_size)
+        return counts.reshape(n_docs, self.sketch_size)
+
+    @staticmethod
+    def normalized(counts):
+        norms = np.linalg.norm(counts, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return counts / norms
+
+    def partial_fit(self, texts):
+        sketched = self.sketch(texts)
+        self.gram += sketched.T @ sketched
+        self.components = None
+
+    def finalize(self):
+        eigenvalues, eigenvectors = np.linalg.eigh(self.gram)
+        order = np.argsort(eigenvalues)[::-1][:self.n_components]
+        components = eigenvectors[:, order]
+        # Fix the sign of each singular vector so refits over the same data are identical
+        signs = np.sign(components[np.abs(components).argmax(axis=0), np.arange(components.shape[1])])
+        signs[signs == 0] = 1
+        self.components = (components * signs).astype(np.float32)
+
+    def to_bytes(self):
+        # The hash multipliers follow from random_state, only the basis is stored
+        if self.components is None:
+            self.finalize()
+        buffer = io.BytesIO()
+        np.savez(buffer, components=self.components, random_state=np.array(self.random_state))
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        stored = np.load(io.BytesIO(data))
+        components = stored['components']
+        embedder = cls(n_components=components.shape[1], sketch_size=components.shape[0],
+                       random_state=int(stored['random_state']))
+        embedder.components = components
+        return embedder
+
+    def transform(self, texts):
+        if self.components is None:
+            self.finalize()
+        reduced = self.sketch(texts) @ self.components
+        norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return (reduced / norms).astype(np.float32)
@@ -0,0 +1,144 @@
+import heapq
+import numpy as np
+
+NODE_SAMPLE_GRID = 16
+# At most one representative per grid cell, so a node holds up to 16^3 points
+NODE_CAPACITY = NODE_SAMPLE_GRID ** 3
+MAX_DEPTH = 12
+# A node is refined while its sample grid spacing on screen exceeds this many pixels
+REFINE_SPACING_PIXELS = 2.0
+
+
+class PointOctree:
+    # Level-of-detail octree over the normalized points of the 3D view. Every node keeps a spatially even
+    # subsample of the points below it (one point per cell of a 16^3 grid, picked at random), and the points
+    # not sampled are passed on to its children, so each point is stored exactly once. Drawing a node and all
+    # its ancestors shows a progressively denser version of the scene.
+    #
+    # build() returns a permutation; callers reorder their arrays with it so that points are sorted by node and,
+    # within a node, by cluster. Every (node, cluster) pair is then one contiguous range of the vertex buffers.
+    def __init__(self, max_depth=MAX_DEPTH, random_state=42):
+        self.max_depth = max_depth
+        self.random_state = random_state
+        self.centers = None
+        self.half_sizes = None
+        self.children = []
+        self.node_offsets = None
+        self.segment_nodes = None
+        self.segment_starts = None
+        self.segment_counts = None
+        self.cluster_segments = {}
+
+    def build(self, points, clusters):
+        points = np.asarray(points, dtype=np.float64)
+        clusters = np.asarray(clusters, dtype=np.int64)
+        rng = np.random.default_rng(self.random_state)
+        # Points are visited in a random order, so the first point in a grid cell is a random pick
+        priority = rng.permutation(len(points))
+
+        low, high = points.min(axis=0), points.max(axis=0)
+        center = (low + high) / 2
+        half_size = max(float((high - low).max()) / 2, 1e-9)
+
+        centers, half_sizes, children, node_points = [], [], [], []
+        # Breadth-first, so node ids grow with depth and coarse nodes come first in the buffers
+        queue = [(priority, center, half_size, 0, -1, 0)]
+        while queue:
+            next_queue = []
+            for indices, center, half_size, depth, parent, octant in queue:
+                node = len(centers)
+                centers.append(center)
+                half_sizes.append(half_size)
+                children.append([])
+                if parent >= 0:
+                    children[parent].append(node)
+                if len(indices) <= NODE_CAPACITY or depth == self.max_depth:
+                    node_points.append(indices)
+                    continue
+                local = points[indices]
+                cells = np.clip(((local - (center - half_size)) / (2 * half_size) * NODE_SAMPLE_GRID).astype(np.int64),
+                                0, NODE_SAMPLE_GRID - 1)
+                keys = (cells[:, 0] * NODE_SAMPLE_GRID + cells[:, 1]) * NODE_SAMPLE_GRID + cells[:, 2]
+                _, first = np.unique(keys, return_index=True)
+                sampled = np.zeros(len(indices), dtype=bool)
+                sampled[first] = True
+                node_points.append(indices[sampled])
+
+                rest, local = indices[~sampled], local[~sampled]
+                octants = ((local[:, 0] > center[0]).astype(np.int64) * 4 + (local[:, 1] > center[1]) * 2
+                           + (local[:, 2] > center[2]))
+                child_half = half_size / 2
+                for child_octant in np.unique(octants):
+                    offset = np.array([(child_octant >> 2) & 1, (child_octant >> 1) & 1, child_octant & 1]) * 2 - 1
+                    next_queue.append((rest[octants == child_octant], center + offset * child_half, child_half,
+                                       depth + 1, node, child_octant))
+            queue = next_queue
+
+        self.centers = np.array(centers)
+        self.half_sizes = np.array(half_sizes)
+        self.children = children
+
+        # Within a node, points are sorted by cluster
+        order = np.concatenate([indices[np.argsort(clusters[indices], kind='stable')] for indices in node_points])
+        counts = np.array([len(indices) for indices in node_points])
+        self.node_offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.node_sizes = counts
+
+        # Segments: maximal runs of one cluster within one node, grouped by cluster for drawing
+        node_of_point = np.repeat(np.arange(len(counts)), counts)
+        sorted_clusters = clusters[order]
+        boundaries = np.flatnonzero((np.diff(sorted_clusters) != 0) | (np.diff(node_of_point) != 0)) + 1
+        starts = np.concatenate([[0], boundaries]).astype(np.int64)
+        lengths = np.diff(np.append(starts, len(order)))
+        segment_clusters = sorted_clusters[starts]
+        by_cluster = np.argsort(segment_clusters, kind='stable')
+        self.segment_nodes = node_of_point[starts][by_cluster]
+        self.segment_starts = starts[by_cluster].astype(np.int32)
+        self.segment_counts = lengths[by_cluster].astype(np.int32)
+        cluster_values, first, cluster_counts = np.unique(segment_clusters[by_cluster], return_index=True,
+                                                          return_counts=True)
+        self.cluster_segments = {int(cluster): slice(start, start + count)
+                                 for cluster, start, count in zip(cluster_values, first, cluster_counts)}
+        return order
+
+    def screen_sizes(self, modelview, projection, viewport_height):
+        # Projected diameter in pixels of every node's bounding sphere, -1 for nodes behind the camera.
+        # Matrices are column-major as returned by glGetDoublev.
+        modelview = np.asarray(modelview, dtype=np.float64).reshape(4, 4).T
+        focal = float(np.asarray(projection, dtype=np.float64).reshape(4, 4).T[1, 1])
+        eye = self.centers @ modelview[:3, :3].T + modelview[:3, 3]
+        distance = -eye[:, 2]
+        radius = self.half_sizes * np.sqrt(3)
+        sizes = 2 * radius * focal * (viewport_height / 2) / np.maximum(distance, 1e-6)
+        # Nodes straddling the camera plane are treated as large, nodes fully behind it are skipped
+        sizes[distance <= radius] = np.inf
+        sizes[distance + radius <= 0] = -1
+        return sizes
+
+    def select_nodes(self, modelview, projection, viewport_height, point_budget):
+        # Largest-on-screen-first traversal from the root. A node is drawn while the budget allows, and its
+        # children are only considered while its sample grid is coarser than REFINE_SPACING_PIXELS on screen.
+        sizes = self.screen_sizes(modelview, projection, viewport_height)
+        selected = np.zeros(len(self.centers), dtype=bool)
+        heap = [(-sizes[0], 0)]
+        used = 0
+        while heap:
+            negative_size, node = heapq.heappop(heap)
+            if -negative_size < 0:
+                continue
+            if used + self.node_sizes[node] > point_budget and used > 0:
+                continue
+            selected[node] = True
+            used += self.node_sizes[node]
+            if -negative_size / NODE_SAMPLE_GRID > REFINE_SPACING_PIXELS:
+                for child in self.children[node]:
+                    heapq.heappush(heap, (-sizes[child], child))
+        return selected, used
+
+    def cluster_ranges(self, cluster, selected):
+        # (firsts, counts) of a cluster's points within the selected nodes, for glMultiDrawArrays
+        segments = self.cluster_segments.get(cluster)
+        if segments is None:
+            return None, None
+        keep = selected[self.segment_nodes[segments]]
+        return self.segment_starts[segments][keep], self.segment_counts[segments][keep]
@@ -0,0 +1,270 @@
+import json
+from PyQt6.QtCore import QAbstractItemModel, QModelIndex, Qt, pyqtSignal
+from PyQt6.QtGui import QColor, QBrush, QFont
+from .cluster_summary import describe_summary
+from .instrumentation import span
+from .startup import read_tree_rows
+
+LOG_PAGE_SIZE = 200
+# Tree rows of individual logs carry their log id under this role, cluster rows use UserRole
+LOG_ID_ROLE = Qt.ItemDataRole.UserRole + 1
+COLUMNS = ["Clusters/Logs", "Visibility", "Details"]
+# Detail values parsed and shown as indented JSON
+JSON_DETAIL_KEYS = ["Query Params", "Headers", "Cookies", "Form Data", "Files", "JSON"]
+
+
+class TreeNode:
+    def __init__(self, kind, parent=None, row=0, **values):
+        self.kind = kind
+        self.parent = parent
+        self.row = row
+        self.children = []
+        self.loaded = kind == 'field'
+        self.__dict__.update(values)
+
+
+class LogTreeModel(QAbstractItemModel):
+    # Clusters -> logs -> fields, read from SQLite on demand. A refresh only loads the cluster rows; logs are
+    # paged in LOG_PAGE_SIZE at a time as a cluster is expanded and scrolled (fetchMore), and the field rows
+    # of a log are parsed from its raw_data only when that log is expanded.
+    visibility_changed = pyqtSignal(int, bool)
+
+    def __init__(self, db_manager, parent=None):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.root = TreeNode('root')
+        self.common_fields = []
+        # Restricts clusters and logs to the hits of the last DatabaseManager.search_logs call
+        self.search_active = False
+        # Unchecked clusters stay unchecked across refreshes, the 3D view keeps hiding them
+        self.hidden_clusters = set()
+        self.base_font = QFont()
+        self.base_font.setPointSize(11)
+        self.cluster_font = QFont(self.base_font)
+        self.cluster_font.setBold(True)
+        self.cluster_font.setPointSize(self.base_font.pointSize() + 1)
+
+    def set_search_active(self, active):
+        self.search_active = active
+        self.refresh()
+
+    def refresh(self):
+        with span('tree.refresh') as refresh_span:
+            rows = read_tree_rows(self.db_manager, self.search_active)
+            refresh_span.set(rows=len(rows['clusters']))
+        self.set_rows(rows)
+
+    def set_rows(self, rows):
+        # Takes the result of read_tree_rows, which the startup loader reads on its own thread
+        self.beginResetModel()
+        summaries = rows['summaries']
+        self.root = TreeNode('root')
+        for row, (cluster_id, cluster_name, cluster_color, log_count) in enumerate(rows['clusters']):
+            # Less saturated background, 80 alpha for contrast with white text
+            background = QColor(cluster_color)
+            background.setAlpha(80)
+            summary = summaries.get(cluster_id)
+            self.root.children.append(TreeNode('cluster', self.root, row, cluster_id=cluster_id,
+                                               log_count=log_count, background=background,
+                                               visible=cluster_id not in self.hidden_clusters,
+                                               summary=summary, tooltip=describe_summary(summary) if summary else None))
+        self.root.loaded = True
+
+        # The first 3 fields of the first log are shown inline for every log
+        sample = rows['sample']
+        self.common_fields = list(json.loads(sample[3]).keys())[:3] if sample else []
+        self.endResetModel()
+
+    def node(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+
+    def index(self, row, column, parent=QModelIndex()):
+        parent_node = self.node(parent)
+        if not 0 <= row < len(parent_node.children):
+            return QModelIndex()
+        return self.createIndex(row, column, parent_node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        parent_node = index.internalPointer().parent
+        if parent_node is self.root:
+            return QModelIndex()
+        return self.createIndex(parent_node.row, 0, parent_node)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid() and parent.column() != 0:
+            return 0
+        return len(self.node(parent).children)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(COLUMNS)
+
+    def hasChildren(self, parent=QModelIndex()):
+        node = self.node(parent)
+        if node.kind == 'cluster':
+            return node.log_count > 0
+        if node.kind == 'log':
+            return True
+        return bool(node.children)
+
+    def canFetchMore(self, parent):
+        node = self.node(parent)
+        if node.kind == 'cluster':
+            return len(node.children) < node.log_count
+        return node.kind == 'log' and not node.loaded
+
+    def fetchMore(self, parent):
+        node = self.node(parent)
+        if node.kind == 'cluster':
+            self.fetch_logs(parent, node, LOG_PAGE_SIZE)
+        elif node.kind == 'log':
+            self.fetch_fields(parent, node)
+
+    def fetch_logs(self, parent, node, count):
+        # Next page of a cluster's logs, keyset-paginated by log id
+        after_id = node.children[-1].log_id if node.children else 0
+        with span('tree.fetch_logs') as fetch_span:
+            rows = self.db_manager.get_log_page(node.cluster_id, after_id, count, self.search_active)
+            fetch_span.set(rows=len(rows))
+        if not rows:
+            node.log_count = len(node.children)
+            return
+        start = len(node.children)
+        self.beginInsertRows(parent, start, start + len(rows) - 1)
+        for offset, (log_id, raw_data) in enumerate(rows):
+            node.children.append(TreeNode('log', node, start + offset, log_id=log_id, raw_data=raw_data))
+        self.endInsertRows()
+
+    def fetch_fields(self, parent, node):
+        try:
+            content = json.loads(node.raw_data)
+        except (TypeError, ValueError):
+            content = {'Raw Data': node.raw_data}
+        node.loaded = True
+        if not content:
+            return
+        self.beginInsertRows(parent, 0, len(content) - 1)
+        for row, (key, value) in enumerate(content.items()):
+            node.children.append(TreeNode('field', node, row, key=key, value=self.format_value(key, value)))
+        self.endInsertRows()
+
+    @staticmethod
+    def format_value(key, value):
+        if key in JSON_DETAIL_KEYS:
+            try:
+                return json.dumps(json.loads(value), indent=2)
+            except (TypeError, ValueError):
+                return str(value)
+        return str(value)
+
+    def log_details(self, node):
+        # Summary of the common fields for the Details column, parsed on first display only
+        if not hasattr(node, 'details'):
+            try:
+                content = json.loads(node.raw_data)
+            except (TypeError, ValueError):
+                content = {}
+            details = []
+            for field in self.common_fields:
+                value = content.get(field, 'N/A')
+                # Truncate long values
+                if isinstance(value, str) and len(value) > 30:
+                    value = value[:27] + "..."
+                details.append(str(value))
+            node.details = " | ".join(details)
+        return node.details
+
+    def cluster_node(self, node):
+        while node.kind != 'cluster':
+            node = node.parent
+        return node
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        column = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.display_text(node, column)
+        if role == Qt.ItemDataRole.CheckStateRole and node.kind == 'cluster' and column == 1:
+            return Qt.CheckState.Checked if node.visible else Qt.CheckState.Unchecked
+        if role == Qt.ItemDataRole.BackgroundRole:
+            background = self.cluster_node(node).background
+            # Logs and their fields use a slightly darker shade of the cluster color
+            return QBrush(background if node.kind == 'cluster' else background.darker(110))
+        if role == Qt.ItemDataRole.ForegroundRole:
+            return QBrush(QColor(255, 255, 255))
+        if role == Qt.ItemDataRole.FontRole:
+            return self.cluster_font if node.kind == 'cluster' and column == 0 else self.base_font
+        if role == Qt.ItemDataRole.ToolTipRole and node.kind == 'cluster':
+            return node.tooltip
+        if role == Qt.ItemDataRole.UserRole and node.kind == 'cluster':
+            return None if node.cluster_id == -1 else node.cluster_id
+        if role == LOG_ID_ROLE and node.kind == 'log':
+            return node.log_id
+        return None
+
+    def display_text(self, node, column):
+        if node.kind == 'cluster':
+            if column == 0:
+                if node.cluster_id == -1:
+                    return f"Noise Cluster: {node.log_count} logs"
+                return f"Cluster{node.cluster_id}: {node.log_count} logs)"
+            if column == 1:
+                return "Visible"
+            if column == 2 and node.summary:
+                return ", ".join(node.summary['top_tokens'][:5])
+        elif node.kind == 'log':
+            if column == 0:
+                return f"Log {node.log_id}"
+            if column == 2:
+                return self.log_details(node)
+        elif node.kind == 'field':
+            if column == 0:
+                return node.key
+            if column == 2:
+                return node.value
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        flags = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+        if index.column() == 1 and index.internalPointer().kind == 'cluster':
+            flags |= Qt.ItemFlag.ItemIsUserCheckable
+        return flags
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        node = self.node(index)
+        if role != Qt.ItemDataRole.CheckStateRole or node.kind != 'cluster' or index.column() != 1:
+            return False
+        node.visible = Qt.CheckState(value) == Qt.CheckState.Checked
+        if node.visible:
+            self.hidden_clusters.discard(node.cluster_id)
+        else:
+            self.hidden_clusters.add(node.cluster_id)
+        self.dataChanged.emit(index, index, [role])
+        self.visibility_changed.emit(node.cluster_id, node.visible)
+        return True
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return COLUMNS[section]
+        return None
+
+    def log_index(self, log_id, cluster_id):
+        # Index of a log row, paging in the cluster's logs up to it; invalid when the log is not in the cluster
+        for cluster_row, cluster in enumerate(self.root.children):
+            if cluster.cluster_id != cluster_id:
+                continue
+            row = self.db_manager.get_log_position_in_cluster(cluster_id, log_id, self.search_active)
+            if row is None:
+                return QModelIndex()
+            parent = self.index(cluster_row, 0)
+            if row >= len(cluster.children):
+                # One query for every page before the log plus the page holding it
+                self.fetch_logs(parent, cluster, row + LOG_PAGE_SIZE - len(cluster.children))
+            if row < len(cluster.children) and cluster.children[row].log_id == log_id:
+                return self.index(row, 0, parent)
+        return QModelIndex()
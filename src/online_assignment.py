@@ -0,0 +1,62 @@
+import numpy as np
+from .streaming_clustering import normalize_rows
+
+# A full recluster is suggested once enough new logs arrived and too many of them fit no existing cluster
+RECLUSTER_MIN_NEW_LOGS = 200
+RECLUSTER_NOISE_MARGIN = 0.2
+RECLUSTER_NOISE_SHARE = 0.1
+
+
+class OnlineAssigner:
+    # Places new embeddings into the clusters of the last run without refitting anything.
+    # DBSCAN runs: a log within eps of a stored core point joins that core point's cluster, which is how
+    # DBSCAN itself treats border points. Centroid runs: a log joins the nearest centroid if it lies within
+    # that cluster's radius. Everything else stays noise (-1).
+    def __init__(self, references, reference_clusters, radii, metric='euclidean', normalize=False):
+        from sklearn.neighbors import NearestNeighbors
+        self.metric = metric
+        self.normalize = normalize
+        self.reference_clusters = np.asarray(reference_clusters, dtype=np.int64)
+        self.radii = np.asarray(radii, dtype=np.float32)
+        self.neighbors = NearestNeighbors(n_neighbors=1, metric=metric).fit(references)
+
+    @classmethod
+    def from_database(cls, db_manager, run):
+        if run['algorithm'] == 'dbscan':
+            core_ids, core_clusters = db_manager.get_core_point_clusters()
+            if len(core_ids) == 0:
+                return None
+            log_ids, core_embeddings = db_manager.load_embeddings(
+                "l.id IN (SELECT log_id FROM cluster_core_points)")
+            clusters = core_clusters[np.searchsorted(core_ids, log_ids)]
+            eps = float(run['params']['epsilon'])
+            return cls(core_embeddings, clusters, np.full(len(clusters), eps), run['params']['metric'])
+
+        cluster_ids, centroids, radii, metric = db_manager.get_cluster_centroids()
+        if len(cluster_ids) == 0:
+            return None
+        # Centroids of cosine runs live in unit-normalized space and are compared with euclidean distance
+        if metric == 'cosine':
+            return cls(centroids, cluster_ids, radii, 'euclidean', normalize=True)
+        return cls(centroids, cluster_ids, radii, metric)
+
+    def assign(self, embeddings):
+        if self.normalize:
+            embeddings = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        distances, indices = self.neighbors.kneighbors(embeddings)
+        distances, indices = distances[:, 0], indices[:, 0]
+        return np.where(distances <= self.radii[indices], self.reference_clusters[indices], -1)
+
+
+def recluster_reason(run, new_total, new_noise):
+    # Returns why a full recluster is warranted, or None
+    if new_total < RECLUSTER_MIN_NEW_LOGS:
+        return None
+    base_ratio = run['noise_count'] / run['log_count'] if run['log_count'] else 0.0
+    new_ratio = new_noise / new_total
+    if new_ratio > base_ratio + RECLUSTER_NOISE_MARGIN:
+        return (f"{new_ratio:.0%} of {new_total} new logs fit no existing cluster "
+                f"(vs {base_ratio:.0%} noise at the last clustering)")
+    if new_noise > RECLUSTER_NOISE_SHARE * run['log_count']:
+        return f"{new_noise} new logs fit no existing cluster, over {RECLUSTER_NOISE_SHARE:.0%} of the clustered set"
+    return None
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import time
+
+from .cancellation import CancellationToken, OperationCancelled
+from .instrumentation import span, sample_memory
+from .progress import coalesce_progress
+from .time_window import normalize_window
+
+# Stages in dependency order, each reads what the previous one wrote to the database
+STAGES = ['import', 'preprocess', 'embed', 'reduce', 'cluster']
+# Stages whose output each stage reads. Clustering and projection both only read the embeddings, the cluster
+# labels a projection stratifies its landmarks by do not change its result enough to count as an input.
+STAGE_DEPENDENCIES = {
+    'import': [],
+    'preprocess': ['import'],
+    'embed': ['preprocess'],
+    'reduce': ['embed'],
+    'cluster': ['embed'],
+}
+# Used by run_pipeline when a stage has neither options nor an earlier run; the other stages need input
+DEFAULT_STAGE_OPTIONS = {
+    'reduce': {'params': {}},
+    'cluster': {'algorithm': 'dbscan', 'epsilon': 0.5, 'min_samples': 5, 'metric': 'euclidean',
+                'neighbor_backend': 'auto', 'n_clusters': 50},
+}
+# Stages that poll the cancel token at their batch boundaries and stop there, which is all of them. Calls into
+# a library (a t-SNE or DBSCAN fit) run to completion first.
+CANCELLABLE_STAGES = set(STAGES)
+# Stages that take a 'window' option ({'start', 'end'}, end exclusive) and then only read the logs whose
+# timestamp falls in it, so their cost follows the window instead of the whole database
+WINDOWED_STAGES = {'preprocess', 'embed', 'reduce', 'cluster'}
+
+
+class PipelineError(Exception):
+    # A stage cannot run, e.g. its input is missing; the message is meant for the user
+    pass
+
+
+def stage_params(stage, options):
+    # The options that decide a stage's output, as recorded in stage_runs. Execution flags (resume, force,
+    # only_missing) are left out, and the recorded params can be passed back to run_stage as options.
+    if stage == 'import':
+        return {'file_paths': sorted(os.path.abspath(path) for path in options['file_paths'])}
+    if stage == 'preprocess':
+        params = {'fields': list(options.get('fields') or [])}
+    elif stage == 'embed':
+        params = {'model_name': options['model_name']}
+    elif stage == 'reduce':
+        from .reduction import reduction_params
+        params = {'params': reduction_params(**(options.get('params') or {}))}
+    elif stage == 'cluster':
+        params = {key: value for key, value in options.items() if key != 'window'}
+    else:
+        raise PipelineError(f"Unknown stage: {stage}")
+    # Normalized, and left out when it covers all time so unwindowed runs keep their fingerprints
+    try:
+        window = normalize_window(options.get('window'))
+    except ValueError as e:
+        raise PipelineError(str(e))
+    if window:
+        params['window'] = window
+    return params
+
+
+def output_fingerprint(db_manager, stage):
+    # Summary of what the stage left in the database; None when it has no output yet
+    if stage == 'import':
+        return db_manager.get_log_fingerprint()
+    if stage == 'preprocess':
+        return db_manager.get_preprocessed_text_fingerprint()
+    if stage == 'embed':
+        return db_manager.get_embedding_fingerprint()
+    if stage == 'reduce':
+        return db_manager.get_projection_fingerprint()
+    return db_manager.get_clustering_fingerprint()
+
+
+def input_fingerprint(db_manager, stage, params):
+    # Hash of the params and everything the stage reads: the imported files' size and mtime for import, the
+    # current output of its dependencies otherwise
+    if stage == 'import':
+        inputs = []
+        for path in params['file_paths']:
+            stat = os.stat(path) if os.path.exists(path) else None
+            inputs.append([path, stat.st_size, stat.st_mtime_ns] if stat else [path, None, None])
+    else:
+        inputs = {dependency: output_fingerprint(db_manager, dependency)
+                  for dependency in STAGE_DEPENDENCIES[stage]}
+    payload = json.dumps({'stage': stage, 'params': params, 'inputs': inputs}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def cached_run(db_manager, stage, params):
+    # The completed run whose output can be reused, or None. Import only needs the same files to have been
+    # imported before; other stages need their last run to have had the same inputs, with its output untouched
+    # since (e.g. not cleared, re-clustered with other parameters or extended by online assignment).
+    fingerprint = input_fingerprint(db_manager, stage, params)
+    if stage == 'import':
+        return db_manager.get_stage_run(stage, fingerprint)
+    last_run = db_manager.get_stage_run(stage)
+    if last_run is None or last_run['input_fingerprint'] != fingerprint:
+        return None
+    if last_run['output_fingerprint'] != output_fingerprint(db_manager, stage):
+        return None
+    return last_run
+
+
+def run_stage(db_manager, stage, options, progress=None, status=None, cancel_token=None):
+    # Runs one stage against an open DatabaseManager and returns its JSON-serializable result. The run, its
+    # inputs and its output fingerprint are recorded in stage_runs. Stage modules are imported on first use,
+    # so the CLI only loads the libraries of the stages it runs.
+    # Raises PipelineError when the stage cannot run and OperationCancelled when cancelled; a cancelled stage's
+    # uncommitted writes are rolled back.
+    cancel_token = cancel_token or CancellationToken()
+    progress = coalesce_progress(progress or (lambda percent: None))
+    params = stage_params(stage, options)
+    if params.get('window'):
+        # Logs imported before timestamps were parsed would otherwise fall outside every window
+        from .import_logic import backfill_timestamps
+        backfill_timestamps(db_manager, status)
+    run_id = db_manager.start_stage_run(stage, params, input_fingerprint(db_manager, stage, params))
+    try:
+        with span(f"stage.{stage}"):
+            result = execute_stage(db_manager, stage, options, params.get('window'), progress, status,
+                                   cancel_token)
+    except (OperationCancelled, KeyboardInterrupt):
+        db_manager.rollback()
+        db_manager.finish_stage_run(run_id, 'cancelled')
+        raise
+    except Exception:
+        db_manager.finish_stage_run(run_id, 'failed')
+        raise
+    finally:
+        sample_memory()
+    db_manager.finish_stage_run(run_id, 'completed', output_fingerprint(db_manager, stage), result)
+    return result
+
+
+def execute_stage(db_manager, stage, options, window, progress, status, cancel_token):
+    if stage == 'import':
+        from .import_logic import import_logs
+        return import_logs(db_manager, options['file_paths'], progress, status, cancel_token)
+    if stage == 'preprocess':
+        from .preprocessor import preprocess_logs
+        if not options.get('fields'):
+            raise PipelineError("Select at least one field for preprocessing.")
+        return preprocess_logs(db_manager, options['fields'], progress, status, cancel_token, window)
+    if stage == 'embed':
+        from .embedding_generator import EmbeddingGenerator
+        generator = EmbeddingGenerator(options['model_name'], resume=options.get('resume', True),
+                                       cancel_token=cancel_token, only_missing=options.get('only_missing', False),
+                                       progress=progress, status=status, window=window)
+        if not generator.generate(db_manager):
+            cancel_token.raise_if_cancelled()
+        return {'model_name': options['model_name'], 'embedded': db_manager.count_embeddings()}
+    if stage == 'reduce':
+        from .reduction import reduce_embeddings
+        projection_id = reduce_embeddings(db_manager, options.get('params'), options.get('force', False),
+                                          progress, status, cancel_token, window)
+        return {'projection_id': projection_id}
+    from .clustering import cluster_logs
+    return cluster_logs(db_manager, progress=progress, status=status, cancel_token=cancel_token,
+                        **dict(options, window=window))
+
+
+def run_pipeline(db_manager, options, force=(), progress=None, status=None, cancel_token=None, window=None):
+    # Runs the stages in order, skipping those whose cached output still matches their inputs. options maps
+    # a stage to its run_stage options; a stage without options reuses the params of its last completed run
+    # (or DEFAULT_STAGE_OPTIONS), and import is skipped without files. Stages in force run regardless.
+    # A window, when given, replaces the one of every stage in WINDOWED_STAGES; time_window.ALL_TIME clears it.
+    # Returns one report per stage: action 'ran', 'reused' or 'skipped', with timings and the run reused.
+    progress = progress or (lambda percent: None)
+    status = status or (lambda message: None)
+    cancel_token = cancel_token or CancellationToken()
+    reports = []
+    for index, stage in enumerate(STAGES):
+        # Also stops a pipeline cancelled while a stage was being reused
+        cancel_token.raise_if_cancelled()
+
+        def stage_progress(percent, index=index):
+            progress(int((index + percent / 100) * 100 / len(STAGES)))
+
+        stage_options = options.get(stage)
+        if stage_options is None and stage != 'import':
+            last_run = db_manager.get_stage_run(stage)
+            stage_options = last_run['params'] if last_run else DEFAULT_STAGE_OPTIONS.get(stage)
+        if not stage_options:
+            if stage != 'import':
+                raise PipelineError(f"No options for the {stage} stage and no earlier run to take them from.")
+            reports.append({'stage': stage, 'action': 'skipped'})
+            continue
+        if window is not None and stage in WINDOWED_STAGES:
+            stage_options = dict(stage_options, window=window)
+
+        params = stage_params(stage, stage_options)
+        cached = None if stage in force else cached_run(db_manager, stage, params)
+        if cached is not None:
+            status(f"Reusing {stage} output from {cached['finished_at']} (run {cached['id']}).")
+            reports.append({'stage': stage, 'action': 'reused', 'run_id': cached['id'],
+                            'finished_at': cached['finished_at'], 'result': cached['result']})
+            stage_progress(100)
+            continue
+
+        if stage == 'reduce' and 'force' not in stage_options:
+            # A saved projection is only reactivated if one was computed from these exact embeddings
+            stage_options = dict(stage_options, force=db_manager.get_stage_run(
+                stage, input_fingerprint(db_manager, stage, params)) is None)
+        status(f"Running {stage}...")
+        started = time.perf_counter()
+        result = run_stage(db_manager, stage, stage_options, stage_progress, status, cancel_token)
+        reports.append({'stage': stage, 'action': 'ran', 'seconds': round(time.perf_counter() - started, 3),
+                        'result': result})
+    progress(100)
+    status("Pipeline finished: " + describe_reports(reports))
+    return reports
+
+
+def describe_reports(reports):
+    return ", ".join(f"{report['stage']} {report['action']}" for report in reports)
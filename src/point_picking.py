@@ -0,0 +1,109 @@
+import numpy as np
+
+PICK_RADIUS_PIXELS = 6
+# Ball queries along the ray overlap by this factor of the pick radius so no point between two of them is missed
+BALL_OVERLAP = 1.15
+# Ball queries per pick; past this the balls grow beyond the pick radius, e.g. when the camera is inside the points
+MAX_PICK_BALLS = 256
+# Radius of the first, narrow pass of a pick
+FIRST_PASS_PIXELS = 2
+
+
+class PointPicker:
+    # Maps a screen position back to the nearest drawn point. A KD-tree over the normalized 3D points is built
+    # once per data set; a pick casts the ray under the cursor and queries balls along it whose radius matches
+    # the pick radius in world units at that depth, then ranks the few candidates by on-screen distance.
+    # Matrices are column-major as returned by glGetDoublev, positions are in GL window pixels.
+    def __init__(self, points):
+        from scipy.spatial import cKDTree
+        self.points = np.asarray(points, dtype=np.float64)
+        self.tree = cKDTree(self.points)
+        self.low = self.points.min(axis=0)
+        self.high = self.points.max(axis=0)
+
+    def pick(self, x, y, modelview, projection, viewport, radius_pixels=PICK_RADIUS_PIXELS, mask=None):
+        # Index of the point closest to (x, y) on screen within radius_pixels, or None. mask optionally
+        # limits the result to pickable (e.g. visible) points.
+        modelview = np.asarray(modelview, dtype=np.float64).reshape(4, 4).T
+        projection = np.asarray(projection, dtype=np.float64).reshape(4, 4).T
+        viewport = np.asarray(viewport, dtype=np.float64)
+        transform = projection @ modelview
+        inverse = np.linalg.inv(transform)
+
+        # Ray from the camera through the pixel, in data coordinates
+        ndc_x = (x - viewport[0]) / viewport[2] * 2 - 1
+        ndc_y = (y - viewport[1]) / viewport[3] * 2 - 1
+        far = inverse @ np.array([ndc_x, ndc_y, 1.0, 1.0])
+        far = far[:3] / far[3]
+        camera = np.linalg.inv(modelview)[:3, 3]
+        direction = far - camera
+        direction /= np.linalg.norm(direction)
+
+        # World size of one pixel grows linearly with the distance from the camera
+        world_per_pixel = 2 / (projection[1, 1] * viewport[3])
+        t_start, t_end = self.clip_ray(camera, direction, radius_pixels * world_per_pixel)
+        if t_start is None:
+            return None
+        # Points in front of the near plane are not drawn
+        t_start = max(t_start, projection[2, 3] / (projection[2, 2] - 1))
+        if t_start > t_end:
+            return None
+
+        # A narrow pass first: every point within its radius on screen is a candidate, so a hit there is the
+        # nearest point. In dense regions it settles the pick with a fraction of the candidates of a full pass.
+        for pass_pixels in sorted({min(FIRST_PASS_PIXELS, radius_pixels), radius_pixels}):
+            candidates = self.candidates_along_ray(camera, direction, t_start, t_end, pass_pixels * world_per_pixel)
+            if mask is not None:
+                candidates = candidates[mask[candidates]]
+            nearest, distance = self.nearest_on_screen(candidates, x, y, transform, viewport)
+            if nearest is not None and distance <= pass_pixels:
+                return nearest
+        return None
+
+    def candidates_along_ray(self, origin, direction, t_start, t_end, growth):
+        # Indices of the points within growth * t of the ray between t_start and t_end, some more than once.
+        # Each ball's radius is that distance at its center and the next ball starts where it ends, so the
+        # centers are a geometric sequence.
+        count = int(np.ceil(np.log(t_end / t_start) / np.log1p(growth))) + 1
+        if count > MAX_PICK_BALLS:
+            count = MAX_PICK_BALLS
+            growth = (t_end / t_start) ** (1 / (count - 1)) - 1
+        t = t_start * (1 + growth) ** np.arange(count)
+        found = self.tree.query_ball_point(origin + t[:, None] * direction, t * growth * BALL_OVERLAP,
+                                           return_sorted=False)
+        # A point found by two balls is ranked twice, which is cheaper than deduplicating
+        return np.concatenate([np.asarray(indices, dtype=np.int64) for indices in found])
+
+    def nearest_on_screen(self, candidates, x, y, transform, viewport):
+        # The candidate closest to (x, y) on screen and its distance in pixels, (None, None) without candidates
+        homogeneous = self.points[candidates] @ transform[:, :3].T + transform[:, 3]
+        in_front = homogeneous[:, 3] > 0
+        candidates, homogeneous = candidates[in_front], homogeneous[in_front]
+        if len(candidates) == 0:
+            return None, None
+        screen = homogeneous[:, :2] / homogeneous[:, 3:4]
+        screen_x = (screen[:, 0] + 1) / 2 * viewport[2] + viewport[0]
+        screen_y = (screen[:, 1] + 1) / 2 * viewport[3] + viewport[1]
+        distances = np.hypot(screen_x - x, screen_y - y)
+        nearest = np.argmin(distances)
+        return int(candidates[nearest]), distances[nearest]
+
+    def clip_ray(self, origin, direction, margin_per_unit):
+        # Parameter range where the ray passes within the pick radius of the points' bounding box
+        # The margin grows with t, bounded at the far side of the box
+        reach = np.linalg.norm(self.high - self.low) + np.linalg.norm(origin - (self.low + self.high) / 2)
+        margin = margin_per_unit * reach
+        t_start, t_end = 0.0, np.inf
+        for axis in range(3):
+            low, high = self.low[axis] - margin, self.high[axis] + margin
+            if abs(direction[axis]) < 1e-12:
+                if not low <= origin[axis] <= high:
+                    return None, None
+                continue
+            t_low = (low - origin[axis]) / direction[axis]
+            t_high = (high - origin[axis]) / direction[axis]
+            t_start = max(t_start, min(t_low, t_high))
+            t_end = min(t_end, max(t_low, t_high))
+        if t_start > t_end:
+            return None, None
+        return t_start, t_end
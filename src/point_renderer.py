@@ -0,0 +1,137 @@
+import ctypes
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.GL import shaders
+
+# GLSL 1.20 keeps the fixed-function matrix stack of the widget, so rotation and zoom stay glRotatef/glTranslatef
+VERTEX_SHADER = """
+#version 120
+attribute vec3 position;
+attribute vec3 color;
+uniform float point_size;
+uniform float alpha;
+varying vec4 point_color;
+void main() {
+    gl_Position = gl_ModelViewProjectionMatrix * vec4(position, 1.0);
+    gl_PointSize = point_size;
+    point_color = vec4(color, alpha);
+}
+"""
+
+FRAGMENT_SHADER = """
+#version 120
+varying vec4 point_color;
+void main() {
+    // Round points: discard the corners of the point sprite
+    vec2 offset = gl_PointCoord - vec2(0.5);
+    if (dot(offset, offset) > 0.25) {
+        discard;
+    }
+    gl_FragColor = point_color;
+}
+"""
+
+
+class PointRenderer:
+    # Points live in two vertex buffers (positions and colors) uploaded once per data set. Callers keep the
+    # points of each cluster contiguous and draw a range per cluster, with size and opacity as uniforms, so
+    # visibility and selection changes never touch the buffers. GL calls need the widget's context current.
+    def __init__(self):
+        self.program = None
+        self.buffers = None
+        self.positions = None
+        self.colors = None
+        self.dirty = False
+        self.highlight_buffer = None
+        self.highlight = np.zeros(0, dtype=np.uint32)
+        self.highlight_dirty = False
+
+    def set_points(self, positions, colors):
+        # Uploaded lazily on the next draw, when the GL context is current
+        self.positions = np.ascontiguousarray(positions, dtype=np.float32)
+        self.colors = np.ascontiguousarray(colors, dtype=np.float32)
+        self.dirty = True
+
+    def set_highlight(self, indices):
+        # Points drawn again on top of the scene, e.g. search hits; uploaded as an index buffer
+        self.highlight = np.ascontiguousarray(indices, dtype=np.uint32)
+        self.highlight_dirty = True
+
+    def initialize(self):
+        self.program = shaders.compileProgram(shaders.compileShader(VERTEX_SHADER, GL_VERTEX_SHADER),
+                                              shaders.compileShader(FRAGMENT_SHADER, GL_FRAGMENT_SHADER))
+        self.position_location = glGetAttribLocation(self.program, 'position')
+        self.color_location = glGetAttribLocation(self.program, 'color')
+        self.point_size_location = glGetUniformLocation(self.program, 'point_size')
+        self.alpha_location = glGetUniformLocation(self.program, 'alpha')
+
+    def upload(self):
+        if self.buffers is None:
+            self.buffers = glGenBuffers(2)
+        for buffer, data in zip(self.buffers, (self.positions, self.colors)):
+            glBindBuffer(GL_ARRAY_BUFFER, buffer)
+            glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.dirty = False
+
+    def begin(self):
+        # Binds program and buffers; returns False when there is nothing to draw
+        if self.positions is None or len(self.positions) == 0:
+            return False
+        if self.program is None:
+            self.initialize()
+        if self.dirty:
+            self.upload()
+        if self.highlight_dirty:
+            if self.highlight_buffer is None:
+                self.highlight_buffer = glGenBuffers(1)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.highlight_buffer)
+            glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.highlight.nbytes, self.highlight, GL_DYNAMIC_DRAW)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+            self.highlight_dirty = False
+        glEnable(GL_VERTEX_PROGRAM_POINT_SIZE)
+        glEnable(GL_POINT_SPRITE)
+        glUseProgram(self.program)
+        for buffer, location in zip(self.buffers, (self.position_location, self.color_location)):
+            glBindBuffer(GL_ARRAY_BUFFER, buffer)
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, 3, GL_FLOAT, GL_FALSE, 0, ctypes.c_void_p(0))
+        return True
+
+    def draw_range(self, start, count, point_size, alpha):
+        glUniform1f(self.point_size_location, point_size)
+        glUniform1f(self.alpha_location, alpha)
+        glDrawArrays(GL_POINTS, start, count)
+
+    def draw_ranges(self, firsts, counts, point_size, alpha):
+        # Several ranges with the same uniforms in one call
+        if len(firsts) == 0:
+            return
+        glUniform1f(self.point_size_location, point_size)
+        glUniform1f(self.alpha_location, alpha)
+        glMultiDrawArrays(GL_POINTS, np.ascontiguousarray(firsts, dtype=np.int32),
+                          np.ascontiguousarray(counts, dtype=np.int32), len(firsts))
+
+    def draw_highlight(self, point_size, alpha):
+        if len(self.highlight) == 0:
+            return
+        glUniform1f(self.point_size_location, point_size)
+        glUniform1f(self.alpha_location, alpha)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.highlight_buffer)
+        glDrawElements(GL_POINTS, len(self.highlight), GL_UNSIGNED_INT, ctypes.c_void_p(0))
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def end(self):
+        # QPainter overlays expect the default program and no bound buffers
+        glDisableVertexAttribArray(self.position_location)
+        glDisableVertexAttribArray(self.color_location)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glUseProgram(0)
+        glDisable(GL_POINT_SPRITE)
+        glDisable(GL_VERTEX_PROGRAM_POINT_SIZE)
+
+    def clear(self):
+        self.positions = None
+        self.colors = None
+        self.dirty = False
+        self.set_highlight([])
@@ -1,30 +1,60 @@
 import json
 import re
+from .cancellation import CancellationToken
+from .instrumentation import span
+from .progress import ProgressReporter
 
-def preprocess_logs(logs, selected_fields, db_manager, update_progress, update_status):
-    total_logs = len(logs)
-    for i, log in enumerate(logs):
-        log_id = log[0]  # Assuming the log ID is in the first column
-        raw_data = json.loads(log[3])  # Assuming raw_data is in the fourth column
+PREPROCESS_BATCH_SIZE = 5000
 
-        preprocessed_text = ""
-        for field in selected_fields:
-            if field in raw_data:
-                value = raw_data[field]
-                # Check if the value is not None and not an empty string
-                if value not in (None, "", "None"):
-                    preprocessed_text += f"{value}\n"  # Only append the value, not the field name
 
-        # Remove special characters using regex
-        preprocessed_text = re.sub(r'[^\w\s]', '', preprocessed_text)
+def preprocess_text(raw_data, selected_fields):
+    preprocessed_text = ""
+    for field in selected_fields:
+        if field in raw_data:
+            value = raw_data[field]
+            # Check if the value is not None and not an empty string
+            if value not in (None, "", "None"):
+                preprocessed_text += f"{value}\n"  # Only append the value, not the field name
 
-        # Only update if preprocessed_text is not empty after processing
-        if preprocessed_text.strip():
-            db_manager.update_preprocessed_text(log_id, preprocessed_text)
+    # Remove special characters using regex
+    return re.sub(r'[^\w\s]', '', preprocessed_text)
 
-        # Update progress
-        progress = int((i + 1) / total_logs * 100)
-        update_progress(progress)
-        update_status(f"Preprocessed {i + 1}/{total_logs} logs")
 
-    db_manager.commit()
+def preprocess_logs(db_manager, selected_fields, progress=None, status=None, cancel_token=None, window=None):
+    # Builds preprocessed_text from the selected raw_data fields, reading and writing the logs in id-ordered
+    # batches and committing once at the end. Only the logs of the time window are read, others keep their
+    # text. Returns the number of logs that got a non-empty text.
+    progress = progress or (lambda percent: None)
+    status = status or (lambda message: None)
+    cancel_token = cancel_token or CancellationToken()
+    where, params = db_manager.window_filter(window)
+    total_logs = db_manager.count_logs(where, params)
+    reporter = ProgressReporter(progress, status, total_logs, "Preprocessed")
+    done = 0
+    updated = 0
+    last_id = 0
+    while True:
+        cancel_token.raise_if_cancelled()
+        with span('preprocess.read') as read_span:
+            logs = db_manager.get_raw_log_page(last_id, PREPROCESS_BATCH_SIZE, where, params)
+            read_span.set(rows=len(logs))
+        if not logs:
+            break
+        with span('preprocess.parse', rows=len(logs)):
+            rows = []
+            for log_id, raw_data in logs:
+                preprocessed_text = preprocess_text(json.loads(raw_data), selected_fields)
+                # Only update if preprocessed_text is not empty after processing
+                if preprocessed_text.strip():
+                    rows.append((preprocessed_text, log_id))
+        with span('preprocess.write', rows=len(rows)):
+            db_manager.update_preprocessed_texts(rows)
+        updated += len(rows)
+        done += len(logs)
+        last_id = logs[-1][0]
+        reporter.update(done)
+
+    with span('preprocess.commit'):
+        db_manager.commit()
+    db_manager.sync_search_index()
+    return {'preprocessed': updated, 'fields': list(selected_fields)}
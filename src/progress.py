@@ -0,0 +1,66 @@
+import time
+
+# Row progress reaches the GUI or CLI at most this often; every callback crossing into the Qt event loop is a
+# queued signal, and a stage reporting per row or batch would otherwise flood it
+PROGRESS_INTERVAL = 0.25
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+
+
+def coalesce_progress(progress):
+    # Forwards a percentage only when it changed, e.g. for progress fractions reported per index list
+    last = [None]
+
+    def forward(percent):
+        percent = int(percent)
+        if percent != last[0]:
+            last[0] = percent
+            progress(percent)
+    return forward
+
+
+class ProgressReporter:
+    # Turns a running row count into throttled progress and status callbacks. update() can be called for every
+    # row or batch; at most every PROGRESS_INTERVAL seconds it forwards the percentage, mapped into
+    # [start, end] of the stage's progress bar, and a status with the counts, rows/s and the ETA. The first
+    # update and the one reaching total are always forwarded. initial is the count already done when resuming,
+    # it is left out of the rate.
+    def __init__(self, progress, status, total, label, start=0, end=100, initial=0, interval=PROGRESS_INTERVAL):
+        self.progress = progress
+        self.status = status
+        self.total = total
+        self.label = label
+        self.start = start
+        self.end = end
+        self.initial = initial
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.last_report = None
+
+    def update(self, done):
+        now = time.perf_counter()
+        finished = done >= self.total
+        if self.last_report is not None and not finished and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        fraction = done / self.total if self.total else 1.0
+        self.progress(int(self.start + (self.end - self.start) * min(fraction, 1.0)))
+        self.status(self.describe(done, now - self.started))
+
+    def describe(self, done, elapsed):
+        message = f"{self.label} {done:,} of {self.total:,}"
+        # The first rows say little about the rate
+        if done <= self.initial or (elapsed < self.interval and done < self.total):
+            return message
+        rate = (done - self.initial) / elapsed
+        message += f" ({rate:,.0f} rows/s"
+        if done < self.total:
+            message += f", ETA {format_duration((self.total - done) / rate)}"
+        return message + ")"
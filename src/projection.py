@@ -0,0 +1,177 @@
+import numpy as np
+
+# sklearn is imported where it is used, so the GUI and CLI start without loading it
+
+PROJECTION_MODES = ['auto', 'exact', 'pca', 'landmark']
+# Used when no landmark count is given: auto switches to landmark t-SNE once there are more points than landmarks
+LANDMARK_AUTO_THRESHOLD = 20000
+PCA_FIT_SAMPLE = 100000
+CHUNK_SIZE = 65536
+
+
+# sklearn's t-SNE has no cancellation point, a cancel is honored once it returns
+TSNE_CANCEL_NOTE = " Cancel takes effect once t-SNE finishes."
+
+
+def resolve_mode(mode, n_samples, landmarks=LANDMARK_AUTO_THRESHOLD):
+    # Full t-SNE takes minutes beyond a few thousand points, so auto only runs it on as many points as landmark
+    # mode would fit it on
+    if mode == 'auto':
+        return 'landmark' if n_samples > landmarks else 'pca'
+    return mode
+
+
+def fit_sample_pca(embeddings, n_components=50, random_state=42):
+    # Returns None when the input is already small enough to use as is
+    if embeddings.shape[1] <= n_components or len(embeddings) <= n_components:
+        return None
+    rng = np.random.default_rng(random_state)
+    if len(embeddings) > PCA_FIT_SAMPLE:
+        sample = embeddings[np.sort(rng.choice(len(embeddings), PCA_FIT_SAMPLE, replace=False))]
+    else:
+        sample = embeddings
+    from sklearn.decomposition import PCA
+    return PCA(n_components=n_components, svd_solver='randomized', random_state=random_state).fit(sample)
+
+
+def pca_transform(pca, embeddings):
+    # Transform in chunks so memory stays close to the input size
+    if pca is None:
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+    reduced = np.empty((len(embeddings), pca.n_components_), dtype=np.float32)
+    for start in range(0, len(embeddings), CHUNK_SIZE):
+        reduced[start:start + CHUNK_SIZE] = pca.transform(embeddings[start:start + CHUNK_SIZE])
+    return reduced
+
+
+def pca_prereduce(embeddings, n_components=50, random_state=42):
+    return pca_transform(fit_sample_pca(embeddings, n_components, random_state), embeddings)
+
+
+def stratified_sample(labels, sample_size, random_state=42):
+    # Proportional allocation per stratum, with at least one point from every stratum
+    rng = np.random.default_rng(random_state)
+    strata, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    if sample_size >= len(labels):
+        return np.arange(len(labels))
+    quotas = np.maximum(1, np.floor(counts / len(labels) * sample_size).astype(int))
+    quotas = np.minimum(quotas, counts)
+    order = np.argsort(inverse, kind='stable')
+    boundaries = np.concatenate([[0], np.cumsum(counts)])
+    selected = []
+    for stratum in range(len(strata)):
+        members = order[boundaries[stratum]:boundaries[stratum + 1]]
+        selected.append(rng.choice(members, quotas[stratum], replace=False))
+    return np.sort(np.concatenate(selected))
+
+
+def knn_interpolate(landmark_features, landmark_coordinates, features, n_neighbors=10):
+    # Place points at the inverse-distance weighted mean of their nearest landmarks
+    from sklearn.neighbors import NearestNeighbors
+    n_neighbors = min(n_neighbors, len(landmark_features))
+    neighbors = NearestNeighbors(n_neighbors=n_neighbors).fit(landmark_features)
+    coordinates = np.empty((len(features), landmark_coordinates.shape[1]), dtype=np.float32)
+    for start in range(0, len(features), CHUNK_SIZE):
+        distances, indices = neighbors.kneighbors(features[start:start + CHUNK_SIZE])
+        weights = 1.0 / (distances + 1e-6)
+        weights /= weights.sum(axis=1, keepdims=True)
+        coordinates[start:start + CHUNK_SIZE] = np.einsum('nk,nkd->nd', weights, landmark_coordinates[indices])
+    return coordinates
+
+
+def run_tsne(features, params):
+    from sklearn.manifold import TSNE
+    # t-SNE requires perplexity < number of samples
+    perplexity = min(float(params['perplexity']), max(1.0, len(features) - 1.0))
+    tsne = TSNE(n_components=3, perplexity=perplexity, max_iter=int(params['max_iter']),
+                init=params['init'], metric=params['metric'], random_state=42)
+    return tsne.fit_transform(features).astype(np.float32)
+
+
+def project(embeddings, params, labels=None, status=None, cancel_token=None):
+    # cancel_token is checked between the PCA, t-SNE and interpolation steps
+    status = status or (lambda message: None)
+    check_cancelled = cancel_token.raise_if_cancelled if cancel_token is not None else (lambda: None)
+    mode = resolve_mode(params.get('mode', 'pca'), len(embeddings), int(params['landmarks']))
+
+    if mode == 'exact':
+        status(f"Running t-SNE on {len(embeddings)} x {embeddings.shape[1]} embeddings..." + TSNE_CANCEL_NOTE)
+        return run_tsne(embeddings, params)
+
+    status(f"Reducing {embeddings.shape[1]} dimensions to {params['pca_components']} with PCA...")
+    features = pca_prereduce(embeddings, int(params['pca_components']))
+    check_cancelled()
+    if mode == 'pca' or len(features) <= int(params['landmarks']):
+        status(f"Running t-SNE on {len(features)} PCA-reduced points..." + TSNE_CANCEL_NOTE)
+        return run_tsne(features, params)
+
+    # Landmark mode: fit t-SNE on a stratified sample, interpolate everything else
+    if labels is None or len(np.unique(labels)) < 2:
+        status("Building strata for landmark sampling...")
+        from sklearn.cluster import MiniBatchKMeans
+        n_strata = min(64, len(features))
+        labels = MiniBatchKMeans(n_clusters=n_strata, n_init=1, random_state=42,
+                                 batch_size=4096).fit_predict(features)
+        check_cancelled()
+    landmarks = stratified_sample(np.asarray(labels), int(params['landmarks']))
+    status(f"Running t-SNE on {len(landmarks)} landmarks..." + TSNE_CANCEL_NOTE)
+    landmark_coordinates = run_tsne(features[landmarks], params)
+    check_cancelled()
+
+    status(f"Placing {len(features) - len(landmarks)} points by kNN interpolation...")
+    coordinates = knn_interpolate(features[landmarks], landmark_coordinates, features,
+                                  int(params['interpolation_neighbors']))
+    coordinates[landmarks] = landmark_coordinates
+    return coordinates
+
+
+class OutOfSampleProjector:
+    # Places new points into an existing layout without moving the points already in it.
+    # Each new point starts at the weighted mean of its nearest projected neighbors and is then
+    # refined with a few gradient steps on a local stress that matches its distances to those
+    # neighbors, scaled to layout units.
+    def __init__(self, embeddings, coordinates, n_neighbors=10, n_steps=30, learning_rate=0.2,
+                 pca_components=50, random_state=42):
+        from sklearn.neighbors import NearestNeighbors
+        self.coordinates = np.asarray(coordinates, dtype=np.float32)
+        self.n_neighbors = min(n_neighbors, len(self.coordinates))
+        self.n_steps = n_steps
+        self.learning_rate = learning_rate
+        self.pca = fit_sample_pca(embeddings, pca_components, random_state)
+        self.features = pca_transform(self.pca, embeddings)
+        self.neighbors = NearestNeighbors(n_neighbors=self.n_neighbors).fit(self.features)
+        self.scale = self.estimate_scale(random_state)
+
+    def estimate_scale(self, random_state, sample_size=2000):
+        # Median ratio of layout distance to embedding distance between existing neighbors
+        if len(self.features) < 2:
+            return 1.0
+        rng = np.random.default_rng(random_state)
+        sample = rng.choice(len(self.features), min(sample_size, len(self.features)), replace=False)
+        distances, indices = self.neighbors.kneighbors(self.features[sample])
+        layout_distances = np.linalg.norm(self.coordinates[indices] - self.coordinates[sample][:, None, :], axis=2)
+        valid = distances > 1e-9
+        if not valid.any():
+            return 1.0
+        return float(np.median(layout_distances[valid] / distances[valid]))
+
+    def place(self, embeddings):
+        features = pca_transform(self.pca, embeddings)
+        placed = np.empty((len(features), self.coordinates.shape[1]), dtype=np.float32)
+        for start in range(0, len(features), CHUNK_SIZE):
+            distances, indices = self.neighbors.kneighbors(features[start:start + CHUNK_SIZE])
+            placed[start:start + CHUNK_SIZE] = self.refine(distances, self.coordinates[indices])
+        return placed
+
+    def refine(self, distances, anchors):
+        weights = 1.0 / (distances + 1e-6)
+        weights /= weights.sum(axis=1, keepdims=True)
+        positions = np.einsum('nk,nkd->nd', weights, anchors)
+        targets = distances * self.scale
+        for _ in range(self.n_steps):
+            offsets = positions[:, None, :] - anchors
+            current = np.linalg.norm(offsets, axis=2) + 1e-9
+            # Gradient of sum_j w_j (|y - a_j| - t_j)^2
+            gradient = np.einsum('nk,nkd->nd', weights * (current - targets) / current, offsets)
+            positions -= self.learning_rate * 2 * gradient
+        return positions
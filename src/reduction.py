@@ -0,0 +1,121 @@
+import json
+from .cancellation import CancellationToken
+from .pipeline import PipelineError
+from .projection import project, OutOfSampleProjector
+from .instrumentation import span
+from .time_window import describe_window
+
+DEFAULT_REDUCTION_PARAMS = {
+    'mode': 'auto',
+    'pca_components': 50,
+    'landmarks': 20000,
+    'interpolation_neighbors': 10,
+    'perplexity': 30.0,
+    'max_iter': 1000,
+    'init': 'pca',
+    'metric': 'euclidean',
+}
+
+
+def reduction_params(**overrides):
+    params = dict(DEFAULT_REDUCTION_PARAMS)
+    params.update({key: value for key, value in overrides.items() if value is not None})
+    return params
+
+
+def projection_key(params):
+    return json.dumps(params, sort_keys=True)
+
+
+def describe_projection(params):
+    description = (f"t-SNE perplexity={params['perplexity']:g}, iterations={params['max_iter']}, "
+                   f"init={params['init']}, metric={params['metric']}")
+    mode = params.get('mode', 'exact')
+    if mode == 'landmark':
+        description += f", landmark ({params['landmarks']} landmarks, PCA {params['pca_components']})"
+    elif mode != 'exact':
+        description += f", {mode} (PCA {params['pca_components']})"
+    if params.get('window'):
+        description += f", {describe_window(params['window'])}"
+    return description
+
+
+def reduce_embeddings(db_manager, params=None, force=False, progress=None, status=None, cancel_token=None,
+                      window=None):
+    # Projects the embeddings of the time window (all of them by default) to 3D and activates the projection;
+    # returns its id. A saved projection with the same parameters and window is reactivated instead, unless
+    # force is set. Logs outside the window get no coordinates, so the view only shows the window.
+    progress = progress or (lambda percent: None)
+    status = status or (lambda message: None)
+    cancel_token = cancel_token or CancellationToken()
+    params = reduction_params(**(params or {}))
+    if window:
+        # Saved with the projection, so it is told apart from one over other logs and extended within its window
+        params['window'] = window
+    key = projection_key(params)
+    projection_id = db_manager.get_projection_id(key)
+    if projection_id is not None and not force:
+        db_manager.activate_projection(projection_id)
+        progress(100)
+        status(f"Loaded saved projection ({describe_projection(params)}).")
+        return projection_id
+
+    status("Loading embeddings for dimensionality reduction...")
+    progress(0)
+    log_ids, embeddings = db_manager.load_embeddings(*db_manager.window_filter(window))
+    if len(log_ids) == 0:
+        raise PipelineError("No embeddings available for dimensionality reduction"
+                            + (f" {describe_window(window)}." if window else "."))
+    labels = db_manager.get_cluster_ids_for_logs(log_ids)
+    progress(10)
+
+    status(f"Performing dimensionality reduction ({describe_projection(params)})...")
+    with span('reduce.project', rows=len(log_ids), mode=params['mode']):
+        coordinates = project(embeddings, params, labels=labels, status=status, cancel_token=cancel_token)
+    progress(90)
+    cancel_token.raise_if_cancelled()
+
+    with span('reduce.write', rows=len(log_ids)):
+        projection_id = db_manager.save_projection(key, json.dumps(params), log_ids, coordinates)
+        db_manager.activate_projection(projection_id)
+    progress(100)
+    status("Dimensionality reduction completed!")
+    return projection_id
+
+
+def place_new_logs(db_manager, progress=None, status=None, cancel_token=None):
+    # Adds newly embedded logs to every saved projection without refitting or moving existing points, only
+    # those of its time window to a windowed one. Returns the active projection id. Cancelling keeps the
+    # projections already extended.
+    progress = progress or (lambda percent: None)
+    status = status or (lambda message: None)
+    cancel_token = cancel_token or CancellationToken()
+    projections = db_manager.get_projections()
+    if not projections:
+        raise PipelineError("No saved projection to place new logs into.")
+    placed_total = 0
+    for index, (projection_id, params, is_active, _, _) in enumerate(projections):
+        cancel_token.raise_if_cancelled()
+        in_projection = ("EXISTS (SELECT 1 FROM projection_points pp "
+                         "WHERE pp.projection_id = ? AND pp.log_id = l.id)")
+        where, where_params = db_manager.window_filter(json.loads(params).get('window'))
+        if where:
+            new_ids, new_embeddings = db_manager.load_embeddings(f"{where} AND NOT {in_projection}",
+                                                                 where_params + (projection_id,))
+        else:
+            new_ids, new_embeddings = db_manager.load_embeddings(f"NOT {in_projection}", (projection_id,))
+        if len(new_ids) == 0:
+            continue
+        reference_ids, reference_embeddings = db_manager.load_embeddings(in_projection, (projection_id,))
+        if len(reference_ids) == 0:
+            continue
+        status(f"Placing {len(new_ids)} new logs into {describe_projection(json.loads(params))}...")
+        reference_coordinates = db_manager.get_projection_coordinates(projection_id, reference_ids)
+        projector = OutOfSampleProjector(reference_embeddings, reference_coordinates)
+        db_manager.add_projection_points(projection_id, new_ids, projector.place(new_embeddings))
+        placed_total += len(new_ids) if is_active else 0
+        progress(int((index + 1) / len(projections) * 100))
+
+    progress(100)
+    status(f"Placed {placed_total} new logs into the existing layout.")
+    return db_manager.get_active_projection_id()
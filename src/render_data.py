@@ -0,0 +1,65 @@
+import numpy as np
+from .lod_octree import PointOctree
+from .point_picking import PointPicker
+from .instrumentation import span
+
+# Clusters without a color in the database
+DEFAULT_POINT_COLOR = (0.5, 0.5, 0.5)
+
+
+def hex_to_rgb(hex_color):
+    # Convert hex to RGB
+    hex_color = hex_color.lstrip('#')
+    if len(hex_color) == 3:
+        hex_color = ''.join(c*2 for c in hex_color)
+    if len(hex_color) != 6:
+        raise ValueError("Invalid hex color format")
+    r, g, b = [int(hex_color[i:i+2], 16) / 255.0 for i in (0, 2, 4)]
+    return (r, g, b)
+
+
+def prepare_render_data(db_manager):
+    # Everything the 3D view needs before touching OpenGL, kept free of Qt so it can be benchmarked headless.
+    # Returns None when no log has coordinates yet.
+    with span('render.read') as read_span:
+        logs_data = db_manager.get_all_logs_with_coordinates()
+        read_span.set(rows=len(logs_data))
+    if not logs_data:
+        return None
+
+    data = np.array(logs_data, dtype=np.float64)
+    points = data[:, 2:5]  # tsne_x, tsne_y, tsne_z
+
+    # Normalize to [-1, 1] range
+    points = (points - points.min()) / (points.max() - points.min()) * 2 - 1
+
+    # Points are reordered by octree node and cluster, every (node, cluster) pair is one buffer range
+    clusters = data[:, 1].astype(np.int64)
+    octree = PointOctree()
+    with span('render.octree', rows=len(points)):
+        order = octree.build(points, clusters)
+    points = points[order]
+    clusters = clusters[order]
+
+    color_map = {cluster[0]: hex_to_rgb(cluster[2]) for cluster in db_manager.get_clusters()}
+    cluster_values, inverse, counts = np.unique(clusters, return_inverse=True, return_counts=True)
+    palette = np.array([color_map.get(int(c), DEFAULT_POINT_COLOR) for c in cluster_values])
+
+    with span('render.picker', rows=len(points)):
+        picker = PointPicker(points)
+
+    # Cluster label anchors, no member rows are read for these
+    sums = np.stack([np.bincount(inverse, weights=points[:, axis]) for axis in range(3)], axis=1)
+    cluster_centers = {int(cluster): sums[index] / counts[index]
+                       for index, cluster in enumerate(cluster_values) if cluster != -1}
+    return {
+        'points': points,
+        'clusters': clusters,
+        'log_ids': data[order, 0].astype(np.int64),
+        'octree': octree,
+        'color_map': color_map,
+        'colors': palette[inverse],
+        'cluster_values': cluster_values,
+        'cluster_centers': cluster_centers,
+        'picker': picker,
+    }
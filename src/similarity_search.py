@@ -0,0 +1,103 @@
+import numpy as np
+from .ann_index import ANN_AUTO_THRESHOLD, load_or_build_index
+from .streaming_clustering import normalize_rows
+
+DEFAULT_TOP_K = 50
+EXACT_BLOCK_ROWS = 65536
+
+
+class SimilaritySearch:
+    # Top-k nearest logs in embedding space. Up to ANN_AUTO_THRESHOLD embeddings every vector is scanned
+    # (exact); above that the queries go through the persisted IVF index of src.ann_index, which only
+    # scans the buckets closest to the query. Cosine distance is 1 - cos, euclidean the L2 norm.
+    def __init__(self, ids, vectors, metric='euclidean', index=None):
+        if metric not in ('cosine', 'euclidean'):
+            raise ValueError(f"Unsupported metric: {metric}")
+        self.metric = metric
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.index = index
+        self.vectors = None
+        self.squared_norms = None
+        if index is None:
+            vectors = np.asarray(vectors, dtype=np.float32)
+            self.vectors = normalize_rows(vectors) if metric == 'cosine' else vectors
+            self.squared_norms = (self.vectors ** 2).sum(axis=1)
+
+    @classmethod
+    def from_database(cls, db_manager, metric='euclidean', exact=None, status=None):
+        # exact=None picks the exact scan for small datasets and the IVF index for large ones
+        status = status or (lambda message: None)
+        status("Loading embeddings for similarity search...")
+        ids, vectors = db_manager.load_embeddings()
+        if len(ids) == 0:
+            return None
+        if exact is None:
+            exact = len(ids) <= ANN_AUTO_THRESHOLD
+        if exact:
+            return cls(ids, vectors, metric)
+        return cls(ids, vectors, metric, load_or_build_index(db_manager, ids, vectors, metric, status))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def exact(self):
+        return self.index is None
+
+    def vector(self, log_id):
+        # Stored embedding of a log, None when it has none
+        position = np.searchsorted(self.ids, log_id)
+        if position == len(self.ids) or self.ids[position] != log_id:
+            return None
+        if self.index is not None:
+            # The index keeps its vectors in bucket order, already normalized for cosine
+            return self.index.vectors[np.flatnonzero(self.index.order == position)[0]]
+        return self.vectors[position]
+
+    def query(self, vector, k=DEFAULT_TOP_K, exclude=None):
+        # (ids, distances) of the k nearest logs, nearest first; exclude drops one log id (the query's own)
+        extra = 1 if exclude is not None else 0
+        if self.index is not None:
+            distances, ids = self.index.search(vector, k + extra)
+            distances, ids = distances[0], ids[0]
+        else:
+            distances, ids = self.exact_query(np.asarray(vector, dtype=np.float32), k + extra)
+        keep = ids != -1
+        if exclude is not None:
+            keep &= ids != exclude
+        return ids[keep][:k], distances[keep][:k]
+
+    def exact_query(self, vector, k):
+        if self.metric == 'cosine':
+            norm = np.linalg.norm(vector)
+            vector = vector / norm if norm > 0 else vector
+        k = min(k, len(self.ids))
+        best_distances = np.empty(0, dtype=np.float32)
+        best_positions = np.empty(0, dtype=np.int64)
+        # Blocks keep the temporary distance arrays small; each block only contributes its own top k
+        for start in range(0, len(self.ids), EXACT_BLOCK_ROWS):
+            block = self.vectors[start:start + EXACT_BLOCK_ROWS]
+            products = block @ vector
+            if self.metric == 'cosine':
+                distances = 1 - products
+            else:
+                distances = self.squared_norms[start:start + EXACT_BLOCK_ROWS] - 2 * products
+            top = min(k, len(distances))
+            nearest = np.argpartition(distances, top - 1)[:top]
+            best_distances = np.concatenate([best_distances, distances[nearest]])
+            best_positions = np.concatenate([best_positions, nearest + start])
+        order = np.argsort(best_distances, kind='stable')[:k]
+        distances, positions = best_distances[order].astype(np.float64), best_positions[order]
+        if self.metric == 'euclidean':
+            # Ranked by |v|^2 - 2 v.q; the query's own norm is only added for the reported distances
+            distances = np.sqrt(np.maximum(distances + float(vector @ vector), 0))
+        else:
+            distances = np.maximum(distances, 0)
+        return distances, self.ids[positions]
+
+    def similar_to_log(self, log_id, k=DEFAULT_TOP_K):
+        # Nearest neighbours of a stored log, without the log itself; None when it has no embedding
+        vector = self.vector(log_id)
+        if vector is None:
+            return None
+        return self.query(vector, k, exclude=log_id)
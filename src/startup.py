@@ -0,0 +1,52 @@
+import json
+from .embedding_generator import resumable_job_only_missing
+from .instrumentation import span
+from .render_data import prepare_render_data
+
+# What the main window shows on startup, in the order it is filled in. The GUI reads these on a background
+# thread so the window appears before the database has been scanned; the startup benchmark reads them headless.
+STARTUP_SECTIONS = ['fields', 'tree', 'state', 'render']
+
+
+def read_common_fields(db_manager):
+    # Fields of the first log, all logs of an import are assumed to share them
+    sample = db_manager.get_sample_log()
+    return list(json.loads(sample[3]).keys()) if sample else []
+
+
+def read_tree_rows(db_manager, search_active=False):
+    # The cluster rows of the log tree, logs are paged in when a cluster is expanded
+    return {
+        'summaries': db_manager.get_cluster_summaries(),
+        'clusters': db_manager.get_cluster_log_counts(search_active),
+        'sample': db_manager.get_sample_log(),
+    }
+
+
+def read_pipeline_state(db_manager):
+    interrupted_job = db_manager.get_resumable_embedding_job()
+    if interrupted_job is not None:
+        interrupted_job['only_missing'] = resumable_job_only_missing(db_manager, interrupted_job)
+    return {
+        'preprocessed': db_manager.check_preprocessed_text_exists(),
+        'embedded': db_manager.check_embeddings_exist(),
+        'projections': db_manager.get_projections(),
+        'interrupted_job': interrupted_job,
+        'time_range': db_manager.get_timestamp_range(),
+    }
+
+
+def iter_startup_sections(db_manager):
+    # Yields (section, value) for every name in STARTUP_SECTIONS; render is None without a projection
+    with span('startup.fields'):
+        fields = read_common_fields(db_manager)
+    yield 'fields', fields
+    with span('startup.tree'):
+        tree_rows = read_tree_rows(db_manager)
+    yield 'tree', tree_rows
+    with span('startup.state'):
+        state = read_pipeline_state(db_manager)
+    yield 'state', state
+    with span('startup.render'):
+        render_data = prepare_render_data(db_manager) if state['embedded'] else None
+    yield 'render', render_data
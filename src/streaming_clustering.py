@@ -0,0 +1,72 @@
+import numpy as np
+
+STREAMING_ALGORITHMS = ['minibatch_kmeans']
+STREAMING_CHUNK_SIZE = 16384
+MINIBATCH_SIZE = 4096
+# A cluster's radius is this multiple of the RMS distance of its members to the centroid. In high dimensions
+# member distances concentrate tightly around the RMS, so this covers nearly all members without reaching
+# far into neighboring clusters.
+RADIUS_SCALE = 1.5
+
+
+def normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class StreamingClusterer:
+    # Bounded-memory clustering over embedding chunks streamed from the database. One pass fits mini-batch
+    # k-means with partial_fit, a second pass labels every chunk and accumulates per-cluster sums for centroids
+    # and radii. Only one chunk and the k x dim accumulators are held in memory at a time.
+    def __init__(self, algorithm='minibatch_kmeans', n_clusters=50, metric='euclidean', random_state=42):
+        if algorithm not in STREAMING_ALGORITHMS:
+            raise ValueError(f"Unsupported streaming algorithm: {algorithm}")
+        self.algorithm = algorithm
+        self.n_clusters = n_clusters
+        self.metric = metric
+        from sklearn.cluster import MiniBatchKMeans
+        self.model = MiniBatchKMeans(n_clusters=n_clusters, n_init=1, batch_size=MINIBATCH_SIZE, random_state=random_state)
+        self.counts = None
+        self.sums = None
+        self.squared_norms = None
+
+    def prepare(self, chunk):
+        chunk = np.asarray(chunk, dtype=np.float32)
+        return normalize_rows(chunk) if self.metric == 'cosine' else chunk
+
+    def partial_fit(self, chunk):
+        chunk = self.prepare(chunk)
+        if not hasattr(self.model, 'cluster_centers_') and len(chunk) < self.n_clusters:
+            raise ValueError(f"The first chunk has {len(chunk)} rows, fewer than {self.n_clusters} clusters")
+        # partial_fit takes one update step per call, so large chunks are fed as several mini-batches
+        batch_size = max(MINIBATCH_SIZE, self.n_clusters)
+        for start in range(0, len(chunk), batch_size):
+            self.model.partial_fit(chunk[start:start + batch_size])
+
+    def assign(self, chunk):
+        # Labels a chunk and accumulates the statistics for centroids and radii
+        from scipy import sparse
+        chunk = self.prepare(chunk)
+        labels = self.model.predict(chunk)
+        if self.counts is None:
+            self.counts = np.zeros(self.n_clusters, dtype=np.int64)
+            self.sums = np.zeros((self.n_clusters, chunk.shape[1]), dtype=np.float64)
+            self.squared_norms = np.zeros(self.n_clusters, dtype=np.float64)
+        self.counts += np.bincount(labels, minlength=self.n_clusters)[:self.n_clusters]
+        membership = sparse.csr_matrix((np.ones(len(labels), dtype=np.float32), (labels, np.arange(len(labels)))),
+                                       shape=(self.n_clusters, len(labels)))
+        self.sums += membership @ chunk
+        self.squared_norms += np.bincount(labels, weights=(chunk.astype(np.float64) ** 2).sum(axis=1),
+                                          minlength=self.n_clusters)[:self.n_clusters]
+        return labels
+
+    def cluster_models(self):
+        # (labels, centroids, radii, sizes) of the non-empty clusters
+        present = np.flatnonzero(self.counts)
+        counts = self.counts[present]
+        centroids = self.sums[present] / counts[:, None]
+        # Mean squared distance to the mean equals E|x|^2 - |mean|^2
+        mean_squared = np.maximum(self.squared_norms[present] / counts - (centroids ** 2).sum(axis=1), 0)
+        radii = RADIUS_SCALE * np.sqrt(mean_squared)
+        return present, centroids.astype(np.float32), radii.astype(np.float32), counts
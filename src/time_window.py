@@ -0,0 +1,103 @@
+import re
+from datetime import datetime, timezone
+
+# raw_data fields a log's time is read from, the first one that parses wins
+TIMESTAMP_FIELDS = ['timestamp', '@timestamp', 'time', 'datetime', 'date', 'ts']
+# Access log times, tried after ISO 8601
+TIMESTAMP_FORMATS = ['%d/%b/%Y:%H:%M:%S %z', '%d/%b/%Y:%H:%M:%S', '%Y/%m/%d %H:%M:%S']
+# Epoch values above this are taken as milliseconds
+EPOCH_MILLISECONDS_FROM = 1e11
+LEADING_DATE = re.compile(r'^(\d{4}-\d{2}-\d{2})\b')
+# A window with neither bound, it selects every log
+ALL_TIME = {'start': None, 'end': None}
+
+
+def format_timestamp(parsed):
+    # logs.timestamp holds UTC as 'YYYY-MM-DD HH:MM:SS', so string order is time order and a window is a range
+    # scan on idx_logs_timestamp
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat(sep=' ', timespec='seconds')
+
+
+def parse_timestamp(value):
+    # A log time in the format of logs.timestamp, or None. Takes ISO 8601 strings (T or space, fractions,
+    # Z or an offset), epoch seconds or milliseconds and access log times; a string starting with a date
+    # whose time cannot be read counts as midnight of that day.
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        parsed = parse_timestamp_text(value.strip())
+        if parsed is not None:
+            return format_timestamp(parsed)
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+    if not isinstance(value, (int, float)):
+        return None
+    seconds = value / 1000 if abs(value) >= EPOCH_MILLISECONDS_FROM else value
+    try:
+        return format_timestamp(datetime.fromtimestamp(seconds, tz=timezone.utc))
+    except (OverflowError, OSError, ValueError):
+        return None
+
+
+def parse_timestamp_text(text):
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        pass
+    for timestamp_format in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(text, timestamp_format)
+        except ValueError:
+            continue
+    match = LEADING_DATE.match(text)
+    if match:
+        try:
+            return datetime.fromisoformat(match.group(1))
+        except ValueError:
+            return None
+    return None
+
+
+def log_timestamp(log):
+    if not isinstance(log, dict):
+        return None
+    for field in TIMESTAMP_FIELDS:
+        timestamp = parse_timestamp(log.get(field))
+        if timestamp is not None:
+            return timestamp
+    return None
+
+
+def normalize_window(window):
+    # {'start', 'end'} in the format of logs.timestamp with the end exclusive, either bound may be open; None
+    # when the window covers all time. Raises ValueError for a bound that cannot be read or an empty window.
+    if not window:
+        return None
+    bounds = {}
+    for bound in ('start', 'end'):
+        value = window.get(bound)
+        if value in (None, ''):
+            bounds[bound] = None
+            continue
+        bounds[bound] = parse_timestamp(value)
+        if bounds[bound] is None:
+            raise ValueError(f"Cannot read the window {bound} {value!r}, use e.g. 2024-06-13 or 2024-06-13T08:00:00.")
+    if bounds['start'] is None and bounds['end'] is None:
+        return None
+    if bounds['start'] is not None and bounds['end'] is not None and bounds['start'] >= bounds['end']:
+        raise ValueError(f"The window ends ({bounds['end']}) before it starts ({bounds['start']}).")
+    return bounds
+
+
+def describe_window(window):
+    if not window:
+        return "all time"
+    if window['start'] is None:
+        return f"before {window['end']}"
+    if window['end'] is None:
+        return f"from {window['start']}"
+    return f"{window['start']} to {window['end']}"
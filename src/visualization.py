@@ -1,14 +1,31 @@
 from PyQt6.QtOpenGLWidgets import QOpenGLWidget
-from PyQt6.QtGui import QMouseEvent, QWheelEvent
+from PyQt6.QtGui import QMouseEvent, QWheelEvent, QPainter, QColor, QFont
 from PyQt6.QtWidgets import QSizePolicy
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QRectF, QTimer, pyqtSignal
 from OpenGL.GL import *
 from OpenGL.GLU import *
-from sklearn.manifold import TSNE
+import time
 import numpy as np
 import colorsys
+from .cluster_summary import describe_summary
+from .point_renderer import PointRenderer
+from .render_data import prepare_render_data
+
+# Points drawn per frame while rotating or zooming, adapted to FRAME_TIME_TARGET between the bounds
+INTERACTIVE_POINT_BUDGET = 300000
+MIN_POINT_BUDGET = 20000
+MAX_POINT_BUDGET = 2000000
+FRAME_TIME_TARGET = 1 / 30
+# Points drawn once interaction stops for IDLE_REFINE_DELAY_MS
+IDLE_POINT_BUDGET = 5000000
+IDLE_REFINE_DELAY_MS = 200
+# A press and release closer than this many pixels is a click, not a rotation
+CLICK_DISTANCE = 4
 
 class Visualization3D(QOpenGLWidget):
+    # (log id, cluster id) of a clicked point
+    log_picked = pyqtSignal(int, int)
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setMinimumSize(600, 600)
@@ -22,49 +39,63 @@ class Visualization3D(QOpenGLWidget):
         self.last_pos = None
         self.cluster_visibility = {}
         self.selected_cluster = None
+        self.cluster_centers = {}
+        self.cluster_labels = {}
+        self.cluster_details = {}
+        self.log_ids = []
+        self.renderer = PointRenderer()
+        self.octree = None
+        self.interacting = False
+        self.point_budget = INTERACTIVE_POINT_BUDGET
+        self.refine_timer = QTimer(self)
+        self.refine_timer.setSingleShot(True)
+        self.refine_timer.timeout.connect(self.refine)
+        self.picker = None
+        self.pickable = None
+        self.hovered_index = None
+        self.picked_index = None
+        self.press_pos = None
+        self.view_matrices = None
+        # Buffer positions of highlighted points (search hits, similar logs), None when nothing is highlighted
+        self.highlighted = None
+        self.setMouseTracking(True)
 
-    @staticmethod
-    def hex_to_rgb(hex_color):
-        saturation_increase = 0.5
-        # Convert hex to RGB
-        hex_color = hex_color.lstrip('#')
-        if len(hex_color) == 3:
-            hex_color = ''.join(c*2 for c in hex_color)
-        if len(hex_color) != 6:
-            raise ValueError("Invalid hex color format")
-        r, g, b = [int(hex_color[i:i+2], 16) / 255.0 for i in (0, 2, 4)]
-        return (r, g, b)
-
-    def set_data(self, db_manager):
-        logs_data = db_manager.get_all_logs_with_coordinates()
-        
-        if not logs_data:
+    def set_data(self, db_manager, data=None):
+        # data can be prepared off the GUI thread, see src.startup
+        if data is None:
+            data = prepare_render_data(db_manager)
+        if data is None:
             print("No data available for visualization.")
             return
 
-        # Extract points, clusters, and log IDs
-        points = [(log[2], log[3], log[4]) for log in logs_data]  # tsne_x, tsne_y, tsne_z
-        clusters = [log[1] for log in logs_data]  # cluster_id
-        self.log_ids = [log[0] for log in logs_data]  # log_id
-        
-        # Convert points to numpy array
-        self.points = np.array(points)
-        
-        # Normalize to [-1, 1] range
-        self.points = (self.points - self.points.min()) / (self.points.max() - self.points.min()) * 2 - 1
-        
-        self.clusters = clusters
-        
-        # Get color map from database
-        color_map = {cluster[0]: cluster[2] for cluster in db_manager.get_clusters()}
-        self.color_map = {k: self.hex_to_rgb(v) for k, v in color_map.items()}
-        self.colors = [self.color_map.get(c, (0.5, 0.5, 0.5)) for c in clusters]  # Default to gray if no color found
-        
+        self.octree = data['octree']
+        self.points = data['points']
+        self.clusters = data['clusters']
+        self.log_ids = data['log_ids']
+        self.color_map = data['color_map']
+        self.colors = data['colors']
+        self.renderer.set_points(self.points, self.colors)
+        self.picker = data['picker']
+        self.pickable = None
+        self.highlighted = None
+        self.renderer.set_highlight([])
+        self.hovered_index = None
+        self.picked_index = None
+
         # Initialize cluster visibility
-        self.cluster_visibility = {cluster: True for cluster in set(clusters)}
+        self.cluster_visibility = {int(cluster): True for cluster in data['cluster_values']}
+
+        # Cluster label anchors and precomputed summaries, no member rows are read for these
+        self.cluster_centers = data['cluster_centers']
+        self.set_cluster_summaries(db_manager.get_cluster_summaries())
         
         self.update()
 
+    def set_cluster_summaries(self, summaries):
+        self.cluster_labels = {cluster_id: ", ".join(summary['top_tokens'][:3])
+                               for cluster_id, summary in summaries.items()}
+        self.cluster_details = {cluster_id: describe_summary(summary) for cluster_id, summary in summaries.items()}
+
     def initializeGL(self):
         glEnable(GL_DEPTH_TEST)
         glEnable(GL_POINT_SMOOTH)
@@ -78,6 +109,13 @@ class Visualization3D(QOpenGLWidget):
         gluPerspective(45, width / height, 0.1, 100.0)
 
     def paintGL(self):
+        # QPainter overlays change GL state, so it is restored every frame
+        glEnable(GL_DEPTH_TEST)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        glMatrixMode(GL_PROJECTION)
+        glLoadIdentity()
+        gluPerspective(45, self.width() / max(self.height(), 1), 0.1, 100.0)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         glMatrixMode(GL_MODELVIEW)
         glLoadIdentity()
@@ -85,30 +123,92 @@ class Visualization3D(QOpenGLWidget):
         glRotatef(self.rotation[0], 1, 0, 0)
         glRotatef(self.rotation[1], 0, 1, 0)
         
+        # Kept for picking, which happens outside paintGL
+        self.view_matrices = (glGetDoublev(GL_MODELVIEW_MATRIX), glGetDoublev(GL_PROJECTION_MATRIX),
+                              glGetIntegerv(GL_VIEWPORT))
+
+        if len(self.points) == 0:
+            return
         base_size = 5
         point_size = max(base_size, min(50, 2000 / len(self.points)))
-        
-        # Draw main points
-        for point, color, cluster in zip(self.points, self.colors, self.clusters):
-            if self.cluster_visibility.get(cluster, True):
+
+        # Octree nodes by screen size within the frame's point budget, then one draw call per visible cluster
+        started = time.perf_counter()
+        budget = self.point_budget if self.interacting else IDLE_POINT_BUDGET
+        modelview, projection, viewport = self.view_matrices
+        selected, drawn = self.octree.select_nodes(modelview, projection, viewport[3], budget)
+        if self.renderer.begin():
+            for cluster in self.octree.cluster_segments:
+                if not self.cluster_visibility.get(cluster, True):
+                    continue
+                firsts, counts = self.octree.cluster_ranges(cluster, selected)
+                # Everything else fades while points are highlighted
+                fade = 0.2 if self.highlighted is not None else 1.0
                 if cluster == self.selected_cluster and cluster != -1:
                     # Scale up the size for selected cluster and slightly reduce opacity
-                    glPointSize(point_size * 2.5)  # Increased scaling factor
-                    glColor4f(*color, 0.7)  # Slightly reduced opacity
+                    self.renderer.draw_ranges(firsts, counts, point_size * 2.5, 0.7 * fade)
+                elif cluster == -1:
+                    self.renderer.draw_ranges(firsts, counts, point_size, 0.3 * fade)  # Lower opacity for noise cluster
                 else:
-                    glPointSize(point_size)
-                    if cluster == -1:
-                        glColor4f(color[0], color[1], color[2], 0.3)  # Lower opacity for noise cluster
-                    else:
-                        glColor4f(*color, 1.0)
-                
-                glBegin(GL_POINTS)
-                glVertex3f(*point)
-                glEnd()
-
-        # Reset OpenGL state
-        glPointSize(1.0)
-        glColor4f(1.0, 1.0, 1.0, 1.0)
+                    self.renderer.draw_ranges(firsts, counts, point_size, 1.0 * fade)
+            if self.highlighted is not None:
+                # Highlighted points are drawn in full, on top regardless of depth
+                glDisable(GL_DEPTH_TEST)
+                self.renderer.draw_highlight(point_size * 1.6, 1.0)
+                glEnable(GL_DEPTH_TEST)
+            self.renderer.end()
+        if self.interacting:
+            # Wait for the GPU so the frame time is real, then scale the budget towards the target
+            glFinish()
+            elapsed = max(time.perf_counter() - started, 1e-4)
+            self.point_budget = int(np.clip(drawn * FRAME_TIME_TARGET / elapsed, MIN_POINT_BUDGET, MAX_POINT_BUDGET))
+
+        self.draw_overlay()
+
+    def draw_overlay(self):
+        modelview, projection, viewport = self.view_matrices
+        ratio = self.devicePixelRatio()
+        painter = QPainter(self)
+        self.draw_point_markers(painter, modelview, projection, viewport, ratio)
+        self.draw_cluster_labels(painter, modelview, projection, viewport, ratio)
+        painter.end()
+
+    def draw_point_markers(self, painter, modelview, projection, viewport, ratio):
+        # Rings around the hovered and the picked point, with the hovered log id next to it
+        painter.setFont(QFont(painter.font().family(), 9))
+        for index, color in ((self.picked_index, QColor(255, 255, 0)), (self.hovered_index, QColor(255, 255, 255))):
+            if index is None:
+                continue
+            x, y, depth = gluProject(*self.points[index], modelview, projection, viewport)
+            if not 0 < depth < 1:
+                continue
+            x, y = x / ratio, (viewport[3] - y) / ratio
+            painter.setPen(color)
+            painter.drawEllipse(QRectF(x - 7, y - 7, 14, 14))
+            if index == self.hovered_index:
+                painter.drawText(int(x + 10), int(y - 10), f"Log {self.log_ids[index]}")
+
+    def draw_cluster_labels(self, painter, modelview, projection, viewport, ratio):
+        painter.setFont(QFont(painter.font().family(), 9))
+        for cluster, center in self.cluster_centers.items():
+            label = self.cluster_labels.get(cluster)
+            if not label or not self.cluster_visibility.get(cluster, True):
+                continue
+            x, y, depth = gluProject(*center, modelview, projection, viewport)
+            if not 0 < depth < 1:
+                continue
+            painter.setPen(QColor(255, 255, 255) if cluster == self.selected_cluster else QColor(210, 210, 210))
+            painter.drawText(int(x / ratio), int((viewport[3] - y) / ratio), label)
+
+        # Summary panel for the selected cluster
+        details = self.cluster_details.get(self.selected_cluster)
+        if details:
+            rect = QRectF(10, 10, min(460, self.width() - 20), self.height() / 3)
+            painter.fillRect(rect, QColor(0, 0, 0, 170))
+            painter.setPen(QColor(255, 255, 255))
+            painter.drawText(rect.adjusted(8, 6, -8, -6),
+                             (Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop).value | Qt.TextFlag.TextWordWrap.value,
+                             details)
 
     def set_selected_cluster(self, cluster):
         self.selected_cluster = cluster
@@ -117,18 +217,77 @@ class Visualization3D(QOpenGLWidget):
     def set_cluster_visibility(self, cluster_id, is_visible):
         if cluster_id in self.cluster_visibility:
             self.cluster_visibility[cluster_id] = is_visible
+            # Points of hidden clusters are not pickable
+            hidden = [cluster for cluster, visible in self.cluster_visibility.items() if not visible]
+            self.pickable = ~np.isin(self.clusters, hidden) if hidden else None
+            self.update_highlight_buffer()
             self.update()  # Trigger a redraw of the visualization
 
+    def set_highlighted_logs(self, log_ids):
+        # Highlights the points of these logs and fades the rest, None clears the highlight
+        if log_ids is None or len(self.log_ids) == 0:
+            self.highlighted = None
+        else:
+            self.highlighted = np.flatnonzero(np.isin(self.log_ids, log_ids))
+        self.update_highlight_buffer()
+        self.update()
+
+    def update_highlight_buffer(self):
+        # Hidden clusters stay hidden while highlighted
+        indices = self.highlighted if self.highlighted is not None else []
+        if self.highlighted is not None and self.pickable is not None:
+            indices = indices[self.pickable[indices]]
+        self.renderer.set_highlight(indices)
+
+    def pick_point(self, position):
+        # Index of the visible point under a widget position, or None
+        if self.picker is None or self.view_matrices is None:
+            return None
+        modelview, projection, viewport = self.view_matrices
+        ratio = self.devicePixelRatio()
+        return self.picker.pick(position.x() * ratio, viewport[3] - position.y() * ratio, modelview, projection,
+                                viewport, mask=self.pickable)
+
+    def set_picked_log(self, log_id):
+        # Marks a log picked elsewhere (e.g. in the tree), None clears the mark
+        matches = np.flatnonzero(self.log_ids == log_id) if log_id is not None and len(self.log_ids) else []
+        self.picked_index = int(matches[0]) if len(matches) else None
+        self.update()
+
+    def begin_interaction(self):
+        # Coarse frames while the view moves, full detail once it has been still for IDLE_REFINE_DELAY_MS
+        self.interacting = True
+        self.refine_timer.start(IDLE_REFINE_DELAY_MS)
+
+    def refine(self):
+        self.interacting = False
+        self.update()
+
     def wheelEvent(self, event: QWheelEvent):
         if event.angleDelta().y() > 0:
             self.zoom += 0.1
         else:
             self.zoom -= 0.1
+        self.begin_interaction()
         self.update()
 
     def mousePressEvent(self, event: QMouseEvent):
         if event.button() == Qt.MouseButton.LeftButton:
             self.last_pos = event.position()
+            self.press_pos = event.position()
+
+    def mouseReleaseEvent(self, event: QMouseEvent):
+        if event.button() != Qt.MouseButton.LeftButton or self.press_pos is None:
+            return
+        moved = (event.position() - self.press_pos).manhattanLength()
+        self.press_pos = None
+        if moved >= CLICK_DISTANCE:
+            return
+        index = self.pick_point(event.position())
+        if index is not None:
+            self.picked_index = index
+            self.log_picked.emit(int(self.log_ids[index]), int(self.clusters[index]))
+            self.update()
 
     def mouseMoveEvent(self, event: QMouseEvent):
         if event.buttons() & Qt.MouseButton.LeftButton and self.last_pos is not None:
@@ -137,10 +296,26 @@ class Visualization3D(QOpenGLWidget):
             self.rotation[0] += dy
             self.rotation[1] += dx
             self.last_pos = event.position()
+            self.begin_interaction()
             self.update()
+        elif not event.buttons() and not self.interacting:
+            # Hover lookup while the view is still
+            index = self.pick_point(event.position())
+            if index != self.hovered_index:
+                self.hovered_index = index
+                self.update()
     
     def clear_data(self):
         self.points = []
         self.colors = []
         self.cluster_ids = []
+        self.cluster_centers = {}
+        self.octree = None
+        self.log_ids = []
+        self.picker = None
+        self.pickable = None
+        self.hovered_index = None
+        self.picked_index = None
+        self.highlighted = None
+        self.renderer.clear()
         self.update()
\ No newline at end of file
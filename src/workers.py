@@ -0,0 +1,268 @@
+import logging
+import time
+from PyQt6.QtCore import QThread, pyqtSignal
+from .db_manager import DatabaseManager
+from .cancellation import CancellationToken, OperationCancelled
+from .pipeline import PipelineError, run_stage, run_pipeline
+from .reduction import place_new_logs, reduction_params
+from .clustering import sweep_parameters, assign_new_logs
+from .embedding_generator import read_embedding_options
+from .similarity_search import SimilaritySearch, DEFAULT_TOP_K
+from .startup import iter_startup_sections
+from .render_data import prepare_render_data
+from .time_window import normalize_window
+
+# Qt side of the pipeline: each thread runs one Qt-free stage function from src and forwards its progress and
+# status callbacks as signals. The GUI holds no stage logic of its own. The five pipeline stages go through
+# run_stage so their runs are recorded for run_pipeline's cache like the CLI's.
+
+
+class StageThread(QThread):
+    progress_update = pyqtSignal(int)
+    status_update = pyqtSignal(str)
+
+    def __init__(self, db_name):
+        super().__init__()
+        self.db_name = db_name
+        self.cancel_token = CancellationToken()
+        self.result = None
+        self.error = None
+
+    def cancel(self):
+        self.cancel_token.cancel()
+
+    def run(self):
+        db_manager = DatabaseManager(self.db_name)
+        try:
+            self.result = self.run_stage(db_manager)
+            self.on_result(self.result)
+        except PipelineError as e:
+            self.error = str(e)
+            self.status_update.emit(self.error)
+        except OperationCancelled:
+            self.status_update.emit("Cancelled.")
+        except Exception as e:
+            # An exception escaping QThread.run aborts the application under PyQt6
+            logging.exception(f"{type(self).__name__} failed")
+            self.error = f"Error: {e}"
+            self.status_update.emit(self.error)
+        finally:
+            db_manager.close()
+
+    def failed(self):
+        # Finished handlers stop the follow-up steps of a stage that raised or was cancelled
+        return self.error is not None or self.cancel_token.is_cancelled()
+
+    def run_stage(self, db_manager):
+        raise NotImplementedError
+
+    def run_recorded(self, db_manager, stage, options):
+        return run_stage(db_manager, stage, options, self.progress_update.emit, self.status_update.emit,
+                         self.cancel_token)
+
+    def on_result(self, result):
+        pass
+
+
+class ImportThread(StageThread):
+    common_fields_found = pyqtSignal(list)  # Signal to emit common fields
+
+    def __init__(self, file_paths, db_path):
+        super().__init__(db_path)
+        self.file_paths = file_paths
+
+    def run_stage(self, db_manager):
+        return self.run_recorded(db_manager, 'import', {'file_paths': self.file_paths})
+
+    def on_result(self, result):
+        self.common_fields_found.emit(result['common_fields'])
+
+
+class PreprocessThread(StageThread):
+    def __init__(self, db_name, selected_fields, window=None):
+        super().__init__(db_name)
+        self.selected_fields = selected_fields
+        self.window = window
+
+    def run_stage(self, db_manager):
+        return self.run_recorded(db_manager, 'preprocess', {'fields': self.selected_fields, 'window': self.window})
+
+
+class EmbeddingOptionsThread(StageThread):
+    # Reads what the GUI asks before embedding (see read_embedding_options) off the GUI thread
+    options_ready = pyqtSignal(object)
+
+    def __init__(self, db_name, model_name, window=None):
+        super().__init__(db_name)
+        self.model_name = model_name
+        self.window = window
+
+    def run_stage(self, db_manager):
+        return read_embedding_options(db_manager, self.model_name, self.window)
+
+    def on_result(self, options):
+        self.options_ready.emit(options)
+
+
+class EmbeddingGeneratorThread(StageThread):
+    def __init__(self, db_path, model_name, resume=True, only_missing=False, window=None):
+        super().__init__(db_path)
+        # only_missing embeds newly imported logs and keeps existing embeddings, clusters and layouts
+        self.only_missing = only_missing
+        self.options = {'model_name': model_name, 'resume': resume, 'only_missing': only_missing,
+                        'window': window}
+
+    def run_stage(self, db_manager):
+        return self.run_recorded(db_manager, 'embed', self.options)
+
+
+class StartupThread(StageThread):
+    # Section name and value as read by iter_startup_sections, so the window fills in as each one arrives
+    section_loaded = pyqtSignal(str, object)
+
+    def run_stage(self, db_manager):
+        for section, value in iter_startup_sections(db_manager):
+            self.section_loaded.emit(section, value)
+
+
+class RenderDataThread(StageThread):
+    # Switches to a saved projection, which rewrites the coordinates of every log, and reads what the 3D view
+    # needs; the result is None when no log has coordinates
+    def __init__(self, db_name, projection_id=None):
+        super().__init__(db_name)
+        self.projection_id = projection_id
+
+    def run_stage(self, db_manager):
+        if self.projection_id is not None:
+            db_manager.activate_projection(self.projection_id)
+            self.cancel_token.raise_if_cancelled()
+        return prepare_render_data(db_manager)
+
+
+class ReductionThread(StageThread):
+    projection_ready = pyqtSignal(int)
+
+    def __init__(self, db_name, params=None, force=False, window=None):
+        super().__init__(db_name)
+        self.params = reduction_params(**(params or {}))
+        self.force = force
+        self.window = window
+
+    def run_stage(self, db_manager):
+        return self.run_recorded(db_manager, 'reduce', {'params': self.params, 'force': self.force,
+                                                        'window': self.window})
+
+    def on_result(self, result):
+        self.projection_ready.emit(result['projection_id'])
+
+
+class PlacementThread(StageThread):
+    projection_ready = pyqtSignal(int)
+
+    def run_stage(self, db_manager):
+        return place_new_logs(db_manager, self.progress_update.emit, self.status_update.emit, self.cancel_token)
+
+    def on_result(self, projection_id):
+        if projection_id is not None:
+            self.projection_ready.emit(projection_id)
+
+
+class ClusteringThread(StageThread):
+    # Emitted only when clustering succeeded, unlike QThread.finished
+    clustering_finished = pyqtSignal()
+
+    def __init__(self, db_name, epsilon=0.5, min_samples=5, metric='euclidean', neighbor_backend='auto',
+                 algorithm='dbscan', n_clusters=50, window=None):
+        super().__init__(db_name)
+        self.options = {'algorithm': algorithm, 'epsilon': epsilon, 'min_samples': min_samples, 'metric': metric,
+                        'neighbor_backend': neighbor_backend, 'n_clusters': n_clusters, 'window': window}
+
+    def run_stage(self, db_manager):
+        return self.run_recorded(db_manager, 'cluster', self.options)
+
+    def on_result(self, result):
+        self.clustering_finished.emit()
+
+
+class PipelineThread(StageThread):
+    # One report per stage, see run_pipeline
+    pipeline_finished = pyqtSignal(list)
+
+    def __init__(self, db_name, options, force=(), window=None):
+        super().__init__(db_name)
+        self.options = options
+        self.force = set(force)
+        self.window = window
+
+    def run_stage(self, db_manager):
+        return run_pipeline(db_manager, self.options, self.force, self.progress_update.emit,
+                            self.status_update.emit, self.cancel_token, self.window)
+
+    def on_result(self, reports):
+        self.pipeline_finished.emit(reports)
+
+
+class ClusterSweepThread(StageThread):
+    sweep_ready = pyqtSignal(list, float)
+
+    def __init__(self, db_name, eps_values=None, min_samples_values=None, metric='euclidean',
+                 neighbor_backend='auto', window=None):
+        super().__init__(db_name)
+        self.eps_values = eps_values
+        self.min_samples_values = min_samples_values
+        self.metric = metric
+        self.neighbor_backend = neighbor_backend
+        self.window = window
+
+    def run_stage(self, db_manager):
+        return sweep_parameters(db_manager, self.eps_values, self.min_samples_values, self.metric,
+                                self.neighbor_backend, self.progress_update.emit, self.status_update.emit,
+                                self.cancel_token, normalize_window(self.window))
+
+    def on_result(self, result):
+        self.sweep_ready.emit(*result)
+
+
+class OnlineAssignmentThread(StageThread):
+    recluster_recommended = pyqtSignal(str)
+
+    def run_stage(self, db_manager):
+        return assign_new_logs(db_manager, self.progress_update.emit, self.status_update.emit, self.cancel_token)
+
+    def on_result(self, reason):
+        if reason:
+            self.recluster_recommended.emit(reason)
+
+
+class SimilaritySearchThread(StageThread):
+    # Query log id, neighbour ids, distances (nearest first) and the query time in ms
+    results_ready = pyqtSignal(int, object, object, float)
+
+    def __init__(self, db_name, log_id, metric='euclidean', k=DEFAULT_TOP_K, searcher=None, fingerprint=None):
+        super().__init__(db_name)
+        self.log_id = log_id
+        self.metric = metric
+        self.k = k
+        # Embeddings and index of the previous query are reused while the embeddings are unchanged
+        self.searcher = searcher
+        self.fingerprint = fingerprint
+
+    def run_stage(self, db_manager):
+        fingerprint = db_manager.get_embedding_fingerprint()
+        if self.searcher is None or self.searcher.metric != self.metric or fingerprint != self.fingerprint:
+            self.searcher = SimilaritySearch.from_database(db_manager, self.metric, status=self.status_update.emit)
+            self.fingerprint = fingerprint
+        if self.searcher is None:
+            raise PipelineError("No embeddings found. Generate embeddings first.")
+        # Loading embeddings or building the index is the slow part, the loaded searcher is kept when cancelled
+        self.cancel_token.raise_if_cancelled()
+        started = time.perf_counter()
+        result = self.searcher.similar_to_log(self.log_id, self.k)
+        elapsed = (time.perf_counter() - started) * 1000
+        if result is None:
+            raise PipelineError(f"Log {self.log_id} has no embedding yet.")
+        return result, elapsed
+
+    def on_result(self, result):
+        (log_ids, distances), elapsed = result
+        self.results_ready.emit(self.log_id, log_ids, distances, elapsed)
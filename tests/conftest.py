@@ -0,0 +1,54 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.db_manager import DatabaseManager  # noqa: E402
+
+START_TIME = datetime(2024, 6, 13)
+
+
+def write_logs(db_manager, times, embeddings=None):
+    # One log per time (None for a log without a timestamp), embedded with the given float32 rows if any.
+    # Returns the log ids in insertion order.
+    log_ids = []
+    for time in times:
+        timestamp = time.isoformat(sep=' ', timespec='seconds') if time is not None else None
+        log = {'method': 'GET', 'full_path': f'/item/{len(log_ids)}'}
+        if timestamp is not None:
+            log['timestamp'] = timestamp
+        log_ids.append(db_manager.insert_log(log, timestamp))
+    if embeddings is not None:
+        db_manager.update_log_embeddings(zip(np.asarray(embeddings, dtype=np.float32), [None] * len(log_ids),
+                                             log_ids))
+        job_id = db_manager.create_embedding_job('test', 'test', len(log_ids))
+        db_manager.checkpoint_embedding_job(job_id, log_ids[-1], len(log_ids), embeddings.shape[1])
+        db_manager.set_embedding_job_status(job_id, 'completed')
+    db_manager.commit()
+    return log_ids
+
+
+def blob_embeddings(n_logs, n_blobs=4, dim=8, spread=0.05, random_state=0):
+    # Well separated blobs, so DBSCAN finds the same clusters on any subset
+    rng = np.random.default_rng(random_state)
+    centers = rng.normal(size=(n_blobs, dim)) * 5
+    return (centers[np.arange(n_logs) % n_blobs] + rng.normal(scale=spread, size=(n_logs, dim))).astype(np.float32)
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    db_manager = DatabaseManager(str(tmp_path / 'test.db'))
+    db_manager.create_tables()
+    yield db_manager
+    db_manager.close()
+
+
+@pytest.fixture
+def hourly_times():
+    def make(n_logs, start=START_TIME):
+        return [start + timedelta(hours=index) for index in range(n_logs)]
+    return make
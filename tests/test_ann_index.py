@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from src.clustering import cluster_logs, sweep_parameters
+from src.time_window import normalize_window
+from tests.conftest import START_TIME, blob_embeddings, write_logs
+
+N_LOGS = 400
+# The first 100 hours of the 400 logs
+WINDOW = normalize_window({'start': START_TIME.isoformat(), 'end': '2024-06-17T04:00:00'})
+
+
+@pytest.fixture
+def embedded_db(db_manager, hourly_times):
+    write_logs(db_manager, hourly_times(N_LOGS), blob_embeddings(N_LOGS))
+    return db_manager
+
+
+def clustered_count(db_manager):
+    cursor = db_manager.get_cursor()
+    cursor.execute("SELECT COUNT(*) FROM logs WHERE cluster_id != -1")
+    return cursor.fetchone()[0]
+
+
+def run_cluster(db_manager, window):
+    return cluster_logs(db_manager, epsilon=0.5, min_samples=3, neighbor_backend='ann', window=window)
+
+
+@pytest.mark.parametrize('windows', [(None, WINDOW, None), (WINDOW, None, WINDOW)])
+def test_full_and_windowed_clustering_share_the_saved_index(embedded_db, windows):
+    for window in windows:
+        result = run_cluster(embedded_db, window)
+        assert result['clusters'] == 4
+        assert clustered_count(embedded_db) == (100 if window else N_LOGS)
+
+
+def test_sweep_after_windowed_clustering(embedded_db):
+    run_cluster(embedded_db, WINDOW)
+    results, _ = sweep_parameters(embedded_db, eps_values=[0.5], min_samples_values=[3], neighbor_backend='ann')
+    assert results[0]['n_clusters'] == 4
+
+
+def test_index_built_over_other_ids_is_rebuilt(embedded_db):
+    from src.ann_index import load_or_build_index
+    log_ids, vectors = embedded_db.load_embeddings(*embedded_db.window_filter(WINDOW))
+    window_index = load_or_build_index(embedded_db, log_ids, vectors)
+    all_ids, all_vectors = embedded_db.load_embeddings()
+    index = load_or_build_index(embedded_db, all_ids, all_vectors)
+    assert len(window_index.ids) == 100
+    assert np.array_equal(np.sort(index.ids), all_ids)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from sklearn.cluster import DBSCAN
+
+from src.cluster_sweep import exact_radius_graph, graph_dbscan_labels, restrict_graph
+
+
+def fixture_points(random_state=0):
+    # Blobs of different density, a bridge of sparse points between two of them, uniform noise and duplicates
+    rng = np.random.default_rng(random_state)
+    blobs = [rng.normal(center, scale, size=(count, 2))
+             for center, scale, count in (((0, 0), 0.3, 60), ((4, 0), 0.5, 50), ((0, 5), 0.15, 30))]
+    bridge = np.column_stack([np.linspace(1, 3, 8), np.zeros(8)])
+    noise = rng.uniform(-3, 7, size=(25, 2))
+    points = np.vstack(blobs + [bridge, noise])
+    return np.vstack([points, points[:5]])
+
+
+def same_partition(first, second):
+    # Equal up to renaming the labels
+    pairs = set(zip(first.tolist(), second.tolist()))
+    return len(pairs) == len(set(first.tolist())) == len(set(second.tolist()))
+
+
+@pytest.mark.parametrize('metric', ['euclidean', 'cosine'])
+@pytest.mark.parametrize('eps, min_samples', [(0.3, 3), (0.5, 5), (0.8, 10), (0.1, 20)])
+def test_graph_dbscan_matches_sklearn(metric, eps, min_samples):
+    points = fixture_points()
+    if metric == 'cosine':
+        # Lifted onto a plane at distance 10 from the origin, where the cosine distance of two points is about
+        # their squared distance / 200
+        points = np.column_stack([points, np.full(len(points), 10.0)])
+        eps = eps ** 2 / 200
+    # The sweep builds one graph for the largest eps and restricts it per setting
+    graph = restrict_graph(exact_radius_graph(points, eps * 2, metric), eps)
+    labels = graph_dbscan_labels(graph, min_samples)
+    expected = DBSCAN(eps=eps, min_samples=min_samples, metric=metric).fit(points)
+
+    core = np.zeros(len(points), dtype=bool)
+    core[expected.core_sample_indices_] = True
+    assert np.array_equal(labels == -1, expected.labels_ == -1)
+    assert same_partition(labels[core], expected.labels_[core])
+
+    # A border point may join any cluster it touches, sklearn and the graph pick by different orders
+    mapping = dict(zip(expected.labels_[core].tolist(), labels[core].tolist()))
+    for point in np.flatnonzero(~core & (labels != -1)):
+        neighbors = graph.indices[graph.indptr[point]:graph.indptr[point + 1]]
+        assert labels[point] in set(labels[neighbors[core[neighbors]]].tolist())
+        assert mapping[expected.labels_[point]] in set(labels[neighbors[core[neighbors]]].tolist())
+
+
+def test_graph_dbscan_without_core_points():
+    points = fixture_points()
+    labels = graph_dbscan_labels(restrict_graph(exact_radius_graph(points, 0.01), 0.01), 50)
+    assert (labels == -1).all()
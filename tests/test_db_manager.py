@@ -0,0 +1,154 @@
+import random
+import sqlite3
+import threading
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from src.db_manager import DatabaseManager
+from src.time_window import normalize_window
+from tests.conftest import START_TIME, write_logs
+
+
+def selected_ids(db_manager, window):
+    where, params = db_manager.window_filter(normalize_window(window))
+    cursor = db_manager.get_cursor()
+    cursor.execute("SELECT id FROM logs l" + (f" WHERE {where}" if where else "") + " ORDER BY id", params)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def expected_ids(log_ids, times, start=None, end=None):
+    return sorted(log_id for log_id, time in zip(log_ids, times)
+                  if time is not None and (start is None or time >= start) and (end is None or time < end))
+
+
+def test_window_filter_with_logs_imported_out_of_time_order(db_manager):
+    times = [START_TIME + timedelta(minutes=minute) for minute in range(300)]
+    random.Random(0).shuffle(times)
+    # Some logs have no time and are outside every window
+    times[::7] = [None] * len(times[::7])
+    log_ids = write_logs(db_manager, times)
+    start, end = START_TIME + timedelta(hours=1), START_TIME + timedelta(hours=2)
+
+    assert selected_ids(db_manager, {'start': start.isoformat(), 'end': end.isoformat()}) == \
+        expected_ids(log_ids, times, start, end)
+    assert selected_ids(db_manager, {'start': start.isoformat()}) == expected_ids(log_ids, times, start=start)
+    assert selected_ids(db_manager, {'end': end.isoformat()}) == expected_ids(log_ids, times, end=end)
+    assert selected_ids(db_manager, None) == log_ids
+
+
+def test_window_filter_pages_in_id_order(db_manager):
+    times = [START_TIME + timedelta(minutes=minute) for minute in range(100)][::-1]
+    log_ids = write_logs(db_manager, times)
+    db_manager.update_preprocessed_texts((f"log {log_id}", log_id) for log_id in log_ids)
+    window = normalize_window({'start': (START_TIME + timedelta(minutes=20)).isoformat(),
+                               'end': (START_TIME + timedelta(minutes=60)).isoformat()})
+    where, params = db_manager.window_filter(window)
+    pages, last_id = [], 0
+    while True:
+        page = db_manager.get_logs_to_embed(last_id, 7, where=where, params=params)
+        if not page:
+            break
+        pages.extend(row[0] for row in page)
+        last_id = page[-1][0]
+    assert pages == expected_ids(log_ids, times, START_TIME + timedelta(minutes=20),
+                                 START_TIME + timedelta(minutes=60))
+    assert db_manager.count_logs_to_embed(where=where, params=params) == 40
+
+
+def test_window_filter_without_matching_logs(db_manager, hourly_times):
+    write_logs(db_manager, hourly_times(10))
+    assert db_manager.window_filter(normalize_window({'start': '2030-01-01'})) == ("0", ())
+    assert selected_ids(db_manager, {'start': '2030-01-01'}) == []
+    assert db_manager.window_filter(None) == ("", ())
+
+
+def swap_in(db_manager, log_ids, labels, **kwargs):
+    db_manager.start_cluster_staging()
+    db_manager.stage_cluster_labels(log_ids, labels)
+    return db_manager.swap_clusters('test', {'labels': 'test'}, **kwargs)
+
+
+def read_clustering(connection):
+    # Cluster name per log, with the clusters and runs rows, as a reader on its own connection sees them
+    logs = connection.execute("SELECT l.id, c.name FROM logs l JOIN clusters c ON c.id = l.cluster_id "
+                              "ORDER BY l.id").fetchall()
+    clusters = connection.execute("SELECT COUNT(*) FROM clusters WHERE id != -1").fetchone()[0]
+    runs = connection.execute("SELECT log_count, noise_count FROM clustering_runs").fetchall()
+    return logs, clusters, runs
+
+
+def test_swap_clusters_is_invisible_until_committed(db_manager, hourly_times, monkeypatch):
+    log_ids = write_logs(db_manager, hourly_times(30))
+    swap_in(db_manager, log_ids, np.arange(30) % 3)
+    reader = sqlite3.connect(db_manager.db_name)
+    before = read_clustering(reader)
+    seen = []
+    insert_clustering_run = db_manager.insert_clustering_run
+
+    def read_while_swapping(cursor, algorithm, params):
+        # Logs are relabeled and clusters replaced at this point, inside the write transaction
+        seen.append(read_clustering(reader))
+        return insert_clustering_run(cursor, algorithm, params)
+    monkeypatch.setattr(db_manager, 'insert_clustering_run', read_while_swapping)
+    swap_in(db_manager, log_ids, np.where(np.arange(30) < 10, -1, np.arange(30) % 5))
+
+    assert seen == [before]
+    logs, clusters, runs = read_clustering(reader)
+    assert clusters == 5 and runs == [(30, 10)]
+    assert [name for _, name in logs] == ['Noise'] * 10 + [f'Cluster {index % 5}' for index in range(10, 30)]
+    reader.close()
+
+
+def test_failed_swap_keeps_the_previous_clustering(db_manager, hourly_times, monkeypatch):
+    log_ids = write_logs(db_manager, hourly_times(20))
+    swap_in(db_manager, log_ids, np.arange(20) % 4)
+    reader = sqlite3.connect(db_manager.db_name)
+    before = read_clustering(reader)
+
+    def fail(cursor, algorithm, params):
+        raise sqlite3.OperationalError("disk I/O error")
+    monkeypatch.setattr(db_manager, 'insert_clustering_run', fail)
+    with pytest.raises(sqlite3.OperationalError):
+        swap_in(db_manager, log_ids, np.zeros(20))
+
+    assert read_clustering(reader) == before
+    assert read_clustering(db_manager.get_connection()) == before
+    # The staged labels are dropped, the next clustering starts from an empty stage
+    assert not db_manager.get_connection().execute(
+        "SELECT COUNT(*) FROM sqlite_temp_master WHERE name = 'staged_labels'").fetchone()[0]
+    reader.close()
+
+
+def test_concurrent_reads_see_one_clustering(db_manager, hourly_times):
+    log_ids = write_logs(db_manager, hourly_times(200))
+    labelings = [np.arange(200) % 4, np.where(np.arange(200) % 3 == 0, -1, np.arange(200) % 7)]
+    expected = [[f'Cluster {label}' if label != -1 else 'Noise' for label in labels] for labels in labelings]
+    swap_in(db_manager, log_ids, labelings[0])
+    stop = threading.Event()
+    snapshots, errors = [], []
+
+    def read_until_stopped():
+        reader = DatabaseManager(db_manager.db_name)
+        try:
+            while not stop.is_set():
+                # One statement reads one snapshot, the tree and the 3D view read clusters this way
+                cursor = reader.get_cursor()
+                cursor.execute("SELECT c.name FROM logs l JOIN clusters c ON c.id = l.cluster_id ORDER BY l.id")
+                snapshots.append([row[0] for row in cursor.fetchall()])
+        except sqlite3.Error as e:
+            errors.append(e)
+        finally:
+            reader.close()
+
+    thread = threading.Thread(target=read_until_stopped)
+    thread.start()
+    try:
+        for index in range(20):
+            swap_in(db_manager, log_ids, labelings[(index + 1) % 2])
+    finally:
+        stop.set()
+        thread.join()
+    assert not errors
+    assert snapshots and all(snapshot in expected for snapshot in snapshots)
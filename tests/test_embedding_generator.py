@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from src.embedding_generator import EmbeddingGenerator, read_embedding_options
+from src.lexical_embedding import LexicalEmbedder, LEXICAL_MODEL_NAME
+from src.startup import read_pipeline_state
+from tests.conftest import write_logs
+
+PATHS = ['/wp-login.php', '/api/v1/users', '/static/app.js', '/.env', '/cgi-bin/luci', '/admin/config.php']
+
+
+def add_texts(db_manager, hourly_times, count, offset=0):
+    log_ids = write_logs(db_manager, hourly_times(count))
+    db_manager.update_preprocessed_texts(
+        (f"GET {PATHS[(offset + index) % len(PATHS)]}?id={offset + index} HTTP/1.1", log_id)
+        for index, log_id in enumerate(log_ids))
+    db_manager.commit()
+    return log_ids
+
+
+def stored_embeddings(db_manager):
+    log_ids, embeddings = db_manager.load_embeddings()
+    return dict(zip(log_ids.tolist(), embeddings))
+
+
+def test_only_missing_reuses_the_basis_of_the_full_run(db_manager, hourly_times):
+    add_texts(db_manager, hourly_times, 60)
+    assert EmbeddingGenerator(LEXICAL_MODEL_NAME).generate(db_manager)
+    before = stored_embeddings(db_manager)
+    basis = db_manager.get_embedding_model_state(model_name=LEXICAL_MODEL_NAME)
+
+    # Each round adds logs unlike the first ones, a basis refit on the embedded logs would drift
+    for count, offset in ((40, 3), (30, 5)):
+        new_ids = add_texts(db_manager, hourly_times, count, offset=offset)
+        assert EmbeddingGenerator(LEXICAL_MODEL_NAME, only_missing=True).generate(db_manager)
+    after = stored_embeddings(db_manager)
+    assert all(np.array_equal(after[log_id], embedding) for log_id, embedding in before.items())
+
+    texts = dict(db_manager.get_logs_to_embed(0, 1000))
+    expected = LexicalEmbedder.from_bytes(basis).transform([texts[log_id] for log_id in new_ids])
+    assert np.allclose(np.array([after[log_id] for log_id in new_ids]), expected, atol=1e-6)
+    # Saved again with the new job, so the next run without a full refit finds it
+    assert db_manager.get_embedding_model_state(model_name=LEXICAL_MODEL_NAME) == basis
+
+
+def interrupted_generator(only_missing=False):
+    # Cancels itself after embedding its first batch of 10 logs
+    generator = EmbeddingGenerator(LEXICAL_MODEL_NAME, only_missing=only_missing)
+    generator.batch_size = 10
+    embed_batch = generator.embed_batch
+
+    def embed_then_cancel(texts):
+        generator.cancel()
+        return embed_batch(texts)
+    generator.embed_batch = embed_then_cancel
+    return generator
+
+
+def test_resumed_job_reloads_its_basis(db_manager, hourly_times, monkeypatch):
+    add_texts(db_manager, hourly_times, 50)
+    generator = interrupted_generator()
+    assert not generator.generate(db_manager)
+    assert db_manager.count_embeddings() == 10
+
+    monkeypatch.setattr(LexicalEmbedder, 'partial_fit', lambda self, texts: pytest.fail("refit on resume"))
+    resumed = EmbeddingGenerator(LEXICAL_MODEL_NAME)
+    resumed.batch_size = 10
+    assert resumed.generate(db_manager)
+    assert db_manager.count_embeddings() == 50
+    assert np.array_equal(resumed.lexical_embedder.components, generator.lexical_embedder.components)
+
+
+def test_embedding_options_find_an_interrupted_only_missing_job(db_manager, hourly_times):
+    add_texts(db_manager, hourly_times, 30)
+    assert EmbeddingGenerator(LEXICAL_MODEL_NAME).generate(db_manager)
+    add_texts(db_manager, hourly_times, 25)
+    assert not interrupted_generator(only_missing=True).generate(db_manager)
+
+    options = read_embedding_options(db_manager, LEXICAL_MODEL_NAME)
+    assert options['job']['only_missing'] and options['job']['processed_count'] == 10
+    assert options['embeddings_exist'] and options['new_logs'] == 15
+    assert read_pipeline_state(db_manager)['interrupted_job']['only_missing']
@@ -0,0 +1,55 @@
+import json
+
+from src import import_logic
+from src.import_logic import backfill_timestamps, import_logs
+from src.pipeline import run_stage
+
+
+def insert_untimed(db_manager, raw_times):
+    # Logs as imported before timestamps were parsed: the time is only in raw_data
+    log_ids = [db_manager.insert_log({'method': 'GET', 'full_path': f'/{index}', 'time': raw_time})
+               for index, raw_time in enumerate(raw_times)]
+    db_manager.commit()
+    return log_ids
+
+
+def stored_timestamps(db_manager):
+    cursor = db_manager.get_cursor()
+    cursor.execute("SELECT timestamp FROM logs ORDER BY id")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def test_backfill_parses_the_raw_times_in_pages(db_manager, monkeypatch):
+    monkeypatch.setattr(import_logic, 'TIMESTAMP_BACKFILL_BATCH_SIZE', 2)
+    insert_untimed(db_manager, ['2024-06-13T08:00:00Z', 1718272800, 'unknown', '13/Jun/2024:12:00:00 +0200',
+                                None])
+    assert backfill_timestamps(db_manager) == 3
+    assert stored_timestamps(db_manager) == ['2024-06-13 08:00:00', '2024-06-13 10:00:00', None,
+                                             '2024-06-13 10:00:00', None]
+    # The first log has its timestamp now, later calls return without reading the logs again
+    assert backfill_timestamps(db_manager) == 0
+
+
+def test_backfill_skips_logs_without_times(db_manager):
+    insert_untimed(db_manager, [None, '2024-06-13'])
+    assert backfill_timestamps(db_manager) == 0
+    assert stored_timestamps(db_manager) == [None, None]
+
+
+def test_windowed_stage_backfills_first(db_manager):
+    log_ids = insert_untimed(db_manager, ['2024-06-12T23:00:00', '2024-06-13T01:00:00', '2024-06-14T01:00:00'])
+    result = run_stage(db_manager, 'preprocess', {'fields': ['method', 'full_path'],
+                                                  'window': {'start': '2024-06-13', 'end': '2024-06-14'}})
+    assert result['preprocessed'] == 1
+    cursor = db_manager.get_cursor()
+    cursor.execute("SELECT id FROM logs WHERE preprocessed_text IS NOT NULL")
+    assert [row[0] for row in cursor.fetchall()] == [log_ids[1]]
+
+
+def test_import_backfills_earlier_logs(db_manager, tmp_path):
+    insert_untimed(db_manager, ['2024-06-13T08:00:00'])
+    log_file = tmp_path / 'new.log'
+    log_file.write_text(json.dumps({'method': 'POST', 'timestamp': '2024-06-14T08:00:00+01:00'}) + "\n")
+    result = import_logs(db_manager, [str(log_file)])
+    assert result['timestamped'] == 1
+    assert stored_timestamps(db_manager) == ['2024-06-13 08:00:00', '2024-06-14 07:00:00']
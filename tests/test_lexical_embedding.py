@@ -0,0 +1,39 @@
+import numpy as np
+
+from src.lexical_embedding import LexicalEmbedder
+
+TEXTS = ['GET /wp-login.php HTTP/1.1 Mozilla/5.0', 'GET /wp-login.php?redirect=1 HTTP/1.1 Mozilla/5.0',
+         'POST /api/v1/users {"name": "admin"}', 'POST /api/v1/users {"name": "guest"}',
+         'PRI * HTTP/2.0', '', 'ab', 'Ünïcode → path/ä']
+
+
+def fitted(texts=TEXTS):
+    embedder = LexicalEmbedder(n_components=4, sketch_size=64)
+    embedder.partial_fit(texts)
+    return embedder
+
+
+def test_transform_is_deterministic_and_normalized():
+    first, second = fitted().transform(TEXTS), fitted().transform(TEXTS)
+    assert first.dtype == np.float32 and first.shape == (len(TEXTS), 4)
+    assert np.array_equal(first, second)
+    norms = np.linalg.norm(first, axis=1)
+    assert np.allclose(norms[norms > 0], 1, atol=1e-5)
+    # A text without n-grams has no direction
+    assert not first[TEXTS.index('')].any()
+
+
+def test_texts_do_not_share_ngrams_across_a_batch():
+    embedder = fitted()
+    together = embedder.transform(TEXTS)
+    alone = np.vstack([embedder.transform([text]) for text in TEXTS])
+    assert np.allclose(together, alone, atol=1e-6)
+
+
+def test_similar_requests_are_closer():
+    embedder = LexicalEmbedder(n_components=8, sketch_size=256)
+    embedder.partial_fit(TEXTS)
+    vectors = embedder.transform(TEXTS)
+    similarity = vectors @ vectors.T
+    assert similarity[0, 1] > similarity[0, 2]
+    assert similarity[2, 3] > similarity[2, 0]
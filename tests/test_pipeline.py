@@ -0,0 +1,72 @@
+import pytest
+
+from src.lexical_embedding import LEXICAL_MODEL_NAME
+from src.pipeline import run_pipeline
+from src.reduction import reduction_params
+from tests.conftest import START_TIME, write_logs
+
+# Small enough for exact t-SNE in a test; the lexical embedder needs no model download
+OPTIONS = {
+    'preprocess': {'fields': ['method', 'full_path']},
+    'embed': {'model_name': LEXICAL_MODEL_NAME},
+    'reduce': {'params': reduction_params(mode='pca', pca_components=8, perplexity=5.0, max_iter=250)},
+    'cluster': {'algorithm': 'dbscan', 'epsilon': 0.5, 'min_samples': 3, 'metric': 'euclidean',
+                'neighbor_backend': 'auto', 'n_clusters': 50},
+}
+ALL_RAN = {'import': 'skipped', 'preprocess': 'ran', 'embed': 'ran', 'reduce': 'ran', 'cluster': 'ran'}
+ALL_REUSED = {'import': 'skipped', 'preprocess': 'reused', 'embed': 'reused', 'reduce': 'reused',
+              'cluster': 'reused'}
+
+
+def actions(reports):
+    return {report['stage']: report['action'] for report in reports}
+
+
+def with_options(stage, **changes):
+    return dict(OPTIONS, **{stage: dict(OPTIONS[stage], **changes)})
+
+
+@pytest.fixture
+def pipeline_db(db_manager, hourly_times):
+    write_logs(db_manager, hourly_times(120))
+    assert actions(run_pipeline(db_manager, OPTIONS)) == ALL_RAN
+    return db_manager
+
+
+def test_second_run_reuses_every_stage(pipeline_db):
+    reports = run_pipeline(pipeline_db, OPTIONS)
+    assert actions(reports) == ALL_REUSED
+    assert all(report['finished_at'] for report in reports if report['action'] == 'reused')
+
+
+def test_stages_without_options_reuse_their_last_params(pipeline_db):
+    assert actions(run_pipeline(pipeline_db, {})) == ALL_REUSED
+
+
+def test_changed_fields_rerun_preprocess_and_everything_downstream(pipeline_db):
+    options = with_options('preprocess', fields=['full_path'])
+    assert actions(run_pipeline(pipeline_db, options)) == ALL_RAN
+    assert actions(run_pipeline(pipeline_db, options)) == ALL_REUSED
+
+
+def test_forcing_reduce_reruns_only_reduce(pipeline_db):
+    assert actions(run_pipeline(pipeline_db, OPTIONS, force={'reduce'})) == dict(ALL_REUSED, reduce='ran')
+
+
+def test_changed_params_rerun_only_that_stage(pipeline_db):
+    # Projection and clustering both read only the embeddings, neither invalidates the other
+    reduce_options = with_options('reduce', params=dict(OPTIONS['reduce']['params'], perplexity=8.0))
+    assert actions(run_pipeline(pipeline_db, reduce_options)) == dict(ALL_REUSED, reduce='ran')
+    cluster_options = dict(reduce_options, cluster=dict(OPTIONS['cluster'], epsilon=0.3))
+    assert actions(run_pipeline(pipeline_db, cluster_options)) == dict(ALL_REUSED, cluster='ran')
+    assert actions(run_pipeline(pipeline_db, cluster_options)) == ALL_REUSED
+
+
+def test_window_change_reruns_the_windowed_stages(pipeline_db):
+    window = {'start': START_TIME.isoformat(), 'end': '2024-06-15T00:00:00'}
+    reports = run_pipeline(pipeline_db, OPTIONS, window=window)
+    assert actions(reports) == ALL_RAN
+    assert reports[1]['result']['preprocessed'] == 48
+    assert actions(run_pipeline(pipeline_db, OPTIONS, window=window)) == ALL_REUSED
+    # Back to all time
+    assert actions(run_pipeline(pipeline_db, OPTIONS)) == ALL_RAN
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from src.point_picking import PointPicker, PICK_RADIUS_PIXELS
+
+VIEWPORT = (0, 0, 800, 600)
+
+
+def perspective(fovy, aspect, near, far):
+    f = 1 / np.tan(np.radians(fovy) / 2)
+    matrix = np.zeros((4, 4))
+    matrix[0, 0], matrix[1, 1] = f / aspect, f
+    matrix[2, 2], matrix[2, 3] = (far + near) / (near - far), 2 * far * near / (near - far)
+    matrix[3, 2] = -1
+    return matrix
+
+
+def modelview(zoom, angle_x, angle_y):
+    # glTranslatef(0, 0, zoom), glRotatef(angle_x, 1, 0, 0), glRotatef(angle_y, 0, 1, 0) as in the 3D view
+    a, b = np.radians(angle_x), np.radians(angle_y)
+    translate = np.eye(4)
+    translate[2, 3] = zoom
+    rotate_x = np.array([[1, 0, 0, 0], [0, np.cos(a), -np.sin(a), 0], [0, np.sin(a), np.cos(a), 0], [0, 0, 0, 1]])
+    rotate_y = np.array([[np.cos(b), 0, np.sin(b), 0], [0, 1, 0, 0], [-np.sin(b), 0, np.cos(b), 0], [0, 0, 0, 1]])
+    return translate @ rotate_x @ rotate_y
+
+
+def brute_force_distances(points, transform):
+    homogeneous = np.hstack([points, np.ones((len(points), 1))]) @ transform.T
+    screen = homogeneous[:, :2] / homogeneous[:, 3:4]
+    screen_x = (screen[:, 0] + 1) / 2 * VIEWPORT[2]
+    screen_y = (screen[:, 1] + 1) / 2 * VIEWPORT[3]
+    return screen_x, screen_y, homogeneous[:, 3] > 0.1
+
+
+# The default camera, a rotated one and one inside the points, where the ball count is capped
+@pytest.mark.parametrize('zoom, angle_x, angle_y', [(-5, 0, 0), (-3, 30, 60), (-0.5, 10, 200)])
+def test_pick_matches_brute_force(zoom, angle_x, angle_y):
+    rng = np.random.default_rng(0)
+    points = np.clip(rng.normal(scale=0.3, size=(20000, 3)), -1, 1)
+    mask = rng.uniform(size=len(points)) < 0.5
+    picker = PointPicker(points)
+    view, projection = modelview(zoom, angle_x, angle_y), perspective(45, 800 / 600, 0.1, 100.0)
+    screen_x, screen_y, in_front = brute_force_distances(points, projection @ view)
+    hits = 0
+    for x, y in rng.uniform((200, 150), (600, 450), size=(40, 2)):
+        for pickable in (None, mask):
+            distances = np.hypot(screen_x - x, screen_y - y)
+            distances[~in_front] = np.inf
+            if pickable is not None:
+                distances[~pickable] = np.inf
+            picked = picker.pick(x, y, view.T.ravel(), projection.T.ravel(), VIEWPORT, mask=pickable)
+            if distances.min() > PICK_RADIUS_PIXELS:
+                assert picked is None
+            else:
+                assert picked is not None and distances[picked] == pytest.approx(distances.min())
+                hits += 1
+    assert hits > 0
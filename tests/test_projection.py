@@ -0,0 +1,27 @@
+import numpy as np
+
+from src.projection import project, resolve_mode
+from src.reduction import reduction_params
+
+
+def test_auto_switches_to_landmarks_above_the_landmark_count():
+    assert resolve_mode('auto', 20000) == 'pca'
+    assert resolve_mode('auto', 20001) == 'landmark'
+    assert resolve_mode('auto', 5000, landmarks=1000) == 'landmark'
+    assert resolve_mode('auto', 1000, landmarks=1000) == 'pca'
+    assert resolve_mode('exact', 10 ** 6) == 'exact'
+
+
+def test_auto_projection_runs_t_sne_on_the_landmarks_only():
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(600, 16)).astype(np.float32)
+    messages = []
+    params = reduction_params(landmarks=200, pca_components=8, max_iter=250, perplexity=10.0)
+    coordinates = project(embeddings, params, status=messages.append)
+    assert coordinates.shape == (600, 3) and np.isfinite(coordinates).all()
+    # Stratified sampling rounds every stratum's quota down
+    landmark_runs = [message for message in messages if message.startswith("Running t-SNE on")]
+    assert len(landmark_runs) == 1 and " landmarks..." in landmark_runs[0]
+    assert 150 <= int(landmark_runs[0].split()[3]) <= 200
+    # sklearn's t-SNE cannot be interrupted, the status says so
+    assert all("Cancel takes effect once t-SNE finishes" in message for message in messages if "t-SNE" in message)
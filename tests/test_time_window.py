@@ -0,0 +1,67 @@
+import pytest
+
+from src.time_window import ALL_TIME, describe_window, log_timestamp, normalize_window, parse_timestamp
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2024-06-13T08:30:00', '2024-06-13 08:30:00'),
+    ('2024-06-13 08:30:00.123456', '2024-06-13 08:30:00'),
+    ('2024-06-13T08:30:00Z', '2024-06-13 08:30:00'),
+    ('2024-06-13T10:30:00+02:00', '2024-06-13 08:30:00'),
+    ('2024-06-13', '2024-06-13 00:00:00'),
+    # A date followed by a time that cannot be read counts as midnight
+    ('2024-06-13 at noon', '2024-06-13 00:00:00'),
+    (1718267400, '2024-06-13 08:30:00'),
+    (1718267400.5, '2024-06-13 08:30:00'),
+    ('1718267400', '2024-06-13 08:30:00'),
+    (1718267400000, '2024-06-13 08:30:00'),
+    ('1718267400000', '2024-06-13 08:30:00'),
+    ('13/Jun/2024:10:30:00 +0200', '2024-06-13 08:30:00'),
+    ('13/Jun/2024:08:30:00', '2024-06-13 08:30:00'),
+    ('2024/06/13 08:30:00', '2024-06-13 08:30:00'),
+])
+def test_parse_timestamp(value, expected):
+    assert parse_timestamp(value) == expected
+
+
+@pytest.mark.parametrize('value', [None, True, '', 'yesterday', '13/13/2024', [2024], {'time': 1}, float('nan'),
+                                   10 ** 20])
+def test_parse_timestamp_rejects(value):
+    assert parse_timestamp(value) is None
+
+
+def test_log_timestamp_takes_the_first_readable_field():
+    assert log_timestamp({'timestamp': 'n/a', 'time': 1718267400, 'date': '2020-01-01'}) == '2024-06-13 08:30:00'
+    assert log_timestamp({'@timestamp': '2024-06-13T08:30:00Z'}) == '2024-06-13 08:30:00'
+    assert log_timestamp({'method': 'GET'}) is None
+    assert log_timestamp(['2024-06-13']) is None
+
+
+def test_normalize_window():
+    assert normalize_window(None) is None
+    assert normalize_window(ALL_TIME) is None
+    assert normalize_window({'start': '', 'end': None}) is None
+    assert normalize_window({'start': '2024-06-13', 'end': '2024-06-13T12:00:00+02:00'}) == {
+        'start': '2024-06-13 00:00:00', 'end': '2024-06-13 10:00:00'}
+    assert normalize_window({'start': None, 'end': 1718267400}) == {'start': None, 'end': '2024-06-13 08:30:00'}
+    # Normalizing twice gives the same window, stage params store the normalized form
+    window = normalize_window({'start': '13/Jun/2024:08:30:00'})
+    assert normalize_window(window) == window == {'start': '2024-06-13 08:30:00', 'end': None}
+
+
+@pytest.mark.parametrize('window, message', [
+    ({'start': 'soon'}, "Cannot read the window start"),
+    ({'end': 'later'}, "Cannot read the window end"),
+    ({'start': '2024-06-14', 'end': '2024-06-13'}, "before it starts"),
+    ({'start': '2024-06-13', 'end': '2024-06-13T00:00:00Z'}, "before it starts"),
+])
+def test_normalize_window_rejects(window, message):
+    with pytest.raises(ValueError, match=message):
+        normalize_window(window)
+
+
+def test_describe_window():
+    assert describe_window(None) == "all time"
+    assert describe_window({'start': '2024-06-13 00:00:00', 'end': None}) == "from 2024-06-13 00:00:00"
+    assert describe_window({'start': None, 'end': '2024-06-14 00:00:00'}) == "before 2024-06-14 00:00:00"
+    assert describe_window({'start': 'a', 'end': 'b'}) == "a to b"